@@ -0,0 +1,25 @@
+# A "locustfile" in which some clients hold many ephemerals and then
+# drop their sessions (modeling restarting service-discovery fleets),
+# while the others measure the impact of the resulting purges on
+# "normal" operations (from Get, in this case).
+
+from zk_locust import ZKLocust
+from locust_extra.stats import register_extra_stats
+from zk_metrics import register_zk_metrics
+from zk_metrics.ephemerals import register_ephemerals_purge_tracker
+
+from zk_locust.task_sets import ZKEphemeralPurgeTaskSet, ZKGetTaskSet
+
+register_extra_stats()
+register_zk_metrics()
+register_ephemerals_purge_tracker()
+
+
+class EphemeralPurge(ZKLocust):
+    weight = 1
+    task_set = ZKEphemeralPurgeTaskSet
+
+
+class Get(ZKLocust):
+    weight = 4
+    task_set = ZKGetTaskSet
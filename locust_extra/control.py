@@ -1,12 +1,17 @@
 import os
 import re
+import time
 import logging
 
 import gevent
+import gevent.event
 
 import locust.runners
 from locust import events
 
+from . import stats as extra_stats
+from .seeker import StatsSnapshot
+
 _logger = logging.getLogger(__name__)
 
 controller_available = events.EventHook()
@@ -44,12 +49,66 @@ def _subst_hatching():
     _logger.info("Monkey-patched 'start_hatching' replacement into %r", cls)
 
 
+_initial_hatch_complete = gevent.event.Event()
+
+# Pending (predicate, AsyncResult) pairs, resolved by hatch completions
+# (resp. stats ticks) satisfying the predicate.
+_hatch_waiters = []
+_tick_waiters = []
+
+_last_tick = None
+
+
+class StatsTick(object):
+    """A snapshot of the global statistics, taken each time extra stats
+    are collected (see `locust_extra.stats`)."""
+
+    def __init__(self, at, num_requests, num_failures, errors, user_count):
+        self.at = at
+        self.num_requests = num_requests
+        self.num_failures = num_failures
+        self.errors = errors
+        self.user_count = user_count
+
+    def count_errors(self, error=None):
+        """Returns the total number of errors, or the number of errors
+        whose description is `error`."""
+        count = 0
+        for op_errors in self.errors.values():
+            for e, n in op_errors.items():
+                if error is None or e == error:
+                    count += n
+        return count
+
+
+def _resolve_waiters(waiters, *args):
+    for entry in list(waiters):
+        predicate, result = entry
+        if result.ready():
+            waiters.remove(entry)
+            continue
+        value = predicate(*args)
+        if value is not None:
+            waiters.remove(entry)
+            result.set(value)
+
+
 def on_hatch_complete(user_count):
     global _generation
     _generation += 1
+    _initial_hatch_complete.set()
+    _resolve_waiters(_hatch_waiters, _generation, user_count)
+
+
+def on_stats_tick(stats, errors, user_count, **kwargs):
+    global _last_tick
+    _last_tick = StatsTick(time.time(), stats.num_requests,
+                           stats.num_failures, errors, user_count)
+    _resolve_waiters(_tick_waiters, _last_tick)
 
 
 events.hatch_complete += on_hatch_complete
+extra_stats.stats_tick += on_stats_tick
 
 
 def _wait_runner_kind():
@@ -72,9 +131,75 @@ class Controller(object):
         self.runner = runner
         self._runner_kind = kind
 
-    def wait_initial_hatch_complete(self, sleep_ms=250):
-        while not _generation:
-            gevent.sleep(sleep_ms / 1000)
+    def wait_initial_hatch_complete(self, sleep_ms=None):
+        # sleep_ms is ignored; kept for compatibility with the former
+        # polling implementation.
+        _initial_hatch_complete.wait()
+
+    def hatch_complete(self, *, user_count=None, after_generation=None):
+        """Returns an AsyncResult resolved with the generation number of
+        the next hatch completion (after `after_generation`, which
+        defaults to the current one) reaching `user_count`, or any
+        client count if None.
+
+        Locust 0.11.0 often sends multiple "hatch_complete"
+        notifications for a single hatching; matching on `user_count`
+        filters out stale ones."""
+        if after_generation is None:
+            after_generation = _generation
+
+        def predicate(generation, actual_user_count):
+            if generation <= after_generation:
+                return None
+            if user_count is not None and actual_user_count != user_count:
+                return None
+            return generation
+
+        result = gevent.event.AsyncResult()
+        _hatch_waiters.append((predicate, result))
+        return result
+
+    def stats_tick(self):
+        """Returns an AsyncResult resolved with the StatsTick of the next
+        stats collection.  Requires extra stats collection to be
+        enabled (LOCUST_EXTRA_STATS_COLLECT)."""
+        result = gevent.event.AsyncResult()
+        _tick_waiters.append((lambda tick: tick, result))
+        return result
+
+    def error_threshold(self, count, *, error=None):
+        """Returns an AsyncResult resolved with the StatsTick at which
+        the number of errors (optionally restricted to those described
+        by `error`) has grown by at least `count` from now.  Stats
+        resets are accounted for.  Requires extra stats collection to
+        be enabled (LOCUST_EXTRA_STATS_COLLECT)."""
+        base = _last_tick.count_errors(error) if _last_tick else 0
+
+        def predicate(tick):
+            nonlocal base
+            n = tick.count_errors(error)
+            if n < base:
+                base = 0
+            return tick if n - base >= count else None
+
+        result = gevent.event.AsyncResult()
+        _tick_waiters.append((predicate, result))
+        return result
+
+    def wait(self, *results, timeout_ms=None):
+        """Waits for the first of `results` to be resolved, or for
+        `timeout_ms` to expire.  Returns the resolved AsyncResult, or
+        None on timeout."""
+        timeout = timeout_ms / 1000 if timeout_ms is not None else None
+        ready = gevent.wait(results, timeout=timeout, count=1)
+        return ready[0] if ready else None
+
+    def discard(self, *results):
+        """Stops tracking unresolved `results`, e.g., after a timeout."""
+        for waiters in [_hatch_waiters, _tick_waiters]:
+            waiters[:] = [
+                entry for entry in waiters if entry[1] not in results
+            ]
 
     def sleep_ms(self, ms, cause=None):
         msg = 'Sleeping %dms' % ms
@@ -102,6 +227,8 @@ class Controller(object):
         return self.runner.hatch_rate
 
     def start_hatching(self, *, num_clients=None, hatch_rate=None):
+        """Changes the client count, and returns an AsyncResult resolved
+        with the generation number once hatching completes."""
         runner = self.runner
         runner.host = None
         if num_clients is None:
@@ -109,18 +236,208 @@ class Controller(object):
         if hatch_rate is None:
             hatch_rate = runner.hatch_rate
 
+        result = self.hatch_complete(user_count=num_clients)
+
         runner.start_hatching(num_clients, hatch_rate)
 
+        return result
+
+
+class ProgramError(Exception):
+    pass
+
+
+# Program instructions which open (resp. continue, close) blocks.
+_block_openers = ['loop', 'if']
+
+# Comparison operators usable in `if` conditions.
+_comparisons = {
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b
+}
+
+# Metrics usable in `if` conditions; see ProgrammedHandler.
+_condition_metrics = ['rps', 'p99', 'failures', 'failure_rate', 'clients']
+
+# Maximum lateness of the program timer before it gives up catching
+# up and resynchronizes.
+_max_timer_lag_s = 1.0
+
+
+def _expand_macro(instr):
+    op, args = instr[0], instr[1:]
+
+    if op == 'soak':
+        # soak <clients> <hold_ms> [ramp_ms]
+        clients, hold_ms = args[0], args[1]
+        ramp_ms = args[2] if len(args) > 2 else None
+        if ramp_ms and int(ramp_ms) > 0:
+            head = [['ramp_linear', clients, ramp_ms]]
+        else:
+            head = [['set_num_clients', clients]]
+        return head + [['sleep', hold_ms]]
+
+    if op == 'staircase':
+        # staircase <from> <to> <step> <hold_ms>
+        start, stop, step = int(args[0]), int(args[1]), int(args[2])
+        if step == 0 or (stop - start) * step < 0:
+            raise ProgramError('Bad staircase %r' % (instr, ))
+        expanded = []
+        n = start
+        while (n <= stop) if step > 0 else (n >= stop):
+            expanded += [['set_num_clients', str(n)], ['sleep', args[3]]]
+            n += step
+        return expanded
+
+    return [instr]
+
+
+def compile_program(program):
+    """Compiles a parsed program (a list of [op, *args] lists): expands
+    macros and resolves block structure into jump targets.
+
+    `loop`, `if`, `else`, `end` and `break` instructions are rewritten
+    so that their first argument is the index of the matching `end`
+    (resp. `else` or `end` for `if`, and `end` of the loop for `break`).
+    """
+    expanded = []
+    for instr in program:
+        expanded += _expand_macro(list(instr))
+
+    compiled = []
+    blocks = []  # [opener, pc, name, else_pc]
+
+    for pc in range(len(expanded)):
+        instr = expanded[pc]
+        op, args = instr[0], instr[1:]
+
+        if op == 'loop':
+            # loop [name] [count]
+            name, count = None, None
+            for arg in args:
+                if re.match(r'^\d+$', arg):
+                    count = arg
+                else:
+                    name = arg
+            blocks.append(['loop', pc, name, None])
+            compiled.append(['loop', None, name, count])
+        elif op == 'if':
+            # if <metric> <comparison> <value>
+            if (len(args) != 3 or args[0] not in _condition_metrics
+                    or args[1] not in _comparisons):
+                raise ProgramError('Bad condition %r' % (instr, ))
+            blocks.append(['if', pc, None, None])
+            compiled.append(['if', None] + args)
+        elif op == 'else':
+            if not blocks or blocks[-1][0] != 'if' or blocks[-1][3]:
+                raise ProgramError("Unexpected 'else' at %d" % pc)
+            blocks[-1][3] = pc
+            compiled[blocks[-1][1]][1] = pc
+            compiled.append(['else', None])
+        elif op == 'end':
+            if not blocks:
+                raise ProgramError("Unexpected 'end' at %d" % pc)
+            opener, start_pc, name, else_pc = blocks.pop()
+            if opener == 'loop':
+                compiled[start_pc][1] = pc
+                compiled.append(['end_loop', start_pc])
+            else:
+                if else_pc is None:
+                    compiled[start_pc][1] = pc
+                else:
+                    compiled[else_pc][1] = pc
+                compiled.append(['end_if'])
+        elif op == 'break':
+            # break [name]
+            name = args[0] if args else None
+            loops = [b for b in blocks if b[0] == 'loop']
+            if name:
+                loops = [b for b in loops if b[2] == name]
+            if not loops:
+                raise ProgramError("'break' outside of loop at %d" % pc)
+            # Resolved below, once the loop's end is known.
+            compiled.append(['break', loops[-1][1], name])
+        else:
+            compiled.append(instr)
+
+    if blocks:
+        raise ProgramError('Unterminated %r block' % blocks[-1][0])
+
+    for instr in compiled:
+        if instr[0] == 'break':
+            # Jump to the loop's `end`, which is past its loop frame.
+            instr[1] = compiled[instr[1]][1]
+
+    return compiled
+
 
 class ProgrammedHandler(object):
+    """Runs a control program: one instruction per line, made of an
+    operation and whitespace-separated arguments.  Lines starting
+    with `#` are comments.  Durations are in milliseconds; the
+    program loops from the top once its end is reached, unless it
+    executes `halt`.
+
+    Primitive operations:
+
+      * `sleep <ms>`;
+      * `wait_initial_hatch_complete`, `wait_hatch_complete
+        [timeout_ms]`, `wait_errors <count> <timeout_ms> [error]`;
+      * `set_min_num_clients <n>`, `set_max_num_clients <n>`: Bounds
+        for `change_num_clients`, `add_num_clients` and
+        `multiply_num_clients`;
+      * `change_num_clients <n> [hatch_rate]`, `add_num_clients
+        [[<>]addend]`, `multiply_num_clients [[<>]factor]`: Bounded
+        client count changes; `<>` flips the sign (resp. inverts the
+        factor) at the bounds;
+      * `set_num_clients <n> [hatch_rate]`: Unbounded client count
+        change;
+      * `ramp_linear <n> <duration_ms> [step_ms]`, `ramp_exp <n>
+        <duration_ms> [step_ms]`: Linear (resp. exponential) ramps
+        from the current client count, adjusted every `step_ms`
+        (default: 1000);
+      * `spike <n> <hold_ms> [ramp_ms]`: Ramps to `n` clients, holds,
+        and returns to the client count from before the spike;
+      * `mark`: Starts a new window for conditions;
+      * `halt`: Ends the program.
+
+    Structured operations:
+
+      * `loop [name] [count]` ... `end`: Repeats its body `count`
+        times, or forever;
+      * `break [name]`: Exits the innermost (or named) loop;
+      * `if <metric> <comparison> <value>` ... [`else` ...] `end`:
+        Conditional execution.  `metric` is one of `rps`, `p99` (ms),
+        `failures`, `failure_rate` (computed over the window since the
+        previous condition or `mark`) or `clients`; `comparison` is
+        one of `<`, `<=`, `>`, `>=`, `==` and `!=`.
+
+    Macros:
+
+      * `soak <n> <hold_ms> [ramp_ms]`: Ramps to `n` clients, and
+        holds;
+      * `staircase <from> <to> <step> <hold_ms>`: Holds each client
+        count from `from` to `to`, by `step`.
+
+    The program is compiled once; sleeps and ramp steps are scheduled
+    on an absolute monotonic timeline, so that timings do not drift
+    with instruction execution time."""
+
     def __init__(self, *, program):
         if isinstance(program, str):
-            self.program = self._parse(program)
-        else:
-            self.program = program
+            program = self._parse(program)
+
+        self.program = compile_program(program)
 
         self.pc = 0
+        self.next_pc = None
+        self.halted = False
         self.controller = None
+        self.hatch_result = None
 
     def run(self, controller):
         self.controller = controller
@@ -128,21 +445,42 @@ class ProgrammedHandler(object):
         self.max_num_clients = self.min_num_clients * 4
         self.factor = None
         self.addend = None
-        while True:
+        self.loop_counts = {}
+        self.stats_mark = self._take_snapshot()
+        self.clock = time.monotonic()
+        while not self.halted:
             instr = self.program[self.pc]
             _logger.debug("Executing instruction[%d]: %s" % (self.pc, instr))
             f = getattr(self, '_op_' + instr[0])
+            self.next_pc = self.pc + 1
             f(*instr[1:])
-            self.pc += 1
+            self.pc = self.next_pc
             if self.pc >= len(self.program):
                 self.pc = 0
+        _logger.info('Program halted')
+
+    def sleep_until(self, at, cause=None):
+        lag = time.monotonic() - at
+        if lag > _max_timer_lag_s:
+            _logger.warning('Program timer lagging by %gs; resynchronizing',
+                            lag)
+            self.resync()
+            return
+        self.clock = at
+        if lag < 0:
+            self.sleep_ms(-lag * 1000, cause=cause)
+
+    def resync(self):
+        self.clock = time.monotonic()
 
     def sleep_ms(self, ms, cause=None):
         self.controller.sleep_ms(ms, cause=cause)
 
-    def change_num_clients(self, num_clients, hatch_rate=None):
-        num_clients = min(self.max_num_clients,
-                          max(self.min_num_clients, num_clients))
+    def change_num_clients(self, num_clients, hatch_rate=None, *,
+                           bounded=True):
+        if bounded:
+            num_clients = min(self.max_num_clients,
+                              max(self.min_num_clients, num_clients))
         old_num_clients = self.controller.get_num_clients()
         delta = num_clients - old_num_clients
 
@@ -152,13 +490,33 @@ class ProgrammedHandler(object):
                           self.max_num_clients)
             return
 
-        hatch_rate = max(delta, 0)
+        if hatch_rate is None:
+            hatch_rate = max(delta, 0)
 
         _logger.debug('Changing client count: %d -> %d (%+d; hatch_rate=%d)',
                       old_num_clients, num_clients, delta, hatch_rate)
-        self.controller.start_hatching(
+        if self.hatch_result:
+            # Superseded; would otherwise linger among the waiters.
+            self.controller.discard(self.hatch_result)
+        self.hatch_result = self.controller.start_hatching(
             num_clients=num_clients, hatch_rate=hatch_rate)
 
+    def ramp(self, target, duration_ms, step_ms, interpolate):
+        start = self.controller.get_num_clients()
+        step_s = step_ms / 1000
+        num_steps = max(int(duration_ms // step_ms), 1)
+        t0 = self.clock
+        last = start
+        for k in range(1, num_steps + 1):
+            n = max(int(round(interpolate(start, target, k / num_steps))), 0)
+            if n != last:
+                # Aim at completing each change within its step.
+                hatch_rate = max(abs(n - last) / step_s, 1)
+                self.change_num_clients(n, hatch_rate, bounded=False)
+                last = n
+            self.sleep_until(t0 + k * duration_ms / num_steps / 1000,
+                             'ramping')
+
     def flip_at_bound(self):
         num_clients = self.controller.get_num_clients()
 
@@ -182,11 +540,57 @@ class ProgrammedHandler(object):
 
         return (v, flip)
 
-    def _op_poll_initial_hatch_complete(self, sleep_ms):
-        self.wait_initial_hatch_complete(int(sleep_ms))
+    def _take_snapshot(self):
+        return StatsSnapshot.from_stats(time.time(),
+                                        self.controller.runner.stats.total)
+
+    def metric(self, name):
+        if name == 'clients':
+            return self.controller.get_user_count()
+
+        snapshot = self._take_snapshot()
+        window = snapshot.window_since(
+            self.stats_mark, num_clients=self.controller.get_user_count())
+        self.stats_mark = snapshot
+
+        if name == 'rps':
+            return window.rps
+        elif name == 'p99':
+            return window.p99_ms or 0
+        elif name == 'failures':
+            return window.num_failures
+        elif name == 'failure_rate':
+            return window.error_rate
+
+    def _op_poll_initial_hatch_complete(self, sleep_ms=None):
+        self.controller.wait_initial_hatch_complete()
+        self.resync()
+
+    def _op_wait_initial_hatch_complete(self):
+        self.controller.wait_initial_hatch_complete()
+        self.resync()
 
     def _op_sleep(self, sleep_ms):
-        self.sleep_ms(int(sleep_ms))
+        self.sleep_until(self.clock + int(sleep_ms) / 1000)
+
+    def _op_wait_hatch_complete(self, timeout_ms=None):
+        # Waits for the last client count change to be effective.
+        result = self.hatch_result
+        if not result:
+            return
+        timeout_ms = int(timeout_ms) if timeout_ms else None
+        if not self.controller.wait(result, timeout_ms=timeout_ms):
+            _logger.warning('Timed out waiting for hatch completion')
+            self.controller.discard(result)
+        self.resync()
+
+    def _op_wait_errors(self, count, timeout_ms, error=None):
+        # Waits for `count` new errors (described as `error`, if
+        # present), or at most `timeout_ms`.
+        result = self.controller.error_threshold(int(count), error=error)
+        if not self.controller.wait(result, timeout_ms=int(timeout_ms)):
+            self.controller.discard(result)
+        self.resync()
 
     def _op_set_min_num_clients(self, s):
         self.min_num_clients = int(s)
@@ -198,6 +602,11 @@ class ProgrammedHandler(object):
         hatch_rate = int(hatch_rate_str) if hatch_rate_str else None
         self.change_num_clients(int(num_clients_str), hatch_rate)
 
+    def _op_set_num_clients(self, num_clients_str, hatch_rate_str=None):
+        hatch_rate = int(hatch_rate_str) if hatch_rate_str else None
+        self.change_num_clients(
+            int(num_clients_str), hatch_rate, bounded=False)
+
     def _op_add_num_clients(self, addend=None):
         addend, flip = self.maybe_flip_at_bound(addend, self.addend)
         if flip:
@@ -224,6 +633,64 @@ class ProgrammedHandler(object):
         f_num_clients = num_clients * factor
         self.change_num_clients(int(f_num_clients))
 
+    def _op_ramp_linear(self, target, duration_ms, step_ms='1000'):
+        self.ramp(
+            int(target), int(duration_ms), int(step_ms),
+            lambda a, b, f: a + (b - a) * f)
+
+    def _op_ramp_exp(self, target, duration_ms, step_ms='1000'):
+        self.ramp(
+            int(target), int(duration_ms), int(step_ms),
+            lambda a, b, f: max(a, 1) * (max(b, 1) / max(a, 1))**f)
+
+    def _op_spike(self, peak, hold_ms, ramp_ms='0'):
+        base = self.controller.get_num_clients()
+        for target in [int(peak), base]:
+            if int(ramp_ms) > 0:
+                self._op_ramp_linear(target, ramp_ms)
+            else:
+                self.change_num_clients(target, bounded=False)
+            if target != base:
+                self._op_sleep(hold_ms)
+
+    def _op_mark(self):
+        self.stats_mark = self._take_snapshot()
+
+    def _op_halt(self):
+        self.halted = True
+
+    def _op_loop(self, end_pc, name, count):
+        if count is not None:
+            if int(count) <= 0:
+                self.next_pc = end_pc + 1
+                return
+            self.loop_counts[self.pc] = int(count)
+
+    def _op_end_loop(self, start_pc):
+        count = self.loop_counts.get(start_pc)
+        if count is not None:
+            count -= 1
+            if count <= 0:
+                del self.loop_counts[start_pc]
+                return
+            self.loop_counts[start_pc] = count
+        self.next_pc = start_pc + 1
+
+    def _op_break(self, end_pc, name):
+        start_pc = self.program[end_pc][1]
+        self.loop_counts.pop(start_pc, None)
+        self.next_pc = end_pc + 1
+
+    def _op_if(self, else_or_end_pc, metric, comparison, value):
+        if not _comparisons[comparison](self.metric(metric), float(value)):
+            self.next_pc = else_or_end_pc + 1
+
+    def _op_else(self, end_pc):
+        self.next_pc = end_pc + 1
+
+    def _op_end_if(self):
+        pass
+
     def _parse(self, program_text):
         program = []
         for line in re.split(r'\s*\n\s*', program_text):
@@ -255,8 +722,9 @@ def _controller_poll_runner(fn):
 
     if kind in [RUNNER_LOCAL, RUNNER_MASTER]:
         _startup(locust.runners.locust_runner, kind, fn)
-    # else: Remove useless handler and abandon greenlet.
+    # else: Remove useless handlers and abandon greenlet.
     events.hatch_complete -= on_hatch_complete
+    extra_stats.stats_tick -= on_stats_tick
 
 
 def register_controller(fn=None):
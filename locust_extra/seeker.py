@@ -0,0 +1,381 @@
+import math
+import logging
+
+from abc import ABCMeta, abstractmethod
+
+_logger = logging.getLogger(__name__)
+
+SEEKER_MULTIPLICATIVE, SEEKER_SLO = ['multiplicative', 'slo']
+
+_PHASE_PROBE, _PHASE_BISECT, _PHASE_TUNE = ['probe', 'bisect', 'tune']
+
+# Two-sided 95% Student's t quantiles, indexed by degrees of freedom.
+_t95 = [
+    None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+    2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093,
+    2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045
+]
+
+
+def _t95_quantile(df):
+    return _t95[df] if df < len(_t95) else 1.96
+
+
+def response_time_percentile(response_times, num_requests, f):
+    """Computes a percentile from a Locust `response_times` map, in
+    the manner of `StatsEntry.get_response_time_percentile`."""
+    if num_requests <= 0:
+        return None
+
+    processed_count = 0
+    for rt in sorted(response_times, reverse=True):
+        processed_count += response_times[rt]
+        if num_requests - processed_count <= num_requests * f:
+            return rt
+
+    return 0
+
+
+class StatsSnapshot(object):
+    """A copy of the cumulative "Total" statistics at a given point
+    in time."""
+
+    def __init__(self, at, num_requests, num_failures, response_times):
+        self.at = at
+        self.num_requests = num_requests
+        self.num_failures = num_failures
+        self.response_times = response_times
+
+    @classmethod
+    def from_stats(cls, at, stats):
+        return cls(at, stats.num_requests, stats.num_failures,
+                   dict(stats.response_times))
+
+    def window_since(self, older, *, num_clients, **kwargs):
+        """Builds a Window out of the differences between this
+        snapshot and an older one.  Stats resets are detected; the
+        window then only covers data collected since the reset."""
+        if not older or self.num_requests < older.num_requests:
+            older = StatsSnapshot(self.at, 0, 0, {})
+
+        num_requests = self.num_requests - older.num_requests
+        num_failures = max(self.num_failures - older.num_failures, 0)
+
+        response_times = {}
+        for rt, count in self.response_times.items():
+            count -= older.response_times.get(rt, 0)
+            if count > 0:
+                response_times[rt] = count
+
+        p99_ms = response_time_percentile(response_times,
+                                          sum(response_times.values()), 0.99)
+
+        return Window(
+            num_clients=num_clients,
+            duration_s=self.at - older.at,
+            num_requests=num_requests,
+            num_failures=num_failures,
+            p99_ms=p99_ms,
+            **kwargs)
+
+
+class Window(object):
+    """Observations gathered while running a constant number of
+    clients."""
+
+    def __init__(self,
+                 *,
+                 num_clients,
+                 duration_s,
+                 num_requests,
+                 num_failures,
+                 p99_ms,
+                 session_errors=0,
+                 dead_clients=0,
+                 server_headroom=None,
+                 server_saturated_by=()):
+        self.num_clients = num_clients
+        self.duration_s = duration_s
+        self.num_requests = num_requests
+        self.num_failures = num_failures
+        self.p99_ms = p99_ms
+        self.session_errors = session_errors
+        self.dead_clients = dead_clients
+        # Relative distance to the closest server-side saturation
+        # limit, if known; see `zk_metrics.feedback`.
+        self.server_headroom = server_headroom
+        self.server_saturated_by = server_saturated_by
+
+    @property
+    def rps(self):
+        if self.duration_s <= 0:
+            return 0
+        return self.num_requests / self.duration_s
+
+    @property
+    def error_rate(self):
+        if self.num_requests <= 0:
+            return 0
+        return self.num_failures / self.num_requests
+
+    def __repr__(self):
+        return ('Window(num_clients=%r, duration_s=%.3f, rps=%.1f, '
+                'p99_ms=%r, error_rate=%.5f, session_errors=%r, '
+                'dead_clients=%r, server_headroom=%r)' %
+                (self.num_clients, self.duration_s, self.rps, self.p99_ms,
+                 self.error_rate, self.session_errors, self.dead_clients,
+                 self.server_headroom))
+
+    def is_server_saturated(self):
+        return self.server_headroom is not None and self.server_headroom < 0
+
+
+class AbstractSeeker(metaclass=ABCMeta):
+    def __init__(self, *, num_workers):
+        self.num_workers = max(num_workers, 1)
+
+    @abstractmethod
+    def next_num_clients(self, window):
+        """Returns the client count to use for the next window, or None
+        to keep the current one."""
+        pass
+
+    def summary(self):
+        """Returns a JSON-compatible dict describing the search, or
+        None."""
+        return None
+
+
+class MultiplicativeSeeker(AbstractSeeker):
+    """The original strategy: multiplicative increase until session
+    expirations, dead clients or server saturation are noticed,
+    followed by a back off and a slower increase."""
+
+    def __init__(self, *, num_workers, base_f=2):
+        super(MultiplicativeSeeker, self).__init__(num_workers=num_workers)
+
+        self.base_f = base_f
+        self.max_new_clients = self.num_workers * 64
+
+    def next_num_clients(self, window):
+        has_errors = (window.session_errors > 0
+                      or window.is_server_saturated())
+        has_dead_clients = window.dead_clients > 0
+
+        if has_errors or has_dead_clients:
+            # Reduce rate, so that we won't come back so fast
+            self.base_f = max(self.base_f * 3 / 4,
+                              1 + 1 / self.max_new_clients)
+
+        if has_dead_clients:
+            return None
+
+        if has_errors:
+            # And back off
+            f = max(1 / self.base_f, 3 / 4)
+        else:
+            f = self.base_f
+
+        act_clients = window.num_clients
+        num_clients = int(act_clients * f)
+        num_clients = min(num_clients, act_clients + self.max_new_clients)
+        # At least one new client per worker.
+        return max(num_clients, act_clients + self.num_workers)
+
+
+class SloSeeker(AbstractSeeker):
+    """Seeks the maximum client count meeting a p99 latency SLO and an
+    error rate budget, without saturating the servers.
+
+    The client count is first grown exponentially until the SLO is
+    violated, then bisected between the last compliant and first
+    violating counts.  Once the bracket is narrow enough, a PID loop
+    on the "headroom" (the relative distance to the closest limit)
+    keeps the load at the edge of the SLO.  Throughputs observed
+    while tuning within the SLO provide the maximum sustainable
+    throughput estimate."""
+
+    def __init__(self,
+                 *,
+                 num_workers,
+                 p99_ms,
+                 error_rate,
+                 kp=0.25,
+                 ki=0.05,
+                 kd=0.05,
+                 growth=2,
+                 bisect_tolerance=0.05,
+                 max_step=0.1):
+        super(SloSeeker, self).__init__(num_workers=num_workers)
+
+        self.p99_ms = p99_ms
+        self.error_rate = error_rate
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.growth = growth
+        self.bisect_tolerance = bisect_tolerance
+        self.max_step = max_step
+
+        self.phase = _PHASE_PROBE
+        self.lo = None
+        self.hi = None
+
+        self._integral = 0
+        self._last_headroom = None
+
+        self.windows = []
+
+    def headroom(self, window):
+        if window.p99_ms is None:
+            latency_headroom = 0
+        else:
+            latency_headroom = 1 - window.p99_ms / self.p99_ms
+
+        if self.error_rate > 0:
+            error_headroom = 1 - window.error_rate / self.error_rate
+        else:
+            error_headroom = 1 if window.num_failures == 0 else -1
+
+        headroom = min(latency_headroom, error_headroom)
+        if window.server_headroom is not None:
+            headroom = min(headroom, window.server_headroom)
+
+        return max(headroom, -1)
+
+    def complies(self, window):
+        return (window.num_requests > 0 and window.dead_clients == 0
+                and self.headroom(window) >= 0)
+
+    def _update_bracket(self, window):
+        n = window.num_clients
+
+        if self.complies(window):
+            self.lo = n if self.lo is None else max(self.lo, n)
+            if self.hi is not None and self.hi <= n:
+                # Noise (or a changed environment) invalidated the
+                # upper bound.
+                self.hi = None
+        else:
+            self.hi = n if self.hi is None else min(self.hi, n)
+            if self.lo is not None and self.lo >= n:
+                self.lo = None
+
+    def _tolerance(self):
+        return max(self.num_workers,
+                   int(math.ceil(self.hi * self.bisect_tolerance)))
+
+    def _probe(self, n):
+        return max(int(n * self.growth), n + self.num_workers)
+
+    def _pid(self, window):
+        e = self.headroom(window)
+
+        self._integral = max(min(self._integral + e, 1 / self.ki), -1 /
+                             self.ki) if self.ki else 0
+        derivative = 0
+        if self._last_headroom is not None:
+            derivative = e - self._last_headroom
+        self._last_headroom = e
+
+        u = self.kp * e + self.ki * self._integral + self.kd * derivative
+        u = max(min(u, self.max_step), -self.max_step)
+
+        n = window.num_clients
+        num_clients = int(round(n * (1 + u)))
+        if num_clients == n and e > 0:
+            num_clients += 1
+
+        return max(num_clients, self.num_workers)
+
+    def next_num_clients(self, window):
+        self.windows.append((self.phase, window, self.complies(window)))
+        self._update_bracket(window)
+
+        n = window.num_clients
+
+        if self.phase == _PHASE_PROBE:
+            if self.hi is None:
+                return self._probe(n)
+            self.phase = _PHASE_BISECT
+            _logger.info('Probing done; bracket: [%r, %r]', self.lo,
+                         self.hi)
+
+        if self.phase == _PHASE_BISECT:
+            if self.hi is None:
+                # Upper bound lost; resume probing.
+                self.phase = _PHASE_PROBE
+                return self._probe(n)
+
+            lo = self.lo
+            if lo is None:
+                lo = max(int(self.hi / self.growth), self.num_workers)
+                if lo >= self.hi:
+                    lo = None
+
+            if lo is not None and self.hi - lo > self._tolerance():
+                return (lo + self.hi) // 2
+
+            self.phase = _PHASE_TUNE
+            _logger.info('Bisection done; bracket: [%r, %r]', self.lo,
+                         self.hi)
+
+            if lo is not None and lo != n:
+                return lo
+
+        return self._pid(window)
+
+    def _near_lo_windows(self):
+        # Without tuning, only the compliant windows at (or within the
+        # bisection tolerance of) the highest compliant client count;
+        # low-load probing windows would drag the estimate down.
+        if self.lo is None:
+            return []
+        near = max(self.num_workers,
+                   int(math.ceil(self.lo * self.bisect_tolerance)))
+        return [
+            w for (phase, w, ok) in self.windows
+            if ok and w.num_clients >= self.lo - near
+        ]
+
+    def summary(self):
+        tuned = [
+            w for (phase, w, ok) in self.windows if phase == _PHASE_TUNE and ok
+        ]
+        compliant = tuned or self._near_lo_windows()
+
+        result = {
+            'seeker': SEEKER_SLO,
+            'phase': self.phase,
+            'slo_p99_ms': self.p99_ms,
+            'slo_error_rate': self.error_rate,
+            'bracket': [self.lo, self.hi],
+            'num_windows': len(self.windows),
+            'num_compliant_windows': len(compliant),
+            'max_sustainable_rps': None,
+            'max_sustainable_rps_ci95': None,
+            'num_clients': None
+        }
+
+        if not compliant:
+            return result
+
+        samples = [w.rps for w in compliant]
+        n = len(samples)
+        mean = sum(samples) / n
+
+        ci = None
+        if n > 1:
+            sd = math.sqrt(sum((x - mean)**2 for x in samples) / (n - 1))
+            half = _t95_quantile(n - 1) * sd / math.sqrt(n)
+            ci = [mean - half, mean + half]
+
+        clients = sorted(w.num_clients for w in compliant)
+
+        result.update({
+            'max_sustainable_rps': mean,
+            'max_sustainable_rps_ci95': ci,
+            'num_clients': clients[len(clients) // 2]
+        })
+
+        return result
@@ -0,0 +1,206 @@
+import math
+import logging
+
+from array import array
+
+_logger = logging.getLogger(__name__)
+
+
+class RingBuffer(object):
+    """A circular buffer of floats backed by `array.array`.
+
+    The buffer grows (by doubling) until it reaches `max_capacity`, if
+    any; appending to a full buffer then evicts its oldest item."""
+
+    def __init__(self, capacity=16, *, max_capacity=None):
+        if max_capacity is not None:
+            capacity = min(capacity, max_capacity)
+        self._data = array('d', [0.0]) * max(capacity, 1)
+        self._start = 0
+        self._len = 0
+        self.max_capacity = max_capacity
+
+    def __len__(self):
+        return self._len
+
+    def capacity(self):
+        return len(self._data)
+
+    def _index(self, i):
+        if i < 0:
+            i += self._len
+        if i < 0 or i >= self._len:
+            raise IndexError('RingBuffer index out of range')
+        return (self._start + i) % len(self._data)
+
+    def __getitem__(self, i):
+        return self._data[self._index(i)]
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self._data[(self._start + i) % len(self._data)]
+
+    def _grow(self):
+        n = len(self._data)
+        new_n = n * 2
+        if self.max_capacity is not None:
+            new_n = min(new_n, self.max_capacity)
+        data = array('d', self)
+        data.extend(array('d', [0.0]) * (new_n - n))
+        self._data = data
+        self._start = 0
+
+    def append(self, value):
+        """Appends `value`, and returns the evicted item, if any."""
+        n = len(self._data)
+        evicted = None
+        if self._len == n:
+            if self.max_capacity is None or n < self.max_capacity:
+                self._grow()
+                n = len(self._data)
+            else:
+                evicted = self.popleft()
+        self._data[(self._start + self._len) % n] = value
+        self._len += 1
+        return evicted
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError('pop from empty RingBuffer')
+        value = self._data[self._start]
+        self._start = (self._start + 1) % len(self._data)
+        self._len -= 1
+        return value
+
+
+class IrregularSeries(object):
+    """Cumulative sum of irregularly-timed samples, along with its
+    linear interpolation on a 1s grid.
+
+    Only the last `horizon_s` seconds are kept in memory.  Evicted raw
+    (time, cumulative value) pairs are appended to `spill_path`, as
+    CSV, if set.  `max_samples` optionally bounds the number of raw
+    samples kept in memory regardless of their timing."""
+
+    def __init__(self, *, horizon_s=3600, max_samples=None, spill_path=None):
+        self.horizon_s = horizon_s
+        self.spill_path = spill_path
+        self._spill_f = None
+
+        self._at = RingBuffer(max_capacity=max_samples)
+        self._values = RingBuffer(max_capacity=max_samples)
+        self._base = None
+        self._interp = RingBuffer(
+            max_capacity=int(math.ceil(horizon_s)) + 1)
+
+    def __len__(self):
+        return len(self._at)
+
+    def _spill(self, at, value):
+        if not self.spill_path:
+            return False
+        if not self._spill_f:
+            try:
+                self._spill_f = open(self.spill_path, 'a')
+            except OSError:
+                _logger.exception("Opening spill file '%s'",
+                                  self.spill_path)
+                self.spill_path = None
+                return False
+        self._spill_f.write('%r,%r\n' % (at, value))
+        return True
+
+    def _append_raw(self, at, value):
+        spilled = False
+        evicted_at = self._at.append(at)
+        evicted_value = self._values.append(value)
+        if evicted_at is not None:
+            spilled = self._spill(evicted_at, evicted_value)
+
+        # Keep one sample beyond the horizon, for interpolation.
+        cutoff = at - self.horizon_s
+        while len(self._at) > 2 and self._at[1] <= cutoff:
+            spilled |= self._spill(self._at.popleft(),
+                                   self._values.popleft())
+
+        if spilled:
+            # Runs are usually ended by killing them.
+            self._spill_f.flush()
+
+    def _append_interp(self, value):
+        if self._interp.append(value) is not None:
+            self._base += 1
+
+    def record(self, at, sample):
+        z = len(self._at)
+        if z == 0:
+            # Initial sample
+            self._append_raw(at, sample)
+            self._base = int(math.ceil(at))
+            return
+
+        prev_at = self._at[-1]
+        prev_value = self._values[-1]
+
+        # Cumsum
+        value = prev_value + sample
+        self._append_raw(at, value)
+
+        # Interp
+        r_base = self._base + len(self._interp)
+        t0 = max(int(math.ceil(prev_at)), r_base)
+        t1 = int(math.floor(at))
+        if t1 == int(math.ceil(at)):
+            t1 -= 1
+        dt = at - prev_at
+        for t in range(t0, t1 + 1):
+            f = (t - prev_at) / dt
+            self._append_interp(prev_value * (1 - f) + value * f)
+
+    def get_interp(self):
+        """Returns the timestamp of the first retained grid point, and
+        the interpolated values."""
+        return (self._base, list(self._interp))
+
+    def value_at(self, at):
+        """Returns the interpolated cumulative value at `at`, or None
+        if out of the retained range."""
+        n = len(self._at)
+        if not n or at < self._at[0] or at > self._at[-1]:
+            return None
+
+        # Binary search for the first sample at or after `at`.
+        lo, hi = 0, n - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._at[mid] < at:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        at1, value1 = self._at[lo], self._values[lo]
+        if at1 == at or lo == 0:
+            return value1
+
+        at0, value0 = self._at[lo - 1], self._values[lo - 1]
+        f = (at - at0) / (at1 - at0)
+        return value0 * (1 - f) + value1 * f
+
+    def rate(self, window_s):
+        """Returns the average rate of increase per second over the last
+        `window_s` seconds (or over the retained range, if shorter), or
+        None if not enough samples have been recorded."""
+        if len(self._at) < 2:
+            return None
+
+        end = self._at[-1]
+        start = max(end - window_s, self._at[0])
+        if end <= start:
+            return None
+
+        return (self._values[-1] - self.value_at(start)) / (end - start)
+
+    def close(self):
+        if self._spill_f:
+            self._spill_f.close()
+            self._spill_f = None
@@ -14,6 +14,11 @@ from .output import format_timestamp, ensure_output
 
 _logger = logging.getLogger(__name__)
 
+# Fired with `stats` (the global "Total" StatsEntry), `errors` (a
+# {(name, method): {error: count}} map) and `user_count` each time
+# extra stats are collected.
+stats_tick = locust.events.EventHook()
+
 _stats_csv_path = os.getenv('LOCUST_EXTRA_STATS_CSV')
 _distrib_path = os.getenv('LOCUST_EXTRA_STATS_DISTRIB')
 _delay_ms = int(os.getenv('LOCUST_EXTRA_STATS_COLLECT', '0'))
@@ -215,6 +220,8 @@ def collect_extra_stats(stats_csv_path, distrib_path, fn, client_id,
         if distrib_output:
             write_jsonl_entry(timestamp, s, e, user_count, distrib_output)
 
+    stats_tick.fire(stats=stats_total, errors=errors, user_count=user_count)
+
     return num_requests
 
 
@@ -31,27 +31,66 @@
 # decrease as the error rate spikes.  The script then tries and
 # continually adjusts the ramp-up/ramp-down rate.
 #
-# Note that this is still a relatively early version of the benchmark;
-# the analysis ought to be quite a bit smarter, and more metrics
-# should be considered (reasonable latencies, outstanding requests,
-# etc.).
+# The client count is chosen by a pluggable strategy ("seeker"),
+# selected via `ZK_LOCUST_BENCH_SEEKER` (`--bench-seeker`):
+#
+#   * `multiplicative` (the default): the original strategy, which only
+#     reacts to session expirations and dead clients;
+#
+#   * `slo`: targets a p99 latency SLO and an error rate budget,
+#     bisecting the client count before fine-tuning it with a PID
+#     controller.  The resulting estimate of the maximum sustainable
+#     throughput (with a 95% confidence interval) is logged, and
+#     written as JSON to `ZK_LOCUST_BENCH_SEEKER_REPORT` if set
+#     (`parameterized-locust.sh --report-dir` defaults it to
+#     `seeker.json` in the report directory).  The relevant parameters
+#     are:
+#
+#       * `ZK_LOCUST_BENCH_SLO_P99_MS` (default: `100`);
+#       * `ZK_LOCUST_BENCH_SLO_ERROR_RATE`: The tolerated ratio of
+#         failed requests (default: `0.001`);
+#       * `ZK_LOCUST_BENCH_PID_KP`, `..._KI`, `..._KD`: The PID gains
+#         (defaults: `0.25`, `0.05`, `0.05`).
+#
+# Both strategies also back off when ZooKeeper server metrics
+# (collected via `--zk-metrics-collect`) show signs of saturation,
+# before sessions start expiring.  A signal is ignored if its limit is
+# `0`:
+#
+#   * `ZK_LOCUST_BENCH_MAX_OUTSTANDING_REQUESTS`: Maximum number of
+#     queued requests on any member (default: `1000`, ZooKeeper's
+#     default `globalOutstandingLimit`);
+#   * `ZK_LOCUST_BENCH_MAX_SERVER_LATENCY_MS`: Maximum average
+#     server-side latency (default: `0`);
+#   * `ZK_LOCUST_BENCH_MAX_PROPOSAL_P99_MS`,
+#     `ZK_LOCUST_BENCH_MAX_COMMIT_P99_MS`: Maximum p99 proposal
+#     (resp. commit) latency, for ZooKeeper 3.6+ (defaults: `0`);
+#   * `ZK_LOCUST_BENCH_MAX_CONNECTION_DROP`: Maximum relative drop in
+#     the total number of connections (default: `0`).
+#
+# Per-worker request counts are kept in memory for the last
+# `ZK_LOCUST_BENCH_SERIES_HORIZON_S` seconds (default: `3600`).  Older
+# samples are appended to per-series CSV files in
+# `ZK_LOCUST_BENCH_SERIES_SPILL_DIR`, if set, and dropped otherwise.
 
-import math
-import collections
 import os
+import re
 import time
+import json
 import logging
 
 import gevent.thread
 import gevent.queue
-import gevent.event
 
 from locust import events
-
 from zk_locust import ZKLocust
 from locust_extra.stats import register_extra_stats
 from locust_extra.control import register_controller
+from locust_extra.series import IrregularSeries
+from locust_extra.seeker import StatsSnapshot, Window, \
+    MultiplicativeSeeker, SloSeeker, SEEKER_MULTIPLICATIVE, SEEKER_SLO
 from zk_metrics import register_zk_metrics
+from zk_metrics.feedback import SaturationTracker
 
 from zk_locust.task_sets import ZKGetTaskSet, ZKSetTaskSet, ZKConnectTaskSet
 from zk_dispatch import register_dispatcher
@@ -65,6 +104,29 @@ _adjust_ms = int(os.getenv('ZK_LOCUST_BENCH_WAIT_ADJUST_MS', '3000'))
 _hatch_rate = float(os.getenv('ZK_LOCUST_BENCH_HATCH_RATE', '0'))
 _hatch_duration_s = float(os.getenv('ZK_LOCUST_BENCH_HATCH_DURATION_S', '0'))
 
+_seeker = os.getenv('ZK_LOCUST_BENCH_SEEKER', SEEKER_MULTIPLICATIVE)
+_seeker_report = os.getenv('ZK_LOCUST_BENCH_SEEKER_REPORT')
+
+_slo_p99_ms = float(os.getenv('ZK_LOCUST_BENCH_SLO_P99_MS', '100'))
+_slo_error_rate = float(os.getenv('ZK_LOCUST_BENCH_SLO_ERROR_RATE', '0.001'))
+
+_pid_kp = float(os.getenv('ZK_LOCUST_BENCH_PID_KP', '0.25'))
+_pid_ki = float(os.getenv('ZK_LOCUST_BENCH_PID_KI', '0.05'))
+_pid_kd = float(os.getenv('ZK_LOCUST_BENCH_PID_KD', '0.05'))
+
+_max_outstanding_requests = int(
+    os.getenv('ZK_LOCUST_BENCH_MAX_OUTSTANDING_REQUESTS', '1000'))
+_max_server_latency_ms = float(
+    os.getenv('ZK_LOCUST_BENCH_MAX_SERVER_LATENCY_MS', '0'))
+_max_proposal_p99_ms = float(
+    os.getenv('ZK_LOCUST_BENCH_MAX_PROPOSAL_P99_MS', '0'))
+_max_commit_p99_ms = float(os.getenv('ZK_LOCUST_BENCH_MAX_COMMIT_P99_MS', '0'))
+_max_connection_drop = float(
+    os.getenv('ZK_LOCUST_BENCH_MAX_CONNECTION_DROP', '0'))
+
+_series_horizon_s = float(os.getenv('ZK_LOCUST_BENCH_SERIES_HORIZON_S', '3600'))
+_series_spill_dir = os.getenv('ZK_LOCUST_BENCH_SERIES_SPILL_DIR')
+
 _op_set = int(os.getenv('ZK_LOCUST_BENCH_OP_SET', '1')) != 0
 _op_get = int(os.getenv('ZK_LOCUST_BENCH_OP_GET', '1')) != 0
 _op_connect = int(os.getenv('ZK_LOCUST_BENCH_OP_CONNECT', '1')) != 0
@@ -84,52 +146,50 @@ _logger.setLevel(_logging_level)
 
 _ensemble_queue = gevent.queue.Queue(maxsize=1)
 _clients_queue = gevent.queue.Queue(maxsize=1)
-_hatch_complete_event = gevent.event.Event()
+
+_session_expired = 'SessionExpiredError()'
 
 _errors_pair = None
 _errors_lock = gevent.thread.LockType()
 
+_total_snapshot = None
+_total_lock = gevent.thread.LockType()
 
-class IrregularSeries(object):
-    def __init__(self):
-        self._raw = []
-        self._base = None
-        self._interp = []
+_saturation = SaturationTracker(
+    max_outstanding_requests=_max_outstanding_requests,
+    max_latency_ms=_max_server_latency_ms,
+    max_proposal_p99_ms=_max_proposal_p99_ms,
+    max_commit_p99_ms=_max_commit_p99_ms,
+    max_connection_drop=_max_connection_drop)
 
-    def record(self, at, sample):
-        z = len(self._raw)
-        if z == 0:
-            # Initial sample
-            self._raw.append((at, sample))
-            self._base = int(math.ceil(at))
-        else:
-            prev_at, prev_value = self._raw[z - 1]
-
-            # Cumsum
-            value = prev_value + sample
-            self._raw.append((at, value))
-
-            # Interp
-            r_at = at - self._base
-            r_prev_at = prev_at - self._base
-            t0 = int(math.ceil(r_prev_at))
-            t1 = int(math.floor(r_at))
-            if t1 == int(math.ceil(r_at)):
-                t1 -= 1
-            dt = r_at - r_prev_at
-            for t in range(t0, t1 + 1):
-                f = (t - r_prev_at) / dt
-                iv = prev_value * (1 - f) + value * f
-                self._interp.append(iv)
-
-    def get_interp(self):
-        return (self._base, self._interp)
-
-
-_stats_info = collections.defaultdict(IrregularSeries)
+
+_stats_info = {}
 _stats_lock = gevent.thread.LockType()
 
 
+def _get_series_locked(key):
+    series = _stats_info.get(key)
+    if series is None:
+        spill_path = None
+        if _series_spill_dir:
+            name = '-'.join(str(part) for part in key)
+            name = re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+            spill_path = os.path.join(_series_spill_dir, name + '.csv')
+        series = IrregularSeries(
+            horizon_s=_series_horizon_s, spill_path=spill_path)
+        _stats_info[key] = series
+    return series
+
+
+def _close_series(**kwargs):
+    with _stats_lock:
+        for series in _stats_info.values():
+            series.close()
+
+
+events.quitting += _close_series
+
+
 def _zk_ensemble_manager(controller, members, **kwargs):
     controller.wait_initial_hatch_complete()
 
@@ -152,7 +212,7 @@ def _count_errors(errors_map):
         return 0
 
     # We only care about session expiration for now.
-    return errors_map.get("SessionExpiredError()", 0)
+    return errors_map.get(_session_expired, 0)
 
 
 def _compute_error_rate(last_tuple):
@@ -183,24 +243,53 @@ def _compute_error_rate(last_tuple):
     return (derr, dt, next_tuple)
 
 
-def _locust_clients_manager(controller):
-    controller.wait_initial_hatch_complete()
+def _create_seeker(num_workers):
+    if _seeker == SEEKER_MULTIPLICATIVE:
+        return MultiplicativeSeeker(num_workers=num_workers)
+    elif _seeker == SEEKER_SLO:
+        return SloSeeker(
+            num_workers=num_workers,
+            p99_ms=_slo_p99_ms,
+            error_rate=_slo_error_rate,
+            kp=_pid_kp,
+            ki=_pid_ki,
+            kd=_pid_kd)
+    else:
+        raise ValueError("Unknown seeker '%s'" % _seeker)
+
+
+def _get_total_snapshot():
+    with _total_lock:
+        return _total_snapshot
+
+
+def _report_seeker(seeker):
+    summary = seeker.summary()
+    if not summary:
+        return
+
+    _logger.info('Seeker summary: %s', json.dumps(summary))
 
-    def on_hatch_complete(user_count):
-        _logger.debug('Hatch complete; user_count=%r', user_count)
-        _hatch_complete_event.set()
+    if _seeker_report:
+        tmp_path = _seeker_report + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+            f.write('\n')
+        os.replace(tmp_path, _seeker_report)
 
-    events.hatch_complete += on_hatch_complete
+
+def _locust_clients_manager(controller):
+    controller.wait_initial_hatch_complete()
 
     last_error_mark = None
 
     num_workers = controller.get_num_workers()
     exp_clients = controller.get_user_count()
 
-    base_f = 2
-    f = base_f
+    seeker = _create_seeker(num_workers)
 
-    max_new_clients = num_workers * 64
+    window_start = _get_total_snapshot()
+    _saturation.take_window()
 
     while True:
         controller.sleep_ms(_disable_ms)
@@ -211,66 +300,96 @@ def _locust_clients_manager(controller):
             # Wait for "continue" signal
             _ensemble_queue.get()
 
-        controller.sleep_ms(_adjust_ms)
+        # Session expirations end the window early, so that we can
+        # react immediately.
+        expired = controller.error_threshold(1, error=_session_expired)
+        if controller.wait(expired, timeout_ms=_adjust_ms):
+            _logger.info('Session expiration; ending window early')
+        else:
+            controller.discard(expired)
 
         act_clients = controller.get_user_count()
         _logger.debug('Current client count: %d', act_clients)
 
         derr, dt, last_error_mark = _compute_error_rate(last_error_mark)
 
-        has_errors = derr > 0
-        if has_errors:
+        if derr > 0:
             _logger.info('Noticed %r new errors in %gs', derr, dt)
 
-        has_dead_clients = act_clients < exp_clients
-        if has_dead_clients:
+        dead_clients = max(exp_clients - act_clients, 0)
+        if dead_clients:
             _logger.info('Noticed %r dead clients; exp_clients=%r',
-                         exp_clients - act_clients, exp_clients)
-
-        if has_errors or has_dead_clients:
-            # Reduce rate, so that we won't come back so fast
-            base_f = max(base_f * 3 / 4, 1 + 1 / max_new_clients)
-
-        if has_errors:
-            # And back off
-            f = max(1 / base_f, 3 / 4)
+                         dead_clients, exp_clients)
+
+        server = _saturation.take_window()
+        saturated_by = server.saturated_by()
+        if saturated_by:
+            _logger.info('Noticed server saturation: %s; %r',
+                         ', '.join(saturated_by), server.signals)
+
+        server_kwargs = {
+            'server_headroom': server.headroom(),
+            'server_saturated_by': saturated_by
+        }
+
+        window_end = _get_total_snapshot()
+        if window_end:
+            window = window_end.window_since(
+                window_start,
+                num_clients=act_clients,
+                session_errors=derr,
+                dead_clients=dead_clients,
+                **server_kwargs)
         else:
-            f = base_f
+            # No extra stats (see LOCUST_EXTRA_STATS_COLLECT).
+            window = Window(
+                num_clients=act_clients,
+                duration_s=0,
+                num_requests=0,
+                num_failures=0,
+                p99_ms=None,
+                session_errors=derr,
+                dead_clients=dead_clients,
+                **server_kwargs)
+        _logger.debug('Observed %r', window)
 
         exp_clients = act_clients
 
-        if not has_dead_clients:
-            num_clients = int(act_clients * f)
-            num_clients = min(num_clients, act_clients + max_new_clients)
-            # At least one new client per worker.
-            num_clients = max(num_clients, act_clients + num_workers)
+        num_clients = seeker.next_num_clients(window)
+        _report_seeker(seeker)
 
+        if num_clients is not None and num_clients != act_clients:
             if _hatch_rate > 0:
                 hatch_rate = _hatch_rate
             elif _hatch_duration_s > 0:
-                hatch_rate = (num_clients - act_clients) / _hatch_duration_s
+                hatch_rate = abs(num_clients - act_clients) / _hatch_duration_s
             else:
                 hatch_rate = max(num_clients, 128)
 
             _logger.info(
-                'Adjusting client count (%+d); derr=%r, dt=%gs, f=%r, '
+                'Adjusting client count (%+d); derr=%r, dt=%gs, '
                 'act_clients=%r, num_clients=%r, hatch_rate=%r',
-                num_clients - act_clients, derr, dt, f, act_clients,
+                num_clients - act_clients, derr, dt, act_clients,
                 num_clients, hatch_rate)
 
-            _hatch_complete_event.clear()
-
-            controller.start_hatching(
+            hatched = controller.start_hatching(
                 num_clients=num_clients, hatch_rate=hatch_rate)
 
-            # Wait for new "generation."  KLUDGE: Mostly.  Locust
-            # 0.11.0 is broken and often sends multiple
-            # "hatch_complete" notifications.  The next step is a
-            # "big" sleep, so let's hope that will compensate.
-            _hatch_complete_event.wait()
+            # Wait for the new "generation," allowing for twice the
+            # expected hatching time.
+            timeout_ms = abs(num_clients - act_clients) / hatch_rate * 2000
+            if controller.wait(hatched, timeout_ms=timeout_ms + 10000):
+                _logger.debug('Hatch complete; generation=%r', hatched.get())
+            else:
+                _logger.warning('Timed out waiting for hatch completion')
+                controller.discard(hatched)
 
             exp_clients = num_clients
 
+        # Ramps are not part of the next observation window.
+        window_start = _get_total_snapshot()
+        _saturation.take_window()
+
 
 register_controller(fn=_locust_clients_manager)
 
@@ -282,8 +401,12 @@ def _locust_stats_handler(*, worker_id, stats, errors, **kwargs):
         # Handle stats on a per-worker basis.
         with _stats_lock:
             key = (worker_id, stats.name, stats.method)
-            series = _stats_info[key]
+            series = _get_series_locked(key)
             series.record(at, stats.num_requests)
+    elif stats.name == 'Total' and stats.method is None:
+        with _total_lock:
+            global _total_snapshot
+            _total_snapshot = StatsSnapshot.from_stats(at, stats)
     elif errors:
         # Handle errors globally.
         with _errors_lock:
@@ -293,6 +416,7 @@ def _locust_stats_handler(*, worker_id, stats, errors, **kwargs):
 
 register_extra_stats(fn=_locust_stats_handler)
 register_zk_metrics()
+_saturation.register()
 
 
 class LocustBase(ZKLocust):
@@ -0,0 +1,14 @@
+from zk_locust import ZKLocust
+from locust_extra.stats import register_extra_stats
+from zk_metrics import register_zk_metrics
+from zk_metrics.watches import register_watch_count_tracker
+
+from zk_locust.task_sets import ZKRecursiveWatchTaskSet
+
+register_extra_stats()
+register_zk_metrics()
+register_watch_count_tracker()
+
+
+class RecursiveWatch(ZKLocust):
+    task_set = ZKRecursiveWatchTaskSet
@@ -0,0 +1,12 @@
+from zk_locust import ZKLocust
+from locust_extra.stats import register_extra_stats
+from zk_metrics import register_zk_metrics
+
+from zk_locust.task_sets import ZKTraceReplayTaskSet
+
+register_extra_stats()
+register_zk_metrics()
+
+
+class Replay(ZKLocust):
+    task_set = ZKTraceReplayTaskSet
@@ -0,0 +1,17 @@
+from zk_locust import ZKLocust
+from locust_extra.stats import register_extra_stats
+from zk_metrics import register_zk_metrics
+
+from zk_locust.task_sets import ZKSessionStormTaskSet
+
+register_extra_stats()
+register_zk_metrics()
+
+
+class SessionStorm(ZKLocust):
+    task_set = ZKSessionStormTaskSet
+
+    def __init__(self):
+        # Sessions are opened by the storm; the user's own client is
+        # only used as a template.
+        super(SessionStorm, self).__init__(pseudo_root=None, autostart=False)
@@ -17,6 +17,27 @@
 # The '<>' prefix signifies that the factor "bounces" between 1.75 and
 # 1/1.75 when min_num_clients resp. max_num_clients are reached.
 #
+# Standard load shapes can be expressed using ramps, macros and
+# structured instructions (see `ProgrammedHandler` in
+# `locust_extra/control.py` for the full list).  E.g., a staircase
+# followed by repeated spikes, stopping early if p99 latency exceeds
+# 200ms:
+#
+#     CONTROL_PROGRAM='
+#         wait_initial_hatch_complete
+#         staircase 16 128 16 10000
+#         loop spikes 5
+#             soak 64 20000 5000
+#             mark
+#             spike 256 5000 1000
+#             if p99 > 200
+#                 break spikes
+#             end
+#         end
+#         ramp_linear 16 10000
+#         halt
+#     '
+#
 # Example invocation:
 #
 #     ./parameterized-locust.sh \
@@ -22,6 +22,21 @@
 #     ZK_DISPATCH_DISABLE_SCRIPT environment variables for
 #     configuration.
 #
+#  3. With ZK_DISPATCH_CONTROLLER=netem and ZK_DISPATCH_PROXIES set,
+#     degraded-network scenarios can be expressed as well; e.g., a
+#     "slow follower" followed by a "lossy leader":
+#
+#     MANIPULATION_PROGRAM='
+#         poll_initial_hatch_complete 500
+#         sleep 10000
+#         degrade_follower latency_ms=100 jitter_ms=20
+#         sleep 10000
+#         heal_all
+#         degrade_leader loss=0.05 rto_ms=200
+#         sleep 10000
+#         heal_all
+#     '
+#
 # Example invocation:
 #
 #     ./parameterized-locust.sh \
@@ -0,0 +1,14 @@
+from zk_locust import ZKLocust
+from locust_extra.stats import register_extra_stats
+from zk_metrics import register_zk_metrics
+
+from zk_locust.fanout import register_watch_fanout
+from zk_locust.task_sets import ZKWatchFanOutTaskSet
+
+register_extra_stats()
+register_zk_metrics()
+register_watch_fanout()
+
+
+class WatchFanOut(ZKLocust):
+    task_set = ZKWatchFanOutTaskSet
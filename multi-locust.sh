@@ -39,6 +39,8 @@ if [ "$COUNT" -gt '0' ]; then
     master_args+=('--master' "--expect-slaves=$COUNT")
 
     for i in $(seq "$COUNT"); do
+        ZK_LOCUST_WORKER_INDEX="$((i - 1))"                     \
+        ZK_LOCUST_WORKER_COUNT="$COUNT"                         \
         nohup locust "${slave_args[@]}" "${common_args[@]}"     \
               >"$WORKDIR/locust-$i.out"                         \
               2>"$WORKDIR/locust-$i.err" &
@@ -18,6 +18,33 @@ unset ZK_LOCUST_MAX_WAIT
 
 unset ZK_LOCUST_KEY_SIZE
 unset ZK_LOCUST_VAL_SIZE
+unset ZK_LOCUST_VAL_SIZE_DISTRIBUTION
+unset ZK_LOCUST_PAYLOAD_POOL_COUNT
+unset ZK_LOCUST_PAYLOAD_POOL_MAX_BYTES
+unset ZK_LOCUST_KEY_SPACE_SIZE
+unset ZK_LOCUST_KEY_DISTRIBUTION
+unset ZK_LOCUST_KEY_MANIFEST
+unset ZK_LOCUST_MIX
+unset ZK_LOCUST_MULTI_OPS
+unset ZK_LOCUST_MULTI_PIPELINE
+unset ZK_LOCUST_WATCH_CLOCK
+unset ZK_LOCUST_WATCH_VERIFY
+unset ZK_LOCUST_WATCH_FANOUT_INTERVAL_MS
+unset ZK_LOCUST_WATCH_FANOUT_SETTLE_MS
+unset ZK_LOCUST_SESSION_STORM_RATE
+unset ZK_LOCUST_SESSION_STORM_SESSIONS
+unset ZK_LOCUST_SESSION_STORM_TIMEOUT_MS
+unset ZK_LOCUST_SESSION_STORM_HOLD_MS
+unset ZK_LOCUST_EPHEMERAL_PURGE_COUNT
+unset ZK_LOCUST_EPHEMERAL_PURGE_HOLD_MS
+unset ZK_LOCUST_EPHEMERAL_PURGE_MODE
+unset ZK_LOCUST_EPHEMERAL_PURGE_TIMEOUT_MS
+unset ZK_LOCUST_EPHEMERAL_PURGE_PIPELINE
+unset ZK_LOCUST_PERSISTENT_WATCH_DEPTH
+unset ZK_LOCUST_PERSISTENT_WATCH_FANOUT
+unset ZK_LOCUST_REPLAY_TRACE
+unset ZK_LOCUST_REPLAY_SPEED
+unset ZK_LOCUST_REPLAY_LOOKAHEAD_MS
 
 unset ZK_LOCUST_EXCEPTION_BEHAVIOR
 
@@ -27,9 +54,17 @@ unset KAZOO_LOCUST_SASL_OPTIONS
 
 unset ZK_LOCUST_ZK_METRICS_COLLECT
 unset ZK_LOCUST_ZK_METRICS_CSV
+unset ZK_LOCUST_ZK_METRICS_WATCH_SUMMARY
 
 unset ZK_DISPATCH_CONFIG
 unset ZK_DISPATCH_PROGRAM
+unset ZK_DISPATCH_TRACE
+unset ZK_DISPATCH_REPLAY
+unset ZK_DISPATCH_SEED
+unset ZK_DISPATCH_PERTURBATIONS
+unset ZK_DISPATCH_CONTROLLER
+unset ZK_DISPATCH_PIDS
+unset ZK_DISPATCH_PROXIES
 
 unset LOCUST_EXTRA_STATS_CSV
 unset LOCUST_EXTRA_STATS_DISTRIB
@@ -61,10 +96,24 @@ multi_workdir=
 extra_locust_args=()
 extra_report_args=()
 force=
+local_ensemble=
+local_ensemble_mode=auto
+local_ensemble_dir=
+cleanup_cmds=()
+
+do_cleanup() {
+    # Best effort; failing commands must not abort the cleanup.
+    set +e
+    for cmd in "${cleanup_cmds[@]}"; do
+        eval "$cmd"
+    done
+}
+
+trap 'do_cleanup' EXIT
 
 while [ -z "$dashdash" -a "$#" -gt '0' ]; do
     case "$1" in
-        --hosts|--client|--pseudo-root|--min-wait|--max-wait|--key-size|--val-size|--exception-behavior)
+        --hosts|--client|--pseudo-root|--min-wait|--max-wait|--key-size|--val-size|--val-size-distribution|--key-space-size|--key-distribution|--key-manifest|--mix|--multi-ops|--multi-pipeline|--watch-clock|--watch-verify|--watch-fanout-interval-ms|--watch-fanout-settle-ms|--session-storm-rate|--session-storm-sessions|--session-storm-timeout-ms|--session-storm-hold-ms|--ephemeral-purge-count|--ephemeral-purge-hold-ms|--ephemeral-purge-mode|--ephemeral-purge-timeout-ms|--ephemeral-purge-pipeline|--persistent-watch-depth|--persistent-watch-fanout|--replay-trace|--replay-speed|--replay-lookahead-ms|--exception-behavior)
             set_var 'ZK_LOCUST_' "${1:2}" "$2"
             shift 2
             ;;
@@ -80,7 +129,7 @@ while [ -z "$dashdash" -a "$#" -gt '0' ]; do
             set_var 'KAZOO_LOCUST_' "${1:8}" "$2"
             shift 2
             ;;
-        --zk-metrics-collect|--zk-metrics-csv)
+        --zk-metrics-collect|--zk-metrics-csv|--zk-metrics-watch-summary)
             set_var 'ZK_LOCUST_' "${1:2}" "$2"
             shift 2
             ;;
@@ -88,7 +137,7 @@ while [ -z "$dashdash" -a "$#" -gt '0' ]; do
             set_var 'LOCUST_EXTRA_' "${1:2}" "$2"
             shift 2
             ;;
-        --zk-dispatch-config|--zk-dispatch-program)
+        --zk-dispatch-config|--zk-dispatch-program|--zk-dispatch-trace|--zk-dispatch-replay|--zk-dispatch-seed|--zk-dispatch-perturbations|--zk-dispatch-controller|--zk-dispatch-pids|--zk-dispatch-proxies)
             set_var '' "${1:2}" "$2"
             shift 2
             ;;
@@ -102,6 +151,18 @@ while [ -z "$dashdash" -a "$#" -gt '0' ]; do
             multi_count="$2"
             shift 2
             ;;
+        --local-ensemble)
+            local_ensemble="$2"
+            shift 2
+            ;;
+        --local-ensemble-mode)
+            local_ensemble_mode="$2"
+            shift 2
+            ;;
+        --local-ensemble-dir)
+            local_ensemble_dir="$2"
+            shift 2
+            ;;
         --workdir|--multi-workdir)
             multi_workdir="$2"
             shift 2
@@ -154,9 +215,58 @@ if [ -n "$report_dir" ]; then
     if [ -z "$ZK_LOCUST_ZK_METRICS_CSV" ]; then
         export ZK_LOCUST_ZK_METRICS_CSV="$report_dir/zk-metrics.csv"
     fi
+    if [ -z "$ZK_LOCUST_ZK_METRICS_WATCH_SUMMARY" ]; then
+        export ZK_LOCUST_ZK_METRICS_WATCH_SUMMARY="$report_dir/zk-watches.json"
+    fi
     if [ -z "$LOCUST_EXTRA_STATS_CSV" ]; then
         export LOCUST_EXTRA_STATS_CSV="$report_dir/locust-stats.csv"
     fi
+    if [ -z "$ZK_LOCUST_BENCH_SEEKER_REPORT" ]; then
+        export ZK_LOCUST_BENCH_SEEKER_REPORT="$report_dir/seeker.json"
+    fi
+    if [ -z "$ZK_DISPATCH_TRACE" ]; then
+        export ZK_DISPATCH_TRACE="$report_dir/dispatch-trace.jsonl"
+    fi
+    if [ -z "$ZK_DISPATCH_PERTURBATIONS" ]; then
+        export ZK_DISPATCH_PERTURBATIONS="$report_dir/perturbations.jsonl"
+    fi
+fi
+
+# Local ensemble setup.
+
+if [ -n "$local_ensemble" ]; then
+    if [ -z "$local_ensemble_dir" ]; then
+        if [ -n "$report_dir" ]; then
+            local_ensemble_dir="$report_dir/ensemble"
+        else
+            local_ensemble_dir="$(mktemp -d)"
+            cleanup_cmds+=("rm -rf '$local_ensemble_dir'")
+        fi
+    fi
+    mkdir -p "$local_ensemble_dir"
+    local_ensemble_env="$local_ensemble_dir/env.sh"
+    rm -f "$local_ensemble_env"
+
+    PYTHONPATH="$ZK_LOCUST_TESTS${PYTHONPATH:+:$PYTHONPATH}" \
+        python3 -m zk_ensemble \
+            --size "$local_ensemble" \
+            --mode "$local_ensemble_mode" \
+            --dir "$local_ensemble_dir" \
+            --env-file "$local_ensemble_env" \
+            >"$local_ensemble_dir/ensemble.log" 2>&1 &
+    local_ensemble_pid="$!"
+    # Prepended, so that the ensemble is stopped before its directory
+    # is removed.
+    cleanup_cmds=("kill '$local_ensemble_pid' 2>/dev/null; wait '$local_ensemble_pid'" "${cleanup_cmds[@]}")
+
+    while [ ! -e "$local_ensemble_env" ]; do
+        if ! kill -0 "$local_ensemble_pid" 2>/dev/null; then
+            die "Local ensemble failed; see '$local_ensemble_dir/ensemble.log'."
+        fi
+        sleep 0.2
+    done
+
+    . "$local_ensemble_env"
 fi
 
 # Locust invocation.
@@ -169,7 +279,7 @@ else
         mkdir -p "$multi_workdir"
     else
         multi_workdir="$(mktemp -d)"
-        trap "rm -rf '$multi_workdir'" EXIT
+        cleanup_cmds+=("rm -rf '$multi_workdir'")
     fi
     set +e
     "$ZK_LOCUST_TESTS/multi-locust.sh" "$multi_count" "$multi_workdir" \
@@ -17,6 +17,8 @@ sys.path.append(_report_scripts)
 
 if True:
     import gen_op_md
+    import gen_comparison
+    import gen_perturbations_md
 
 
 def _has_pandoc():
@@ -58,11 +60,20 @@ def _has_pandoc():
     show_default='if Pandoc available',
     help="Generate HTML from Markdown report")
 @click.option("--nb/--no-nb", default=False, help="Generate Jupyter notebook")
+@click.option(
+    "--compare/--no-compare",
+    default=False,
+    help="Compare datasets against the first one (multi-dataset only)")
+@click.option(
+    "--fail-on-regression",
+    is_flag=True,
+    help="Exit with an error status if --compare detects a regression")
 @click.option("-f", "--force", is_flag=True, help="Possibly overwrite files")
 @click.option("-j", "--jobs", type=click.INT, help="Use parallel jobs")
 @click.option('-v', '--verbose', count=True)
 def cli(metrics_dir, labeled_metrics_dir, zk_metrics_csv, stats_csv,
-        report_dir, option, in_place, md, pdf, html, nb, force, jobs, verbose):
+        report_dir, option, in_place, md, pdf, html, nb, compare,
+        fail_on_regression, force, jobs, verbose):
     if metrics_dir and labeled_metrics_dir:
         raise click.ClickException(
             '--metrics-dir and --labeled-metrics-dir cannot be used together.')
@@ -80,6 +91,10 @@ def cli(metrics_dir, labeled_metrics_dir, zk_metrics_csv, stats_csv,
 
     is_multi = len(metrics_dir) > 1
 
+    if compare and not is_multi:
+        raise click.ClickException(
+            '--compare can only be used for multi-dataset reports.')
+
     if is_multi and (zk_metrics_csv or stats_csv):
         raise click.ClickException(
             '--zk-metrics-csv and --stats-csv can only be used for ' +
@@ -89,6 +104,11 @@ def cli(metrics_dir, labeled_metrics_dir, zk_metrics_csv, stats_csv,
         zk_metrics_csv or '%s/zk-metrics.csv' % x for x in metrics_dir
     ]
     stats_csvs = [stats_csv or '%s/locust-stats.csv' % x for x in metrics_dir]
+    # Optional; recorded when zk_dispatch perturbs the ensemble.
+    perturbations_jsonls = [
+        '%s/perturbations.jsonl' % x if os.path.isfile(
+            '%s/perturbations.jsonl' % x) else None for x in metrics_dir
+    ]
 
     no_access = []
     for f in zk_metrics_csvs + stats_csvs:
@@ -145,6 +165,9 @@ def cli(metrics_dir, labeled_metrics_dir, zk_metrics_csv, stats_csv,
             'GEN_HTML=' + ('1' if html else ''),
             'GEN_NB=' + ('1' if nb else ''), 'report'
         ]
+        if perturbations_jsonls[0]:
+            extra_args.append('ZK_DISPATCH_PERTURBATIONS=' +
+                              os.path.abspath(perturbations_jsonls[0]))
         os.execvp(make_args[0], make_args + extra_args)
         return  # But execvp should have taken over.
 
@@ -184,6 +207,28 @@ def cli(metrics_dir, labeled_metrics_dir, zk_metrics_csv, stats_csv,
     gen_op_md.process_fragments(report_dir, fragments, top_frags_dir, 'mix',
                                 md, nb, options)
 
+    perturbations_md = ''
+    for i, path in enumerate(perturbations_jsonls):
+        if path:
+            perturbations_md += gen_perturbations_md.gen_perturbations_md(
+                gen_perturbations_md.load_perturbations(path),
+                labels[i] if labels else str(i))
+    if perturbations_md:
+        with open(os.path.join(report_dir, 'perturbations.md'), 'w') as f:
+            f.write(perturbations_md)
+
+    if compare:
+        verdict = gen_comparison.compare_fragments(report_dir, fragments,
+                                                   options)
+        gen_comparison.write_comparison(
+            verdict, os.path.join(report_dir, 'verdict.json'),
+            os.path.join(report_dir, 'report.md') if md else None)
+
+        if fail_on_regression and verdict['verdict'] != 'pass':
+            raise click.ClickException(
+                'Comparison verdict: %s; see %s.' %
+                (verdict['verdict'], os.path.join(report_dir, 'verdict.json')))
+
 
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+# Numeric comparison of labeled datasets: computes per-op throughput
+# and latency percentile deltas against a baseline, with bootstrap
+# confidence intervals, and renders them as a Markdown table and a
+# JSON verdict.
+
+import io
+import json
+
+import numpy as np
+
+import gen_op_md
+
+_percentiles = ['50%', '95%', '99%']
+
+_VERDICT_PASS, _VERDICT_FAIL, _VERDICT_INCONCLUSIVE = [
+    'pass', 'fail', 'inconclusive'
+]
+
+_STATUS_REGRESSION, _STATUS_IMPROVEMENT, _STATUS_NEUTRAL, \
+    _STATUS_INCONCLUSIVE = [
+        'regression', 'improvement', 'neutral', 'inconclusive'
+    ]
+
+
+class Trial(object):
+    """Summary statistics for one dataset's (task set, op) subset."""
+
+    def __init__(self, label, rps, rps_samples, percentiles):
+        self.label = label
+        self.rps = rps
+        self.rps_samples = rps_samples
+        self.percentiles = percentiles
+
+    def metric(self, name):
+        if name == 'rps':
+            return self.rps
+        return self.percentiles.get(name)
+
+    @classmethod
+    def from_group(cls, label, group):
+        df = group.merged_client_stats()
+        df = df.loc[:, ['num_requests'] + _percentiles].dropna(
+            subset=['num_requests'])
+
+        if len(df) < 2:
+            return None
+
+        t = gen_op_md.relativize(df).index.to_numpy(dtype='float64')
+        dn = np.diff(df.num_requests.to_numpy(dtype='float64'))
+        dt = np.diff(t)
+
+        # Stats resets show up as decreasing request counts; these
+        # intervals are ignored.
+        pick = (dn >= 0) & (dt > 0)
+        if not pick.any():
+            return None
+
+        rps = dn[pick].sum() / dt[pick].sum()
+        rps_samples = dn[pick] / dt[pick]
+
+        percentiles = {pc: float(df[pc].iloc[-1]) for pc in _percentiles}
+
+        return cls(label, rps, rps_samples, percentiles)
+
+
+def _block_resample(samples, rng):
+    # Moving-block bootstrap, preserving short-range autocorrelation.
+    n = len(samples)
+    block = max(int(np.sqrt(n)), 1)
+    starts = rng.integers(0, n - block + 1, size=(n + block - 1) // block)
+    idx = (starts[:, None] + np.arange(block)).ravel()[:n]
+    return samples[idx]
+
+
+def _bootstrap_rel_deltas(base_trials, cand_trials, metric, resamples, rng):
+    """Returns bootstrap replicates of the relative delta (in percent)
+    of the mean of a metric, or None if no resampling unit is
+    available."""
+    if len(base_trials) > 1 and len(cand_trials) > 1:
+        base = np.array([t.metric(metric) for t in base_trials])
+        cand = np.array([t.metric(metric) for t in cand_trials])
+
+        def resample(values):
+            return rng.choice(values, size=len(values)).mean()
+    elif metric == 'rps':
+        base = np.concatenate([t.rps_samples for t in base_trials])
+        cand = np.concatenate([t.rps_samples for t in cand_trials])
+
+        if len(base) < 2 or len(cand) < 2:
+            return None
+
+        def resample(values):
+            return _block_resample(values, rng).mean()
+    else:
+        return None
+
+    deltas = []
+    for i in range(resamples):
+        b = resample(base)
+        if b:
+            deltas.append((resample(cand) - b) / b * 100)
+
+    return np.array(deltas) if deltas else None
+
+
+def _classify(metric, delta, ci, threshold):
+    if ci is None:
+        return _STATUS_INCONCLUSIVE
+
+    low, high = ci
+    if low <= 0 <= high or abs(delta) < threshold:
+        return _STATUS_NEUTRAL
+
+    # Throughput: higher is better; latencies: lower is better.
+    is_worse = delta < 0 if metric == 'rps' else delta > 0
+
+    return _STATUS_REGRESSION if is_worse else _STATUS_IMPROVEMENT
+
+
+def compare_trials(task_set, op, trials_by_label, baseline, get_option):
+    confidence = get_option('confidence', type=float, fallback=0.95)
+    resamples = get_option('resamples', type=int, fallback=2000)
+    threshold = get_option('threshold', type=float, fallback=5.0)
+    seed = get_option('seed', type=int, fallback=0)
+
+    alpha = (1 - confidence) / 2
+    rng = np.random.default_rng(seed)
+
+    base_trials = trials_by_label[baseline]
+
+    rows = []
+    for label, cand_trials in trials_by_label.items():
+        if label == baseline:
+            continue
+
+        for metric in ['rps'] + _percentiles:
+            base_value = np.mean([t.metric(metric) for t in base_trials])
+            cand_value = np.mean([t.metric(metric) for t in cand_trials])
+
+            delta = None
+            if base_value and np.isfinite(base_value):
+                delta = (cand_value - base_value) / base_value * 100
+
+            ci = None
+            deltas = _bootstrap_rel_deltas(base_trials, cand_trials, metric,
+                                           resamples, rng)
+            if deltas is not None and delta is not None:
+                ci = (float(np.quantile(deltas, alpha)),
+                      float(np.quantile(deltas, 1 - alpha)))
+
+            status = _STATUS_INCONCLUSIVE
+            if delta is not None:
+                status = _classify(metric, delta, ci, threshold)
+
+            rows.append({
+                'task_set': task_set,
+                'op': op,
+                'label': label,
+                'metric': metric,
+                'baseline_trials': len(base_trials),
+                'trials': len(cand_trials),
+                'baseline': float(base_value),
+                'value': float(cand_value),
+                'delta_pct': delta,
+                'ci_pct': ci,
+                'status': status
+            })
+
+    return rows
+
+
+def compare_fragments(base_input_path, fragments, options):
+    get_option = gen_op_md.option_getter(options, 'compare')
+
+    frag_dict = {}
+    for fragment in fragments:
+        key = (fragment['task_set'], fragment['op'])
+        frag_dict[key] = frag_dict.get(key, []) + fragment['data']
+
+    baseline = None
+    rows = []
+
+    for (task_set, op), data in frag_dict.items():
+        trials_by_label = {}
+        for data_item in data:
+            label = data_item.get('label') or data_item.get('id')
+            if baseline is None:
+                baseline = label
+            group = gen_op_md.load_group(base_input_path, data_item)
+            trial = Trial.from_group(label, group)
+            if trial:
+                trials_by_label.setdefault(label, []).append(trial)
+
+        if baseline not in trials_by_label:
+            continue
+
+        rows += compare_trials(task_set, op, trials_by_label, baseline,
+                               get_option)
+
+    statuses = set(row['status'] for row in rows)
+    if _STATUS_REGRESSION in statuses:
+        verdict = _VERDICT_FAIL
+    elif _STATUS_INCONCLUSIVE in statuses:
+        # E.g., latencies compared with a single trial per label: a
+        # regression cannot be ruled out.
+        verdict = _VERDICT_INCONCLUSIVE
+    else:
+        verdict = _VERDICT_PASS
+
+    return {
+        'verdict': verdict,
+        'baseline': baseline,
+        'confidence': get_option('confidence', type=float, fallback=0.95),
+        'threshold_pct': get_option('threshold', type=float, fallback=5.0),
+        'comparisons': rows
+    }
+
+
+def _format_pct(v):
+    return '' if v is None else '%+.2f%%' % v
+
+
+def gen_comparison_md(verdict):
+    f = io.StringIO()
+
+    f.write('## Comparison\n\n')
+    f.write("Baseline: '%s'; confidence: %g; threshold: %g%%; "
+            "verdict: **%s**.\n\n" %
+            (verdict['baseline'], verdict['confidence'],
+             verdict['threshold_pct'], verdict['verdict']))
+
+    if not verdict['comparisons']:
+        f.write('*(No comparable data)*\n\n')
+        return f.getvalue()
+
+    f.write('| Task set | Op | Label | Metric | Baseline | Value '
+            '| Delta | CI | Status |\n')
+    f.write('|---|---|---|---|--:|--:|--:|--:|---|\n')
+
+    for row in verdict['comparisons']:
+        ci = row['ci_pct']
+        ci_s = '' if ci is None else '[%s, %s]' % (_format_pct(ci[0]),
+                                                  _format_pct(ci[1]))
+        f.write('| %s | %s | %s | %s | %.3f | %.3f | %s | %s | %s |\n' %
+                (gen_op_md._md_escape(row['task_set']),
+                 gen_op_md._md_escape(row['op']), row['label'],
+                 gen_op_md._md_escape(row['metric']), row['baseline'],
+                 row['value'], _format_pct(row['delta_pct']), ci_s,
+                 row['status']))
+
+    f.write('\n')
+
+    return f.getvalue()
+
+
+def _json_safe(value):
+    # NaN/infinite statistics (e.g., not computed for lack of samples)
+    # become `null`, as they are not valid JSON.
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    return value
+
+
+def write_comparison(verdict, json_path, md_path):
+    with open(json_path, 'w') as f:
+        json.dump(_json_safe(verdict), f, indent=2, allow_nan=False)
+        f.write('\n')
+
+    if md_path:
+        with open(md_path, 'w') as f:
+            f.write('# Report\n\n')
+            f.write(gen_comparison_md(verdict))
@@ -38,6 +38,9 @@ warnings.filterwarnings('ignore', 'The handle <matplotlib')
 _savefig_exts = ['.svg', '.pdf']
 _per_worker = '/Wkr'
 
+# Maximum number of rows per plotted curve; see AbstractPlotter.
+_default_max_points = 2000
+
 _ls_key_labels = {
     'num_requests': '# requests',
     'num_failures': '# failures',
@@ -63,6 +66,13 @@ _zkm_plots = [
         'metrics': ['num_alive_connections'],
         'ignore_not_serving': True
     },
+    {
+        'label': 'Sessions',
+        'ylabel': 'Count',
+        'name': 'sessions',
+        'metrics': ['global_sessions', 'local_sessions'],
+        'ignore_not_serving': True
+    },
     {
         'label': 'Nodes',
         'ylabel': 'Count',
@@ -181,7 +191,8 @@ def gen_summary_md(df, level):
 
 def write_md(df, task_set, op, md_path, latencies_base_path,
              client_count_fig_infos, request_frequency_fig_infos,
-             errors_fig_infos, zkm_fig_infos):
+             errors_fig_infos, zkm_fig_infos, knee_fig_infos=None,
+             knee_md=None):
 
     # KLUDGE: We don't relativize paths and explicitly create broken
     # references in intermediate report fragments.  This won't work
@@ -216,6 +227,12 @@ def write_md(df, task_set, op, md_path, latencies_base_path,
         ]:
             f.write('  * %s <= %s ms\n' % (pc, data[pc][0]))
 
+        if knee_md:
+            f.write('\n### Throughput vs. Latency\n\n')
+            for saved_fig_info in knee_fig_infos or []:
+                f.write('\n![](%s)\n\n' % relpath(saved_fig_info.naked_path))
+            f.write(knee_md)
+
         f.write('\n### Other Metrics\n\n')
 
         if errors_fig_infos:
@@ -403,11 +420,136 @@ def set_ax_labels(ax, *, x_is_relative=False, y_label=None):
         ax.set_ylabel(y_label)
 
 
+def _index_as_float(index):
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8.astype('float64')
+    return np.asarray(index, dtype='float64')
+
+
+def _bucket_bounds(df, n_buckets):
+    x = _index_as_float(df.index)
+    span = x[-1] - x[0]
+    if span > 0:
+        ids = np.minimum(((x - x[0]) / span * n_buckets).astype('int64'),
+                         n_buckets - 1)
+    else:
+        ids = np.zeros(len(x), dtype='int64')
+    starts = np.flatnonzero(np.diff(ids, prepend=-1))
+    ends = np.append(starts[1:], len(x))
+    return (starts, ends)
+
+
+def _downsample_minmax(df, max_points):
+    # Two rows per (time-based) bucket: for each column, the minimum
+    # and the maximum of the bucket, in order of occurrence.  The rows
+    # are placed at the first resp. last timestamps of the bucket.
+    starts, ends = _bucket_bounds(df, max(max_points // 2, 1))
+    values = df.to_numpy(dtype='float64')
+    n_columns = values.shape[1]
+    columns_i = np.arange(n_columns)
+
+    index = []
+    rows = []
+    for s, e in zip(starts, ends):
+        block = values[s:e]
+        if e - s == 1:
+            index.append(df.index[s])
+            rows.append(block[0])
+            continue
+        nans = np.isnan(block)
+        imin = np.where(nans, np.inf, block).argmin(axis=0)
+        imax = np.where(nans, -np.inf, block).argmax(axis=0)
+        first = np.minimum(imin, imax)
+        last = np.maximum(imin, imax)
+        row_a = block[first, columns_i]
+        row_b = block[last, columns_i]
+        index += [df.index[s], df.index[e - 1]]
+        rows += [row_a, row_b]
+
+    return pd.DataFrame(
+        rows, index=pd.Index(index, name=df.index.name), columns=df.columns)
+
+
+def _downsample_mean(df, max_points):
+    starts, ends = _bucket_bounds(df, max_points)
+    values = df.to_numpy(dtype='float64')
+
+    index = []
+    rows = []
+    for s, e in zip(starts, ends):
+        index.append(df.index[(s + e - 1) // 2])
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            rows.append(np.nanmean(values[s:e], axis=0))
+
+    return pd.DataFrame(
+        rows, index=pd.Index(index, name=df.index.name), columns=df.columns)
+
+
+def _downsample_lttb(df, max_points):
+    # Largest-Triangle-Three-Buckets; rows are selected according to
+    # the first column.
+    n = len(df)
+    n_out = max(max_points, 3)
+    x = _index_as_float(df.index)
+    y = np.nan_to_num(df.iloc[:, 0].to_numpy(dtype='float64'))
+
+    picks = [0]
+    every = (n - 2) / (n_out - 2)
+    a = 0
+    for i in range(n_out - 2):
+        s = int(i * every) + 1
+        e = int((i + 1) * every) + 1
+        ns = e
+        ne = min(int((i + 2) * every) + 1, n)
+        if ns >= ne:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        else:
+            avg_x, avg_y = x[ns:ne].mean(), y[ns:ne].mean()
+        areas = np.abs((x[a] - avg_x) * (y[s:e] - y[a]) -
+                       (x[a] - x[s:e]) * (avg_y - y[a]))
+        a = s + int(areas.argmax())
+        picks.append(a)
+    picks.append(n - 1)
+
+    return df.iloc[picks]
+
+
+_downsample_fns = {
+    'minmax': _downsample_minmax,
+    'mean': _downsample_mean,
+    'lttb': _downsample_lttb,
+}
+
+
+def downsample(df, max_points, *, method='minmax'):
+    """Returns a version of the numeric, time-indexed df with a bounded
+    number of rows.  The default 'minmax' method preserves spikes."""
+    if method == 'none' or not max_points or len(df) <= max_points:
+        return df
+
+    fn = _downsample_fns.get(method)
+    if not fn:
+        raise ValueError(f'Unknown downsampling method {method!r}')
+
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+
+    return fn(df, max_points)
+
+
 class AbstractPlotter(metaclass=ABCMeta):
     def __init__(self, get_option=None):
         self._figsize = _figsize
         self._ylim = (None, None)
+        self._max_points = _default_max_points
+        self._downsample = 'minmax'
         if get_option:
+            max_points = get_option('max_points', type=int)
+            if max_points is not None:
+                self._max_points = max_points
+            self._downsample = get_option(
+                'downsample', fallback=self._downsample)
             w = get_option('width', type=float)
             if w and w > 0:
                 self._figsize = (w, self._figsize[1])
@@ -421,6 +563,11 @@ class AbstractPlotter(metaclass=ABCMeta):
             if top is not None:
                 self._ylim = (self._ylim[0], top)
 
+    def downsample(self, df, columns=None):
+        if columns is not None:
+            df = df.loc[:, columns]
+        return downsample(df, self._max_points, method=self._downsample)
+
     def fig(self):
         fig = plt.figure(figsize=self._figsize)
         ax = fig.gca()
@@ -513,6 +660,9 @@ class LatenciesPlotter(AbstractPlotter):
             if is_relative:
                 df = relativize(df)
 
+            df = self.downsample(
+                df, shaded_pcs + [pc for (pc, linestyle) in highlighted_pcs])
+
             if is_main and self._shade:
                 # Only shade first group.
                 for pc in shaded_pcs:
@@ -576,6 +726,8 @@ class ClientCountPlotter(AbstractPlotter):
                 index_base = df.index.min()
                 df = relativize(df)
 
+            df = self.downsample(df)
+
             df.plot.line(ax=ax, color=color)
             labels.append(
                 group.prefix_label('ZK C.' if self._per_worker else '_'))
@@ -598,6 +750,8 @@ class ClientCountPlotter(AbstractPlotter):
                 if is_relative:
                     w_df = relativize(w_df, index_base=index_base)
 
+                w_df = self.downsample(w_df)
+
                 w_df.plot.line(ax=ax, color=color, linestyle=':', alpha=alpha)
                 labels.append(
                     group.prefix_label('ZK C.' +
@@ -686,7 +840,12 @@ class RequestFrequencyPlotter(AbstractPlotter):
                     kwargs['alpha'] = alpha
                     kwargs['linestyle'] = ':'
 
-                y_values = [dnr_dt, dnr_dt - dnf_dt, dnf_dt]
+                y_df = self.downsample(
+                    pd.DataFrame({
+                        'requests': dnr_dt,
+                        'successes': dnr_dt - dnf_dt,
+                        'failures': dnf_dt
+                    }))
 
                 for ax_k in range(n_axes):
                     ax = axes[ax_k]
@@ -695,7 +854,11 @@ class RequestFrequencyPlotter(AbstractPlotter):
                     if not label.startswith('_'):
                         has_labels[ax_k] = True
 
-                    ax.plot(df.index, y_values[ax_k], label=label, **kwargs)
+                    ax.plot(
+                        y_df.index,
+                        y_df.iloc[:, ax_k],
+                        label=label,
+                        **kwargs)
 
         for ax_k in range(n_axes):
             ax = axes[ax_k]
@@ -849,6 +1012,9 @@ class ZooKeeperMetricsPlotter(AbstractPlotter):
         sel_groups = []
         for group in groups:
             df = group.zkm_df
+            if not any(metric in df for metric in plot_def['metrics']):
+                # E.g., not exposed by this version of ZooKeeper.
+                continue
             pick = df.error != (
                 'This ZooKeeper instance is not currently serving requests')
             df = df[pick]
@@ -861,6 +1027,9 @@ class ZooKeeperMetricsPlotter(AbstractPlotter):
             dfs.append(df)
             sel_groups.append(group)
 
+        if not dfs:
+            return []
+
         is_relative = len(dfs) > 1
 
         if is_relative:
@@ -874,7 +1043,10 @@ class ZooKeeperMetricsPlotter(AbstractPlotter):
 
         fig.suptitle(title)
 
-        metrics = plot_def['metrics']
+        metrics = [
+            metric for metric in plot_def['metrics']
+            if any(metric in df for df in dfs)
+        ]
         ylabel = plot_def['ylabel']
 
         for host_i in range(n):
@@ -892,6 +1064,8 @@ class ZooKeeperMetricsPlotter(AbstractPlotter):
                 if not len(df):
                     continue
 
+                df = self.downsample(df, metrics)
+
                 kwargs = {}
                 for metric in metrics:
                     df.plot(y=metric, ax=ax, color=color, **kwargs)
@@ -1039,9 +1213,10 @@ class ErrorsPlotter(AbstractPlotter):
                 x_df = pd.DataFrame(data)
                 w_ids = x_df.client_id.unique()
 
-                x_df[key].rolling(
-                    len(w_ids), center=True).sum().plot.line(
-                        ax=ax, legend=False, color=color)
+                rolled_df = x_df[key].rolling(
+                    len(w_ids), center=True).sum().to_frame()
+                self.downsample(rolled_df).plot.line(
+                    ax=ax, legend=False, color=color)
 
                 is_per_worker = len(w_ids) > 1 and self._per_worker
 
@@ -1055,6 +1230,7 @@ class ErrorsPlotter(AbstractPlotter):
 
                 for w_id in w_ids:
                     plot_df = x_df[x_df.client_id == w_id]
+                    plot_df = self.downsample(plot_df, [key])
 
                     plot_df.plot.line(
                         y=key,
@@ -1092,6 +1268,265 @@ def process_errors(groups, base_path, options):
     return plotter.plot_and_save(groups, base_path)
 
 
+_knee_percentiles = ['50%', '95%', '99%']
+
+_knee_curve_columns = [
+    'user_count', 'plateaus', 'duration', 'num_requests', 'rps', 'mean'
+] + _knee_percentiles
+
+
+def extract_plateaus(df, *, settle_s=0.0, min_duration_s=0.0):
+    """Splits merged client stats into windows of constant
+    `user_count`, returning one row per plateau with the achieved
+    request rate and latencies over that window.
+
+    The mean latency is exact, as it is derived from the difference of
+    cumulative sums.  Locust percentiles are cumulative, so they are
+    only reported for windows which start at a stats reset (see
+    `--reset-stats`) or at the beginning of the run; they are NaN
+    otherwise."""
+    columns = ['user_count', 'num_requests', 'avg_response_time']
+    df = df.loc[:, columns + _knee_percentiles].dropna(subset=columns[:2])
+
+    plateau_columns = ['user_count', 'start', 'duration', 'num_requests',
+                       'rps', 'mean'] + _knee_percentiles
+    if len(df) < 2:
+        return pd.DataFrame(columns=plateau_columns)
+
+    t = relativize(df).index.to_numpy(dtype='float64')
+    uc = df.user_count.to_numpy(dtype='float64')
+    n = df.num_requests.to_numpy(dtype='float64')
+    avg = df.avg_response_time.fillna(0).to_numpy(dtype='float64')
+    pcs = df.loc[:, _knee_percentiles].to_numpy(dtype='float64')
+
+    breaks = np.flatnonzero(np.diff(uc) != 0) + 1
+    bounds = np.concatenate([[0], breaks, [len(df)]])
+
+    rows = []
+    for k in range(len(bounds) - 1):
+        lo, hi = bounds[k], bounds[k + 1]
+        if t[hi - 1] - t[lo] < min_duration_s:
+            continue
+
+        # Skip the transient following a client count change.
+        first = lo + np.searchsorted(t[lo:hi], t[lo] + settle_s)
+
+        # Only keep the tail following the last stats reset, if any.
+        is_fresh = k == 0
+        resets = np.flatnonzero(np.diff(n[first:hi]) < 0)
+        if len(resets):
+            first += resets[-1] + 1
+            is_fresh = True
+
+        last = hi - 1
+        dn = n[last] - n[first] if last > first else 0
+        dt = t[last] - t[first] if last > first else 0
+        if dn <= 0 or dt <= 0:
+            continue
+
+        row = [
+            uc[lo], t[first], dt, dn, dn / dt,
+            (avg[last] * n[last] - avg[first] * n[first]) / dn
+        ]
+        row += list(pcs[last]) if is_fresh else [np.nan] * len(pcs[last])
+
+        rows.append(row)
+
+    return pd.DataFrame(rows, columns=plateau_columns)
+
+
+def throughput_latency_curve(plateaus):
+    """Collapses plateaus sharing a client count into a single point of
+    the throughput-latency curve.  Rates and mean latencies are
+    weighted by request counts; percentiles, which cannot be merged
+    exactly, are averaged."""
+    rows = []
+    for user_count, g in plateaus.groupby('user_count', sort=True):
+        n = g.num_requests.sum()
+        duration = g.duration.sum()
+        row = [
+            user_count,
+            len(g), duration, n, n / duration,
+            (g['mean'] * g.num_requests).sum() / n
+        ]
+        row += [g[pc].mean() for pc in _knee_percentiles]
+        rows.append(row)
+
+    return pd.DataFrame(rows, columns=_knee_curve_columns)
+
+
+def find_knee(x, y):
+    """Locates the knee of a concave, increasing curve using the
+    "Kneedle" method: the point furthest above the chord joining the
+    extremities of the normalized curve.  Returns its position, or
+    None if the curve doesn't bend."""
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+
+    if len(x) < 3 or np.ptp(x) <= 0 or np.ptp(y) <= 0:
+        return None
+
+    x_n = (x - x.min()) / np.ptp(x)
+    y_n = (y - y.min()) / np.ptp(y)
+    d = y_n - x_n
+
+    k = int(np.argmax(d))
+    if d[k] <= 0 or k == len(x) - 1:
+        return None
+
+    return k
+
+
+class ThroughputLatencyPlotter(AbstractPlotter):
+    def __init__(self, options={}):
+        get_option = option_getter(options, 'knee')
+
+        super(ThroughputLatencyPlotter, self).__init__(get_option=get_option)
+
+        self._settle_s = get_option('settle_s', type=float, fallback=0.0)
+        self._min_duration_s = get_option(
+            'min_duration_s', type=float, fallback=5.0)
+
+    def curve(self, group):
+        plateaus = extract_plateaus(
+            group.merged_client_stats(),
+            settle_s=self._settle_s,
+            min_duration_s=self._min_duration_s)
+
+        return throughput_latency_curve(plateaus)
+
+    def curves(self, groups):
+        """Returns (group, curve, knee position) tuples for groups
+        exhibiting at least two plateaus."""
+        acc = []
+        for group in groups:
+            curve = self.curve(group)
+            if len(curve) < 2:
+                continue
+            acc.append((group, curve, find_knee(curve.user_count,
+                                                curve.rps)))
+        return acc
+
+    def plot(self, groups):
+        return self.plot_curves(self.curves(groups))
+
+    def plot_curves(self, curves):
+        if not curves:
+            return []
+
+        figsize = self._figsize
+        if figsize is _figsize:
+            figsize = (_figsize[0], _figsize[1] * 1.5)
+
+        fig, (ax_tp, ax_lat) = plt.subplots(nrows=2, figsize=figsize)
+        title = 'Throughput vs. Latency'
+
+        fig.suptitle(title)
+
+        for i in range(len(curves)):
+            group, curve, knee = curves[i]
+            color = _colors[i % len(_colors)]
+
+            ax_tp.plot(
+                curve.user_count,
+                curve.rps,
+                color=color,
+                marker='o',
+                label=group.prefix_label('Requests/s'))
+
+            ax_lat.plot(
+                curve.rps,
+                curve['mean'],
+                color=color,
+                marker='o',
+                label=group.prefix_label('Mean'))
+
+            for pc, linestyle in [('50%', '--'), ('99%', ':')]:
+                if curve[pc].notna().any():
+                    ax_lat.plot(
+                        curve.rps,
+                        curve[pc],
+                        color=color,
+                        linestyle=linestyle,
+                        marker='.',
+                        label=group.prefix_label(pc))
+
+            if knee is not None:
+                point = curve.iloc[knee]
+                ax_tp.axvline(point.user_count, color=color, linestyle=':')
+                ax_tp.scatter(
+                    [point.user_count], [point.rps],
+                    color=color,
+                    marker='X',
+                    s=100,
+                    zorder=3,
+                    label=group.prefix_label('Knee'))
+                ax_lat.scatter(
+                    [point.rps], [point['mean']],
+                    color=color,
+                    marker='X',
+                    s=100,
+                    zorder=3,
+                    label=group.prefix_label('Knee'))
+
+        ax_tp.set_xlabel('Client count')
+        ax_tp.set_ylabel('Requests/s')
+        ax_tp.set_ylim(bottom=0)
+        ax_tp.legend()
+
+        self.limit_axes([ax_lat])
+        ax_lat.set_xlabel('Requests/s')
+        ax_lat.set_ylabel('Latency (ms)')
+        ax_lat.legend()
+
+        fig.tight_layout(rect=(0, 0, 1, 0.95))
+
+        return [FigInfo(fig, title)]
+
+
+def gen_knee_md(curves):
+    f = io.StringIO()
+
+    for group, curve, knee in curves:
+        if len(curves) > 1:
+            f.write('##### %s\n\n' % _md_escape(group.prefix_label(None)))
+
+        if knee is None:
+            f.write('No saturation knee found; max. throughput: '
+                    '%.1f req/s.\n\n' % curve.rps.max())
+        else:
+            point = curve.iloc[knee]
+            f.write('Saturation knee at %d clients: %.1f req/s, '
+                    'mean latency %.3f ms.\n\n' %
+                    (point.user_count, point.rps, point['mean']))
+
+        f.write('| Clients | Plateaus | Duration (s) | Requests/s '
+                '| Mean (ms) | %s |\n' % ' | '.join(
+                    '%s (ms)' % pc for pc in _knee_percentiles))
+        f.write('|--:|--:|--:|--:|--:|%s\n' %
+                ('--:|' * len(_knee_percentiles)))
+
+        for i, row in curve.iterrows():
+            pcs = ' | '.join('' if np.isnan(row[pc]) else '%g' % row[pc]
+                             for pc in _knee_percentiles)
+            f.write('| %d%s | %d | %.1f | %.1f | %.3f | %s |\n' %
+                    (row.user_count, ' (knee)' if i == knee else '',
+                     row.plateaus, row.duration, row.rps, row['mean'], pcs))
+
+        f.write('\n')
+
+    return f.getvalue()
+
+
+def process_knee(groups, base_path, options):
+    plotter = ThroughputLatencyPlotter(options)
+
+    curves = plotter.curves(groups)
+    saved_fig_infos = plotter.save(plotter.plot_curves(curves), base_path)
+
+    return (saved_fig_infos, gen_knee_md(curves) if curves else None)
+
+
 def process_task_set_op_single(task_set, op, group, op_path_prefix, md_path,
                                options):
     ls_df = group.ls_df
@@ -1112,6 +1547,9 @@ def process_task_set_op_single(task_set, op, group, op_path_prefix, md_path,
     errors_fig_infos = process_errors([group], op_path_prefix + '_errors',
                                       options)
 
+    knee_fig_infos, knee_md = process_knee([group], op_path_prefix + '_knee',
+                                           options)
+
     zkm_fig_infos = []
     if len(zkm_df) > 0:
         for plot_def in _zkm_plots:
@@ -1120,7 +1558,7 @@ def process_task_set_op_single(task_set, op, group, op_path_prefix, md_path,
 
     write_md(ls_df, task_set, op, md_path, latencies_op_path_prefix,
              client_count_fig_infos, request_frequency_fig_infos,
-             errors_fig_infos, zkm_fig_infos)
+             errors_fig_infos, zkm_fig_infos, knee_fig_infos, knee_md)
 
 
 def process_task_set_op_multi(task_set, op, groups, op_path_prefix, md_path,
@@ -1144,6 +1582,8 @@ def process_task_set_op_multi(task_set, op, groups, op_path_prefix, md_path,
     errors_fig_infos = process_errors(groups, op_path_prefix + '_errors',
                                       options)
 
+    process_knee(groups, op_path_prefix + '_knee', options)
+
     for plot_def in _zkm_plots:
         plot_zkm_multi(groups, plot_def, op_path_prefix, options)
 
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# Summarizes the perturbations recorded by `zk_dispatch` (see
+# `ZK_DISPATCH_PERTURBATIONS`) as a Markdown section: per-perturbation
+# recovery times, and aggregate MTTR statistics.
+
+import io
+import sys
+import json
+
+import numpy as np
+
+
+def load_perturbations(path):
+    perturbations = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get('kind') == 'perturbation':
+                perturbations.append(entry)
+    return perturbations
+
+
+def _format_s(v):
+    return '' if v is None else '%.3f' % v
+
+
+def _format_rps(v):
+    return '' if v is None else '%.1f' % v
+
+
+def gen_perturbations_md(perturbations, label=None):
+    f = io.StringIO()
+
+    if label:
+        f.write('## Perturbations (%s)\n\n' % label)
+    else:
+        f.write('## Perturbations\n\n')
+
+    if not perturbations:
+        f.write('*(No perturbations recorded)*\n\n')
+        return f.getvalue()
+
+    mttrs = [p['mttr_s'] for p in perturbations if p['mttr_s'] is not None]
+    n_unrecovered = len([p for p in perturbations if not p['recovered']])
+
+    f.write('%d perturbation(s), %d not recovered; ' %
+            (len(perturbations), n_unrecovered))
+    if mttrs:
+        f.write('MTTR (s): mean %.3f, median %.3f, max %.3f; ' %
+                (np.mean(mttrs), np.median(mttrs), np.max(mttrs)))
+    f.write('sessions expired: %d.\n\n' %
+            sum(p['sessions_expired'] for p in perturbations))
+
+    f.write('| # | Time | Member | Leader | Election (s) | New leader (s) '
+            '| Baseline (req/s) | Min. (req/s) | Throughput (s) '
+            '| Failures | Sessions expired | MTTR (s) |\n')
+    f.write('|--:|---|---|---|--:|--:|--:|--:|--:|--:|--:|--:|\n')
+
+    for p in perturbations:
+        f.write('| %d | %s | %s | %s | %s | %s | %s | %s | %s | %d | %d '
+                '| %s |\n' %
+                (p['id'], p['timestamp'], p['host_port'],
+                 'yes' if p['was_leader'] else 'no',
+                 _format_s(p['election_s']), _format_s(p['leader_elected_s']),
+                 _format_rps(p['baseline_rps']), _format_rps(p['min_rps']),
+                 _format_s(p['throughput_recovery_s']), p['failures'],
+                 p['sessions_expired'],
+                 _format_s(p['mttr_s']) if p['recovered'] else 'n/r'))
+
+    f.write('\n')
+
+    return f.getvalue()
+
+
+def main(executable, perturbations_path, md_path):
+    md = gen_perturbations_md(load_perturbations(perturbations_path))
+
+    with open(md_path, 'w') as f:
+        f.write(md)
+
+
+if __name__ == '__main__':
+    main(*sys.argv)
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+
+# A "live" counterpart to the Make-driven report pipeline: tails the
+# files produced by a running benchmark, keeps bounded in-memory
+# buffers, and serves the gen_op_md plots over HTTP.
+
+import os
+import io
+import time
+import json
+import threading
+import collections
+import logging
+
+import matplotlib
+matplotlib.use('Agg')
+
+if True:
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    from flask import Flask, Response, abort, jsonify, render_template_string
+
+    import gen_op_md
+
+_logger = logging.getLogger(__name__)
+
+_percentiles = [0.5, 0.95, 0.99, 1.0]
+
+_plot_kinds = ['latencies', 'errors', 'request_frequency', 'client_count']
+_zkm_plot_kinds = [plot_def['name'] for plot_def in gen_op_md._zkm_plots]
+
+_index_template = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Live Report</title>
+<style>
+body { font-family: sans-serif; }
+img { max-width: 100%; display: block; }
+td, th { padding: 0 1em; text-align: right; }
+</style>
+</head>
+<body>
+<h1>Live Report</h1>
+<p id="status">Generation {{ generation }}</p>
+<table id="distrib"></table>
+{% for task_set, op in ops %}
+<h2>Task set '{{ task_set }}', op '{{ op }}'</h2>
+{% for kind in kinds %}
+<h3>{{ kind }}</h3>
+<img data-src="plot/{{ task_set }}/{{ op }}/{{ kind }}.svg"
+     src="plot/{{ task_set }}/{{ op }}/{{ kind }}.svg?g={{ generation }}">
+{% endfor %}
+{% endfor %}
+<script>
+var generation = {{ generation }};
+var numOps = {{ ops|length }};
+
+function refresh() {
+  fetch("status.json").then(function(r) { return r.json(); }).then(
+    function(status) {
+      if (status.num_ops !== numOps) {
+        window.location.reload();
+        return;
+      }
+      if (status.generation === generation) {
+        return;
+      }
+      generation = status.generation;
+      document.getElementById("status").textContent =
+        "Generation " + generation + ", " + status.ls_rows +
+        " stats rows, " + status.zkm_rows + " metrics rows";
+      document.querySelectorAll("img[data-src]").forEach(function(img) {
+        img.src = img.dataset.src + "?g=" + generation;
+      });
+      return fetch("distrib.json").then(function(r) { return r.json(); });
+    }).then(function(distrib) {
+      if (!distrib) {
+        return;
+      }
+      var rows = ["<tr><th>Name</th><th>Method</th><th>Req/s</th>" +
+                  "<th>p50</th><th>p95</th><th>p99</th><th>p100</th></tr>"];
+      distrib.forEach(function(e) {
+        rows.push("<tr><td>" + e.name + "</td><td>" + (e.method || "") +
+                  "</td><td>" + e.rps.toFixed(1) + "</td><td>" +
+                  e.percentiles.join("</td><td>") + "</td></tr>");
+      });
+      document.getElementById("distrib").innerHTML = rows.join("");
+    });
+}
+
+setInterval(refresh, {{ refresh_ms }});
+</script>
+</body>
+</html>
+'''
+
+
+class FileTailer(object):
+    """Incrementally reads complete lines appended to a file, reopening
+    it if it is truncated or replaced."""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+        self._ino = None
+        self._partial = ''
+
+    def _reopen(self):
+        if self._f:
+            self._f.close()
+        self._f = None
+        self._partial = ''
+        try:
+            self._f = open(self.path, newline='')
+            self._ino = os.fstat(self._f.fileno()).st_ino
+        except OSError:
+            return False
+        return True
+
+    def _is_stale(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        return st.st_ino != self._ino or st.st_size < self._f.tell()
+
+    def read_lines(self):
+        """Returns (lines, reset), where reset indicates that the file has
+        been reopened and that previously read lines are obsolete."""
+        reset = False
+        if not self._f or self._is_stale():
+            if not self._reopen():
+                return ([], False)
+            reset = True
+
+        chunk = self._f.read()
+        if not chunk:
+            return ([], reset)
+
+        lines = (self._partial + chunk).split('\n')
+        self._partial = lines.pop()
+
+        return ([line for line in lines if line], reset)
+
+
+class RollingCsv(object):
+    """Keeps the header and the last max_rows rows of a tailed CSV
+    file.  Appended lines are parsed once, and added to a bounded
+    frame."""
+
+    def __init__(self, path, max_rows):
+        self._tailer = FileTailer(path) if path else None
+        self._max_rows = max_rows
+        self._header = None
+        # Lines not parsed yet.
+        self._pending = collections.deque(maxlen=max_rows)
+        self._df = None
+
+    def __len__(self):
+        parsed = len(self._df) if self._df is not None else 0
+        return min(parsed + len(self._pending), self._max_rows)
+
+    def poll(self):
+        if not self._tailer:
+            return False
+
+        lines, reset = self._tailer.read_lines()
+
+        if reset:
+            self._header = None
+            self._pending.clear()
+            self._df = None
+
+        if lines and self._header is None:
+            self._header = lines.pop(0)
+
+        if not lines:
+            return reset
+
+        self._pending.extend(lines)
+
+        return True
+
+    def _parse(self, lines):
+        s = '\n'.join([self._header] + lines)
+        return pd.read_csv(io.StringIO(s), index_col=0, parse_dates=True)
+
+    def df(self):
+        if self._header is None:
+            return None
+
+        if self._df is None or self._pending:
+            df = self._parse(list(self._pending))
+            self._pending.clear()
+            if self._df is not None and len(self._df):
+                df = pd.concat([self._df, df])
+            self._df = df.iloc[-self._max_rows:]
+
+        return self._df
+
+
+def _window_percentiles(old_rt, new_rt, fs):
+    counts = {}
+    for k, v in new_rt.items():
+        d = v - old_rt.get(k, 0)
+        if d > 0:
+            counts[int(k)] = d
+
+    total = sum(counts.values())
+    if not total:
+        return [None for f in fs]
+
+    keys = sorted(counts.keys())
+    result = []
+    for f in fs:
+        acc = 0
+        target = total * f
+        for k in keys:
+            acc += counts[k]
+            if acc >= target:
+                result.append(k)
+                break
+    return result
+
+
+class RollingDistrib(object):
+    """Keeps, for each (name, method) key, a bounded window of full
+    distribution entries from a tailed LOCUST_EXTRA_STATS_DISTRIB
+    file."""
+
+    def __init__(self, path, window_s, max_entries):
+        self._tailer = FileTailer(path) if path else None
+        self._window_s = window_s
+        self._max_entries = max_entries
+        self._entries = {}
+
+    def poll(self):
+        if not self._tailer:
+            return False
+
+        lines, reset = self._tailer.read_lines()
+
+        if reset:
+            self._entries.clear()
+
+        for line in lines:
+            try:
+                info = json.loads(line)
+            except ValueError:
+                _logger.warning('Skipping malformed distrib line')
+                continue
+            info['at'] = pd.Timestamp(info['timestamp']).timestamp()
+            key = (info['name'], info.get('method'))
+            entries = self._entries.get(key)
+            if entries is None:
+                entries = collections.deque(maxlen=self._max_entries)
+                self._entries[key] = entries
+            entries.append(info)
+
+        return reset or len(lines) > 0
+
+    def summary(self):
+        result = []
+        for (name, method), entries in sorted(
+                self._entries.items(), key=lambda t: (t[0][0], t[0][1] or '')):
+            last = entries[-1]
+            first = last
+            for entry in reversed(entries):
+                if last['at'] - entry['at'] > self._window_s:
+                    break
+                first = entry
+            if first is last or first['num_requests'] > last['num_requests']:
+                # Single entry, or stats reset within the window.
+                old_rt = {}
+                dt = None
+            else:
+                old_rt = first['response_times']
+                dt = last['at'] - first['at']
+            dn = last['num_requests'] - (
+                first['num_requests'] if dt else 0)
+            result.append({
+                'name': name,
+                'method': method,
+                'rps': dn / dt if dt else last.get('total_rps') or 0,
+                'percentiles': _window_percentiles(
+                    old_rt, last['response_times'], _percentiles)
+            })
+        return result
+
+
+class LiveReport(object):
+    def __init__(self,
+                 *,
+                 stats_csv,
+                 zk_metrics_csv,
+                 stats_distrib=None,
+                 options=None,
+                 max_rows=100000,
+                 window_s=10):
+        self._ls = RollingCsv(stats_csv, max_rows)
+        self._zkm = RollingCsv(zk_metrics_csv, max_rows)
+        self._distrib = RollingDistrib(stats_distrib, window_s,
+                                       max(int(window_s * 20), 2))
+        self._options = options or {}
+        self._svgs = {}
+        self.lock = threading.Lock()
+        self.generation = 0
+
+    def poll(self):
+        changed = self._ls.poll()
+        changed = self._zkm.poll() or changed
+        changed = self._distrib.poll() or changed
+        if changed:
+            self.generation += 1
+        return changed
+
+    def status(self):
+        return {
+            'generation': self.generation,
+            'num_ops': len(self.ops()),
+            'ls_rows': len(self._ls),
+            'zkm_rows': len(self._zkm)
+        }
+
+    def distrib_summary(self):
+        return self._distrib.summary()
+
+    def ops(self):
+        df = self._ls.df()
+        if df is None:
+            return []
+
+        df = df[df.name != 'Total']
+        ops = set(zip(df.name.map(str), df.method.fillna('UNNAMED_OP')))
+
+        return sorted(ops)
+
+    def kinds(self):
+        zkm_df = self._zkm.df()
+        if zkm_df is None or not len(zkm_df):
+            return _plot_kinds
+        return _plot_kinds + _zkm_plot_kinds
+
+    def _group(self, task_set, op):
+        ls_df = gen_op_md.extract_ls_subset(self._ls.df(), task_set, op)
+
+        zkm_df = self._zkm.df()
+        if zkm_df is not None and len(ls_df) > 0:
+            pick = (zkm_df.index >= ls_df.index.min()) & (
+                zkm_df.index <= ls_df.index.max())
+            zkm_df = zkm_df[pick]
+
+        group = gen_op_md.Group(None, None, ls_df, zkm_df)
+        group.is_unique = True
+
+        return group
+
+    def _plot(self, group, kind):
+        options = self._options
+
+        if kind == 'latencies':
+            if not len(group.merged_client_stats()):
+                return None
+            plotter = gen_op_md.LatenciesPlotter(options)
+        elif kind == 'errors':
+            plotter = gen_op_md.ErrorsPlotter(options)
+        elif kind == 'request_frequency':
+            plotter = gen_op_md.RequestFrequencyPlotter(options)
+        elif kind == 'client_count':
+            plotter = gen_op_md.ClientCountPlotter(options)
+        elif kind in _zkm_plot_kinds:
+            if group.zkm_df is None or not len(group.zkm_df):
+                return None
+            plot_def = gen_op_md.get_zkm_plot_def(kind)
+            plotter = gen_op_md.ZooKeeperMetricsPlotter(plot_def, options)
+        else:
+            raise ValueError(f'Unknown plot kind {kind!r}')
+
+        return plotter.plot([group]) or None
+
+    def render_svg(self, task_set, op, kind):
+        """Returns the SVG rendering of a plot, or None if there is nothing
+        to plot.  Renderings are cached until new data arrives."""
+        key = (task_set, op, kind)
+        cached = self._svgs.get(key)
+        if cached and cached[0] == self.generation:
+            return cached[1]
+
+        svg = None
+        fig_infos = self._plot(self._group(task_set, op), kind)
+        if fig_infos:
+            f = io.StringIO()
+            fig_infos[0].fig.savefig(f, format='svg')
+            svg = f.getvalue()
+            for fig_info in fig_infos:
+                plt.close(fig_info.fig)
+
+        self._svgs[key] = (self.generation, svg)
+
+        return svg
+
+
+def create_app(live, *, refresh_ms=2000):
+    app = Flask(__name__)
+
+    @app.route('/')
+    def index():
+        with live.lock:
+            ops = live.ops()
+            kinds = live.kinds()
+            generation = live.generation
+        return render_template_string(
+            _index_template,
+            ops=ops,
+            kinds=kinds,
+            generation=generation,
+            refresh_ms=refresh_ms)
+
+    @app.route('/status.json')
+    def status():
+        with live.lock:
+            return jsonify(live.status())
+
+    @app.route('/distrib.json')
+    def distrib():
+        with live.lock:
+            return jsonify(live.distrib_summary())
+
+    @app.route('/plot/<task_set>/<op>/<kind>.svg')
+    def plot(task_set, op, kind):
+        if kind not in _plot_kinds and kind not in _zkm_plot_kinds:
+            abort(404)
+        with live.lock:
+            if (task_set, op) not in live.ops():
+                abort(404)
+            svg = live.render_svg(task_set, op, kind)
+        if svg is None:
+            abort(404)
+        return Response(svg, mimetype='image/svg+xml')
+
+    return app
+
+
+def poll_loop(live, poll_s):
+    while True:
+        try:
+            with live.lock:
+                live.poll()
+        except Exception:
+            _logger.exception('Polling live report inputs')
+        time.sleep(poll_s)
+
+
+def serve(live, *, host, port, poll_ms, refresh_ms):
+    poller = threading.Thread(
+        target=poll_loop, args=(live, poll_ms / 1000), daemon=True)
+    poller.start()
+
+    app = create_app(live, refresh_ms=refresh_ms)
+    app.run(host=host, port=port, threaded=True)
@@ -2,6 +2,7 @@ SCRIPT_DIR := $(dir $(lastword $(MAKEFILE_LIST)))
 
 LOCUST_EXTRA_STATS_CSV = locust-stats.csv
 ZK_LOCUST_ZK_METRICS_CSV = zk-metrics.csv
+ZK_DISPATCH_PERTURBATIONS =
 
 FRAGS_DIR = fragments
 FRAGS_ID =
@@ -130,11 +131,22 @@ $(FRAGS_DIR)/fragments.jsonl:			\
 	cat /dev/null $(filter $*/%,$(TASK_SET_FRAG_MDS)) >$@.tmp
 	@mv $@.tmp $@
 
-report.md: $(TASK_SET_MDS)
+PERTURBATIONS_MD = $(if $(ZK_DISPATCH_PERTURBATIONS),perturbations.md)
+
+perturbations.md:				\
+		$(ZK_DISPATCH_PERTURBATIONS)	\
+		$(SCRIPT_DIR)/gen_perturbations_md.py
+	@echo '  PERTURBATIONS'
+	$(SCRIPT_DIR)/gen_perturbations_md.py	\
+	    $(ZK_DISPATCH_PERTURBATIONS)	\
+	    $@.tmp
+	@mv $@.tmp $@
+
+report.md: $(TASK_SET_MDS) $(PERTURBATIONS_MD)
 	@echo '  REPORT   $@'
 	echo '# Report' >$@.tmp
 	echo >>$@.tmp
-	cat /dev/null $(TASK_SET_MDS) >>$@.tmp
+	cat /dev/null $(PERTURBATIONS_MD) $(TASK_SET_MDS) >>$@.tmp
 	@mv $@.tmp $@
 
 report.html: report.md
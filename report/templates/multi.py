@@ -21,6 +21,10 @@ groups = [gen_op_md.load_group('.', group_data) for group_data in groups_data]
 
 _ = gen_op_md.LatenciesPlotter(plot_options).plot(groups)
 
+# ## Throughput vs. Latency
+
+_ = gen_op_md.ThroughputLatencyPlotter(plot_options).plot(groups)
+
 # ## Errors
 
 _ = gen_op_md.ErrorsPlotter(plot_options).plot(groups)
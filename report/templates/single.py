@@ -27,6 +27,10 @@ display(Markdown(gen_op_md.gen_summary_md(ls_merged_df, 1)))
 
 _ = gen_op_md.LatenciesPlotter(plot_options).plot([group])
 
+# ## Throughput vs. Latency
+
+_ = gen_op_md.ThroughputLatencyPlotter(plot_options).plot([group])
+
 # ## Errors
 
 _ = gen_op_md.ErrorsPlotter(plot_options).plot([group])
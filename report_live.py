@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import os.path
+
+import click
+
+_base = os.path.dirname(os.path.realpath(__file__))
+_report_scripts = os.path.join(_base, 'report')
+
+sys.path.append(_report_scripts)
+
+if True:
+    import live_server
+
+
+@click.command()
+@click.option(
+    '--metrics-dir',
+    default='.',
+    show_default=True,
+    help='Directory in which metrics are being collected')
+@click.option("--zk-metrics-csv", help="ZooKeeper metrics being collected")
+@click.option("--stats-csv", help="Locust metrics being collected")
+@click.option(
+    "--stats-distrib", help="Full Locust distributions being collected")
+@click.option(
+    "--option",
+    type=(str, str),
+    multiple=True,
+    help="Set named plot option")
+@click.option(
+    "--host", default='127.0.0.1', show_default=True, help="Bind address")
+@click.option(
+    "--port", type=click.INT, default=8090, show_default=True, help="Port")
+@click.option(
+    "--poll-ms",
+    type=click.INT,
+    default=1000,
+    show_default=True,
+    help="Delay between checks for new data")
+@click.option(
+    "--refresh-ms",
+    type=click.INT,
+    default=5000,
+    show_default=True,
+    help="Delay between browser-side refreshes")
+@click.option(
+    "--max-rows",
+    type=click.INT,
+    default=100000,
+    show_default=True,
+    help="Number of most recent CSV rows kept in memory, per file")
+@click.option(
+    "--window-s",
+    type=click.FLOAT,
+    default=10,
+    show_default=True,
+    help="Window for rolling distribution aggregates")
+def cli(metrics_dir, zk_metrics_csv, stats_csv, stats_distrib, option, host,
+        port, poll_ms, refresh_ms, max_rows, window_s):
+    live = live_server.LiveReport(
+        stats_csv=stats_csv or os.path.join(metrics_dir, 'locust-stats.csv'),
+        zk_metrics_csv=zk_metrics_csv
+        or os.path.join(metrics_dir, 'zk-metrics.csv'),
+        stats_distrib=stats_distrib
+        or os.path.join(metrics_dir, 'locust-distrib.jsonl'),
+        options={t[0]: t[1]
+                 for t in option},
+        max_rows=max_rows,
+        window_s=window_s)
+
+    live_server.serve(
+        live, host=host, port=port, poll_ms=poll_ms, refresh_ms=refresh_ms)
+
+
+if __name__ == "__main__":
+    cli()
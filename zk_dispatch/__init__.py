@@ -1,8 +1,8 @@
 from abc import ABCMeta, abstractmethod
 import re
 import os
-import subprocess
 import random
+import signal
 import time
 import logging
 import json
@@ -10,12 +10,17 @@ import json
 import requests
 
 import gevent
+import gevent.event
+import gevent.subprocess
 
 import locust.runners
 from locust import events
 
 from zk_locust import split_zk_hosts, split_zk_host_port
 
+from .recovery import RecoveryMonitor
+from .netem import LinkConditions, create_links
+
 _logger = logging.getLogger(__name__)
 
 _zk_admin_scheme = os.getenv('ZK_ADMIN_SCHEME', 'http')
@@ -37,13 +42,36 @@ _config_sleep_after_disable_ms = _configs.get('sleep_after_disable_ms', 2000)
 _config_sleep_after_enable_ms = _configs.get('sleep_after_enable_ms', 5000)
 
 _config_program = os.getenv('ZK_DISPATCH_PROGRAM')
+_config_trace = os.getenv('ZK_DISPATCH_TRACE')
+_config_replay = os.getenv('ZK_DISPATCH_REPLAY')
+_config_seed = os.getenv('ZK_DISPATCH_SEED')
+_config_perturbations = os.getenv('ZK_DISPATCH_PERTURBATIONS')
+
+_config_recovery_poll_ms = _configs.get('recovery_poll_ms', 50)
+_config_recovery_baseline_s = _configs.get('recovery_baseline_s', 10)
+_config_recovery_window_s = _configs.get('recovery_window_s', 1)
+_config_recovery_fraction = _configs.get('recovery_fraction', 0.9)
+_config_recovery_observe_s = _configs.get('recovery_observe_s', 60)
+
+_config_script_timeout_ms = _configs.get('script_timeout_ms', 60000)
+
+CONTROLLER_SHELL, CONTROLLER_SIGNAL, CONTROLLER_NETEM = [
+    'shell', 'signal', 'netem'
+]
 
-_initial_hatch_complete = False
+_config_controller = os.getenv('ZK_DISPATCH_CONTROLLER', CONTROLLER_SHELL)
+_config_pids = os.getenv('ZK_DISPATCH_PIDS')
+_config_proxies = os.getenv('ZK_DISPATCH_PROXIES')
+
+_initial_hatch_complete = gevent.event.Event()
+_initial_hatch_complete_at = None
 
 
 def on_hatch_complete(user_count):
-    global _initial_hatch_complete
-    _initial_hatch_complete = True
+    global _initial_hatch_complete_at
+    if _initial_hatch_complete_at is None:
+        _initial_hatch_complete_at = time.monotonic()
+    _initial_hatch_complete.set()
 
 
 events.hatch_complete += on_hatch_complete
@@ -133,17 +161,42 @@ class AbstractController(metaclass=ABCMeta):
 
 
 class ShellScriptController(AbstractController):
+    """Delegates actions to the `ZK_DISPATCH_DISABLE_SCRIPT` and
+    `ZK_DISPATCH_ENABLE_SCRIPT` shell commands.  These run as gevent
+    subprocesses, which do not block the event loop, and are killed
+    (and the action considered failed) after `timeout_ms`."""
+
+    def __init__(self, *, timeout_ms=_config_script_timeout_ms):
+        self.timeout_ms = timeout_ms
+        self.scripts = {
+            env_var: os.getenv(env_var)
+            for env_var in
+            ['ZK_DISPATCH_DISABLE_SCRIPT', 'ZK_DISPATCH_ENABLE_SCRIPT']
+        }
+        self.base_env = dict(os.environ)
+
     def _run_script(self, env_var, member):
-        script = os.getenv(env_var)
+        script = self.scripts.get(env_var)
         if not script:
             raise ValueError("Environment variable '%s' not set" % env_var)
         extra_env = {}
         for key in ['host_and_port', 'host', 'port', 'state']:
             extra_env['ZK_MEMBER_' + key.upper()] = str(getattr(member, key))
         _logger.debug("Invoking %s with %s" % (env_var, extra_env))
-        env = dict(os.environ)
+        env = dict(self.base_env)
         env.update(extra_env)
-        r = subprocess.call(script, shell=True, env=env)
+        # In its own process group, so that the whole script can be
+        # killed on timeout.
+        p = gevent.subprocess.Popen(
+            script, shell=True, env=env, start_new_session=True)
+        try:
+            r = p.wait(timeout=self.timeout_ms / 1000)
+        except gevent.subprocess.TimeoutExpired:
+            _logger.error('%s timed out after %dms; killing it', env_var,
+                          self.timeout_ms)
+            os.killpg(p.pid, signal.SIGKILL)
+            p.wait()
+            return False
         return r == 0
 
     def disable(self, member):
@@ -153,23 +206,224 @@ class ShellScriptController(AbstractController):
         return self._run_script('ZK_DISPATCH_ENABLE_SCRIPT', member)
 
 
-ACTION_DISABLE, ACTION_ENABLE = ['disable', 'enable']
+class SignalController(AbstractController):
+    """Disables (resp. enables) local ensemble members by sending
+    `SIGSTOP` (resp. `SIGCONT`) to their processes, which takes
+    effect within milliseconds.
+
+    `pids` maps member "host:port" specifications to either process
+    IDs or the paths of PID files; the latter are re-read on each
+    action, so that members can be restarted by a process supervisor.
+    It defaults to the JSON object in `ZK_DISPATCH_PIDS`."""
+
+    def __init__(self,
+                 *,
+                 pids=None,
+                 disable_signal=signal.SIGSTOP,
+                 enable_signal=signal.SIGCONT):
+        if pids is None:
+            if not _config_pids:
+                raise ValueError("Environment variable 'ZK_DISPATCH_PIDS' "
+                                 "not set")
+            pids = json.loads(_config_pids)
+        self.pids = pids
+        self.disable_signal = disable_signal
+        self.enable_signal = enable_signal
+
+    def _pid(self, member):
+        pid = self.pids.get(member.host_and_port)
+        if isinstance(pid, str):
+            with open(pid) as f:
+                pid = f.read().strip()
+        return int(pid) if pid is not None else None
+
+    def _signal(self, member, sig):
+        try:
+            pid = self._pid(member)
+        except (OSError, ValueError):
+            _logger.exception('Resolving PID of member %s', member)
+            return False
+        if pid is None:
+            _logger.error('No PID for member %s', member)
+            return False
+
+        _logger.debug('Sending signal %d to PID %d of member %s', sig, pid,
+                      member)
+        try:
+            os.kill(pid, sig)
+        except OSError:
+            _logger.exception('Signaling member %s', member)
+            return False
+        return True
+
+    def disable(self, member):
+        return self._signal(member, self.disable_signal)
+
+    def enable(self, member):
+        return self._signal(member, self.enable_signal)
+
+
+class NetworkFaultController(AbstractController):
+    """Injects network faults into the proxied links (see
+    `zk_dispatch.netem`) leading to ensemble members.  Disabling a
+    member partitions its links; enabling it heals them.  In addition,
+    `degrade` subjects them to arbitrary `LinkConditions`.
+
+    `links` defaults to proxies created according to the JSON list
+    in `ZK_DISPATCH_PROXIES`."""
+
+    def __init__(self, *, links=None, disable_conditions=None):
+        if links is None:
+            if not _config_proxies:
+                raise ValueError("Environment variable "
+                                 "'ZK_DISPATCH_PROXIES' not set")
+            links = create_links(
+                json.loads(_config_proxies), seed=_config_seed)
+        self.links = links
+        self.disable_conditions = disable_conditions or LinkConditions(
+            partitioned=True)
+
+    def degrade(self, member, conditions):
+        links = [l for l in self.links if l.member == member.host_and_port]
+        if not links:
+            _logger.error('No proxied link for member %s', member)
+            return False
+        for link in links:
+            link.set_conditions(conditions)
+        return True
+
+    def heal(self, member):
+        return self.degrade(member, LinkConditions())
+
+    def disable(self, member):
+        return self.degrade(member, self.disable_conditions)
+
+    def enable(self, member):
+        return self.heal(member)
+
+
+def create_controller(kind=_config_controller):
+    if kind == CONTROLLER_SHELL:
+        return ShellScriptController()
+    elif kind == CONTROLLER_SIGNAL:
+        return SignalController()
+    elif kind == CONTROLLER_NETEM:
+        return NetworkFaultController()
+    raise ValueError('Unknown controller kind %r' % kind)
+
+
+ACTION_DISABLE, ACTION_ENABLE, ACTION_DEGRADE, ACTION_HEAL = [
+    'disable', 'enable', 'degrade', 'heal'
+]
+
+
+class TraceWriter(object):
+    """Appends dispatcher actions, as JSON lines, to a trace file.
+
+    Each entry records the action, its target member (index and
+    host/port), whether it succeeded, the last-known states of all
+    members, and its time in seconds relative to the initial hatch
+    completion (`t`, null before it) and to the start of the
+    dispatcher (`t_run`)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'w')
+        self.start = time.monotonic()
+
+    def record(self, action, member, ok, members, conditions=None):
+        now = time.monotonic()
+        t = None
+        if _initial_hatch_complete_at is not None:
+            t = now - _initial_hatch_complete_at
+        entry = {
+            't': t,
+            't_run': now - self.start,
+            'timestamp': time.time(),
+            'action': action,
+            'member': members.index(member) if member in members else None,
+            'host_port': member.host_and_port,
+            'ok': ok,
+            'states': {m.host_and_port: m.state
+                       for m in members}
+        }
+        if conditions:
+            entry['conditions'] = conditions.to_json()
+        self.f.write(json.dumps(entry) + '\n')
+        self.f.flush()
+
+
+def load_trace(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def create_recovery_monitor(path=_config_perturbations):
+    if not path:
+        return None
+
+    monitor = RecoveryMonitor(
+        path=path,
+        member_factory=EnsembleMember,
+        poll_ms=_config_recovery_poll_ms,
+        baseline_s=_config_recovery_baseline_s,
+        window_s=_config_recovery_window_s,
+        fraction=_config_recovery_fraction,
+        observe_s=_config_recovery_observe_s)
+    monitor.register()
+
+    return monitor
 
 
 class AbstractDispatcher(metaclass=ABCMeta):
-    def __init__(self, *, controller=None):
-        self.controller = controller or ShellScriptController()
+    def __init__(self,
+                 *,
+                 controller=None,
+                 trace=_config_trace,
+                 seed=_config_seed,
+                 recovery=None):
+        self.controller = controller or create_controller()
+        self.members = []
+        self.quorum_size = None
+        self.tracer = TraceWriter(trace) if trace else None
+        # Seeded, when requested, for reproducible decisions.
+        self.random = random.Random(seed)
+        self.recovery = recovery or create_recovery_monitor()
 
     @abstractmethod
     def run(self, hosts_and_ports, quorum_size):
         pass
 
+    def _trace(self, action, member, ok, conditions=None):
+        if self.tracer:
+            self.tracer.record(action, member, ok, self.members, conditions)
+
     def disable(self, member):
-        if self.controller.disable(member):
+        ok = self.controller.disable(member)
+        if ok:
             member.note_disabled()
+        self._trace(ACTION_DISABLE, member, ok)
+        if ok and self.recovery:
+            self.recovery.on_disable(member, self.members, self.quorum_size)
 
     def enable(self, member):
-        self.controller.enable(member)
+        ok = self.controller.enable(member)
+        self._trace(ACTION_ENABLE, member, ok)
+
+    def _check_degradable(self):
+        if not hasattr(self.controller, 'degrade'):
+            raise ValueError('Controller %r cannot degrade links' %
+                             self.controller)
+
+    def degrade(self, member, conditions):
+        self._check_degradable()
+        ok = self.controller.degrade(member, conditions)
+        self._trace(ACTION_DEGRADE, member, ok, conditions)
+
+    def heal(self, member):
+        self._check_degradable()
+        ok = self.controller.heal(member)
+        self._trace(ACTION_HEAL, member, ok)
 
     def sleep_ms(self, ms, cause=None):
         msg = 'Sleeping %dms' % ms
@@ -190,13 +444,14 @@ class AbstractDispatcher(metaclass=ABCMeta):
             cause = None
         self.sleep_ms(ms, cause)
 
-    def wait_initial_hatch_complete(self, sleep_ms=250):
-        if _initial_hatch_complete:
+    def wait_initial_hatch_complete(self, sleep_ms=None):
+        # sleep_ms is ignored; kept for compatibility with the former
+        # polling implementation.
+        if _initial_hatch_complete.is_set():
             return
 
-        _logger.debug('Polling for initial hatch complete; %dms', sleep_ms)
-        while not _initial_hatch_complete:
-            gevent.sleep(sleep_ms / 1000)
+        _logger.debug('Waiting for initial hatch complete')
+        _initial_hatch_complete.wait()
         _logger.debug('Initial hatch complete')
 
     def ping_ensemble(self, members):
@@ -227,7 +482,7 @@ class AbstractDispatcher(metaclass=ABCMeta):
                                 key=EnsembleMember.last_disabled_sort_key)
             # Pick one of the candidates which haven't been disabled
             # for the longest time.
-            pick = random.choice([
+            pick = self.random.choice([
                 m for m in candidates
                 if m.last_disabled == candidates[0].last_disabled
             ])
@@ -242,6 +497,25 @@ class AbstractDispatcher(metaclass=ABCMeta):
         for member in downs:
             self.enable(member)
 
+    def degrade_leader(self, members, conditions):
+        ups, _ = self.ping_ensemble(members)
+        for member in ups:
+            if member.is_leader():
+                self.degrade(member, conditions)
+                break
+
+    def degrade_follower(self, members, conditions):
+        ups, _ = self.ping_ensemble(members)
+        followers = [m for m in ups if m.is_follower()]
+        if followers:
+            self.degrade(self.random.choice(followers), conditions)
+        else:
+            _logger.info('No follower to degrade among: %s', ups)
+
+    def heal_all(self, members):
+        for member in members:
+            self.heal(member)
+
 
 class RandomDispatcher(AbstractDispatcher):
     def __init__(self, **kwargs):
@@ -255,17 +529,20 @@ class RandomDispatcher(AbstractDispatcher):
         elif n_up >= len(members):
             action = ACTION_DISABLE
         else:
-            action = random.choice([ACTION_ENABLE, ACTION_DISABLE])
+            action = self.random.choice([ACTION_ENABLE, ACTION_DISABLE])
 
         if action == ACTION_ENABLE:
-            member = random.choice(downs)
+            member = self.random.choice(downs)
         else:
-            member = random.choice(ups)
+            member = self.random.choice(ups)
 
         return [action, member]
 
     def run(self, hosts_and_ports, quorum_size):
-        members = [EnsembleMember(hp) for hp in hosts_and_ports]
+        self.members = members = [
+            EnsembleMember(hp) for hp in hosts_and_ports
+        ]
+        self.quorum_size = quorum_size
         action = None
         while True:
             self.sleep_after(action)
@@ -303,8 +580,8 @@ class ProgrammedDispatcher(AbstractDispatcher):
             if self.pc >= len(self.program):
                 self.pc = 0
 
-    def _op_poll_initial_hatch_complete(self, sleep_ms):
-        self.wait_initial_hatch_complete(int(sleep_ms))
+    def _op_poll_initial_hatch_complete(self, sleep_ms=None):
+        self.wait_initial_hatch_complete()
 
     def _op_sleep(self, sleep_ms):
         self.sleep_ms(int(sleep_ms))
@@ -330,6 +607,22 @@ class ProgrammedDispatcher(AbstractDispatcher):
     def _op_enable_all(self):
         self.enable_all(self.members)
 
+    def _op_degrade(self, member_at, *conditions):
+        self.degrade(self.members[int(member_at)],
+                     LinkConditions.parse(conditions))
+
+    def _op_degrade_leader(self, *conditions):
+        self.degrade_leader(self.members, LinkConditions.parse(conditions))
+
+    def _op_degrade_follower(self, *conditions):
+        self.degrade_follower(self.members, LinkConditions.parse(conditions))
+
+    def _op_heal(self, member_at):
+        self.heal(self.members[int(member_at)])
+
+    def _op_heal_all(self):
+        self.heal_all(self.members)
+
     def _parse(self, program_text):
         program = []
         for line in re.split(r'\s*\n\s*', program_text):
@@ -347,7 +640,10 @@ class FunctionDispatcher(AbstractDispatcher):
         self.fn = fn
 
     def run(self, hosts_and_ports, quorum_size):
-        members = [EnsembleMember(hp) for hp in hosts_and_ports]
+        self.members = members = [
+            EnsembleMember(hp) for hp in hosts_and_ports
+        ]
+        self.quorum_size = quorum_size
         _logger.debug('Invoking function %r', self.fn)
         self.fn(
             controller=self,
@@ -356,6 +652,71 @@ class FunctionDispatcher(AbstractDispatcher):
             members=members)
 
 
+class ReplayDispatcher(AbstractDispatcher):
+    """Re-executes the actions of a trace recorded via
+    `ZK_DISPATCH_TRACE`, with the same timing: relative to the
+    initial hatch completion if they were recorded after it, or to
+    the start of the dispatcher otherwise.  Members are matched by
+    host/port, falling back to their index."""
+
+    def __init__(self, *, trace_entries, **kwargs):
+        super(ReplayDispatcher, self).__init__(**kwargs)
+
+        self.entries = trace_entries
+
+    def _find_member(self, entry):
+        for member in self.members:
+            if member.host_and_port == entry.get('host_port'):
+                return member
+        index = entry.get('member')
+        if index is not None and index < len(self.members):
+            return self.members[index]
+        return None
+
+    def _sleep_until(self, at, cause):
+        delay = at - time.monotonic()
+        if delay > 0:
+            self.sleep_ms(delay * 1000, cause)
+
+    def run(self, hosts_and_ports, quorum_size):
+        self.members = [EnsembleMember(hp) for hp in hosts_and_ports]
+        self.quorum_size = quorum_size
+        start = time.monotonic()
+
+        for i, entry in enumerate(self.entries):
+            if entry.get('t') is not None:
+                self.wait_initial_hatch_complete()
+                at = _initial_hatch_complete_at + entry['t']
+            else:
+                at = start + entry['t_run']
+
+            member = self._find_member(entry)
+            if not member:
+                _logger.error('No member for trace entry %d: %r', i, entry)
+                continue
+
+            self._sleep_until(at, 'before replaying entry %d' % i)
+
+            # Refresh states, so that they can be compared with the
+            # recorded ones.
+            self.ping_ensemble(self.members)
+            _logger.debug('Replaying entry %d: %s member %s', i,
+                          entry['action'], member)
+            if entry['action'] == ACTION_DISABLE:
+                self.disable(member)
+            elif entry['action'] == ACTION_ENABLE:
+                self.enable(member)
+            elif entry['action'] == ACTION_DEGRADE:
+                self.degrade(member, LinkConditions(**entry['conditions']))
+            elif entry['action'] == ACTION_HEAL:
+                self.heal(member)
+            else:
+                _logger.error('Unknown action in trace entry %d: %r', i,
+                              entry)
+
+        _logger.info('Replayed %d trace entries', len(self.entries))
+
+
 def run_dispatcher_in_master(dispatcher, fn):
     while not locust.runners.locust_runner:
         gevent.sleep(0.1)
@@ -366,6 +727,9 @@ def run_dispatcher_in_master(dispatcher, fn):
     if not dispatcher:
         if fn:
             dispatcher = FunctionDispatcher(fn=fn)
+        elif _config_replay:
+            dispatcher = ReplayDispatcher(
+                trace_entries=load_trace(_config_replay))
         elif _config_program:
             dispatcher = ProgrammedDispatcher(program=_config_program)
         else:
@@ -0,0 +1,241 @@
+import time
+import random
+import socket
+import struct
+import logging
+
+import gevent
+import gevent.event
+import gevent.queue
+import gevent.server
+import gevent.socket
+
+from zk_locust import split_zk_host_port
+
+_logger = logging.getLogger(__name__)
+
+_chunk_size = 64 * 1024
+
+
+class LinkConditions(object):
+    """Degraded-network conditions applied, in each direction, to the
+    traffic of a proxied link:
+
+      * `latency_ms`: Added one-way delay;
+
+      * `jitter_ms`: Maximum random variation of the delay (uniform,
+        in both directions); data is never reordered;
+
+      * `bandwidth`: Cap, in bytes per second, or 0 for none;
+
+      * `loss`: Probability, per forwarded chunk, of a "drop".  As the
+        proxy terminates TCP, a drop shows up as it would to the
+        endpoints: the chunk (and everything queued after it) is
+        delayed by a retransmission timeout of `rto_ms`;
+
+      * `partitioned`: If set, nothing is forwarded until the link is
+        healed.  Data is buffered in the meantime, as TCP would
+        retransmit it; connections are reset instead if
+        `reset_on_partition` is set."""
+
+    def __init__(self,
+                 *,
+                 latency_ms=0,
+                 jitter_ms=0,
+                 bandwidth=0,
+                 loss=0,
+                 rto_ms=200,
+                 partitioned=False,
+                 reset_on_partition=False):
+        self.latency_ms = float(latency_ms)
+        self.jitter_ms = float(jitter_ms)
+        self.bandwidth = float(bandwidth)
+        self.loss = float(loss)
+        self.rto_ms = float(rto_ms)
+        self.partitioned = partitioned
+        self.reset_on_partition = reset_on_partition
+
+    @classmethod
+    def parse(cls, args):
+        """Builds conditions out of `key=value` strings, as used in
+        dispatcher programs."""
+        kwargs = {}
+        for arg in args:
+            key, sep, value = arg.partition('=')
+            if not sep:
+                raise ValueError('Expected key=value, got %r' % arg)
+            if key in ['partitioned', 'reset_on_partition']:
+                kwargs[key] = value.lower() in ['1', 'true', 'yes']
+            else:
+                kwargs[key] = float(value)
+        return cls(**kwargs)
+
+    def to_json(self):
+        return dict(self.__dict__)
+
+    def delay_s(self, rng):
+        delay_ms = self.latency_ms
+        if self.jitter_ms:
+            delay_ms += rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if self.loss and rng.random() < self.loss:
+            delay_ms += self.rto_ms
+        return max(delay_ms, 0) / 1000
+
+    def __repr__(self):
+        return 'LinkConditions(%s)' % ', '.join(
+            '%s=%r' % kv for kv in sorted(self.__dict__.items()))
+
+
+_healthy = LinkConditions()
+
+
+class _Pump(object):
+    """Forwards one direction of a proxied connection, applying the
+    link's current conditions."""
+
+    def __init__(self, link, src, dst, rng):
+        self.link = link
+        self.src = src
+        self.dst = dst
+        self.rng = rng
+        self.queue = gevent.queue.Queue()
+        # When the previous chunk is (or was) due; keeps data in order.
+        self.last_due = 0
+
+    def read(self):
+        try:
+            while True:
+                data = self.src.recv(_chunk_size)
+                if not data:
+                    break
+                now = time.monotonic()
+                conditions = self.link.conditions
+                due = max(now + conditions.delay_s(self.rng), self.last_due)
+                if conditions.bandwidth:
+                    due += len(data) / conditions.bandwidth
+                self.last_due = due
+                self.queue.put((due, data))
+        except OSError:
+            pass
+        finally:
+            self.queue.put((None, None))
+
+    def write(self):
+        try:
+            while True:
+                due, data = self.queue.get()
+                if data is None:
+                    break
+                delay = due - time.monotonic()
+                if delay > 0:
+                    gevent.sleep(delay)
+                while self.link.conditions.partitioned:
+                    self.link.healed.wait()
+                self.dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in [self.src, self.dst]:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class ProxiedLink(object):
+    """A TCP proxy, listening on `listen` and forwarding to `target`
+    (both "host:port" specifications), whose traffic is subject to
+    adjustable `LinkConditions`.  `member` denotes the ensemble member
+    the link leads to, and defaults to `listen`, as clients use the
+    proxy's address in their connect string."""
+
+    def __init__(self, *, listen, target, member=None, seed=None):
+        self.listen = listen
+        self.target = target
+        self.member = member or listen
+        self.conditions = _healthy
+        self.healed = gevent.event.Event()
+        self.healed.set()
+        self.rng = random.Random(seed)
+        self.connections = set()
+        self.server = None
+
+    def start(self):
+        host, port = split_zk_host_port(self.listen)
+        self.server = gevent.server.StreamServer((host, port), self._handle)
+        self.server.start()
+        _logger.info('Proxying %s to %s (member %s)', self.listen,
+                     self.target, self.member)
+
+    def stop(self):
+        if self.server:
+            self.server.stop()
+            self.server = None
+        self._reset_connections()
+
+    def _reset_connections(self):
+        for sock in list(self.connections):
+            try:
+                # Zero linger time: close with RST.
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                struct.pack('ii', 1, 0))
+                sock.close()
+            except OSError:
+                pass
+        self.connections.clear()
+
+    def set_conditions(self, conditions):
+        _logger.info('Link %s -> %s: %r', self.listen, self.target,
+                     conditions)
+        self.conditions = conditions
+        if conditions.partitioned:
+            self.healed.clear()
+            if conditions.reset_on_partition:
+                self._reset_connections()
+        else:
+            self.healed.set()
+
+    def _handle(self, client, address):
+        if self.conditions.partitioned and \
+           self.conditions.reset_on_partition:
+            client.close()
+            return
+
+        try:
+            upstream = gevent.socket.create_connection(
+                split_zk_host_port(self.target))
+        except OSError:
+            _logger.exception('Connecting to %s', self.target)
+            client.close()
+            return
+
+        for sock in [client, upstream]:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connections.add(sock)
+
+        pumps = [
+            _Pump(self, client, upstream, self.rng),
+            _Pump(self, upstream, client, self.rng)
+        ]
+        greenlets = [gevent.spawn(pump.write) for pump in pumps]
+        greenlets += [gevent.spawn(pump.read) for pump in pumps]
+        gevent.joinall(greenlets)
+
+        for sock in [client, upstream]:
+            self.connections.discard(sock)
+            sock.close()
+
+
+def create_links(specs, *, seed=None):
+    """Creates and starts the links described by `specs`, a list of
+    dicts with `listen`, `target` and optional `member` keys."""
+    links = []
+    for i, spec in enumerate(specs):
+        link = ProxiedLink(
+            listen=spec['listen'],
+            target=spec['target'],
+            member=spec.get('member'),
+            seed=None if seed is None else '%s/%d' % (seed, i))
+        link.start()
+        links.append(link)
+    return links
@@ -0,0 +1,294 @@
+import json
+import time
+import logging
+
+from collections import deque
+
+import gevent
+
+from locust import events
+
+from locust_extra import stats as extra_stats
+from locust_extra.output import format_timestamp, ensure_output
+
+_logger = logging.getLogger(__name__)
+
+_session_expired = 'SessionExpiredError()'
+
+KIND_EVENT, KIND_PERTURBATION = ['event', 'perturbation']
+
+EVENT_FAULT, EVENT_LEADER_LOST, EVENT_LEADER_ELECTED, \
+    EVENT_THROUGHPUT_RECOVERED, EVENT_CLOSED = [
+        'fault', 'leader_lost', 'leader_elected', 'throughput_recovered',
+        'closed'
+    ]
+
+
+def _count_errors(errors, error):
+    # `errors` is a {(name, method): {error: count}} map.
+    return sum(op_errors.get(error, 0) for op_errors in errors.values())
+
+
+class _Tick(object):
+    def __init__(self, at, num_requests, num_failures, sessions_expired):
+        self.at = at
+        self.num_requests = num_requests
+        self.num_failures = num_failures
+        self.sessions_expired = sessions_expired
+
+
+class Perturbation(object):
+    """The measurements associated with one disable action.  All
+    durations are in seconds, relative to the action."""
+
+    def __init__(self, id, action, host_port, was_leader, at, tick):
+        self.id = id
+        self.action = action
+        self.host_port = host_port
+        self.was_leader = was_leader
+        self.at = at
+        self.timestamp = format_timestamp()
+        self.tick = tick
+
+        self.leader_lost_s = None
+        self.leader_elected_s = None
+        self.new_leader = None
+
+        self.baseline_rps = None
+        self.min_rps = None
+        self.throughput_recovery_s = None
+
+        self.failures = 0
+        self.sessions_expired = 0
+
+        self.closed = False
+
+    def awaits_leader(self):
+        return self.was_leader and self.leader_elected_s is None
+
+    def awaits_throughput(self):
+        return bool(self.baseline_rps) and self.throughput_recovery_s is None
+
+    def is_recovered(self):
+        return not (self.awaits_leader() or self.awaits_throughput())
+
+    def mttr_s(self):
+        """Time to full recovery: the latest of the leader election
+        and throughput recovery, or None if incomplete."""
+        if not self.is_recovered():
+            return None
+        parts = [
+            v for v in [self.leader_elected_s, self.throughput_recovery_s]
+            if v is not None
+        ]
+        return max(parts) if parts else None
+
+    def to_json(self):
+        election_s = None
+        if self.leader_elected_s is not None and \
+           self.leader_lost_s is not None:
+            election_s = self.leader_elected_s - self.leader_lost_s
+
+        return {
+            'kind': KIND_PERTURBATION,
+            'id': self.id,
+            'timestamp': self.timestamp,
+            'action': self.action,
+            'host_port': self.host_port,
+            'was_leader': self.was_leader,
+            'leader_lost_s': self.leader_lost_s,
+            'leader_elected_s': self.leader_elected_s,
+            'election_s': election_s,
+            'new_leader': self.new_leader,
+            'baseline_rps': self.baseline_rps,
+            'min_rps': self.min_rps,
+            'throughput_recovery_s': self.throughput_recovery_s,
+            'failures': self.failures,
+            'sessions_expired': self.sessions_expired,
+            'mttr_s': self.mttr_s(),
+            'recovered': self.is_recovered()
+        }
+
+
+class RecoveryMonitor(object):
+    """Measures how the ensemble and its clients recover from the
+    disable actions of a dispatcher.
+
+    After a successful disable, the members' admin ports are polled
+    every `poll_ms` to detect the loss of the leader and the election
+    of a new one (a member reporting `leader` alongside a quorum of
+    serving members).  In parallel, "Total" stats ticks (see
+    `locust_extra.stats.stats_tick`) are used to determine when the
+    request rate, over `window_s`, gets back to `fraction` of its
+    average over the `baseline_s` preceding the action, and to count
+    failures and session expirations.
+
+    Events are appended, as JSON lines, to `path` as they are
+    detected.  Failures and session expirations keep being counted
+    until the perturbation is closed--after `observe_s`, when the next
+    one starts, or when Locust quits--at which point its summary is
+    appended as well."""
+
+    def __init__(self,
+                 *,
+                 path,
+                 member_factory,
+                 poll_ms=50,
+                 baseline_s=10,
+                 window_s=1,
+                 fraction=0.9,
+                 observe_s=60):
+        self.path = path
+        self.member_factory = member_factory
+        self.poll_ms = poll_ms
+        self.baseline_s = baseline_s
+        self.window_s = window_s
+        self.fraction = fraction
+        self.observe_s = observe_s
+
+        self._ticks = deque()
+        self._next_id = 0
+        self._current = None
+
+    def register(self):
+        extra_stats.stats_tick += self.on_stats_tick
+        events.quitting += self.on_quitting
+
+    def _write(self, entry):
+        output = ensure_output(self.path, for_csv=False)
+        if not output.f:
+            return
+
+        s = json.dumps(entry, ensure_ascii=True, indent=None)
+        with output.lock:
+            output.f.write(s + '\n')
+            output.f.flush()
+
+    def _event(self, p, event, at, **kwargs):
+        entry = {
+            'kind': KIND_EVENT,
+            'event': event,
+            'id': p.id,
+            'timestamp': format_timestamp(),
+            't_s': at - p.at
+        }
+        entry.update(kwargs)
+        _logger.info('Perturbation %d: %s at %.3fs %r', p.id, event,
+                     at - p.at, kwargs)
+        self._write(entry)
+
+    def _rate(self, start, end):
+        first = None
+        last = None
+        for tick in self._ticks:
+            if tick.at <= start:
+                first = tick
+            if tick.at <= end:
+                last = tick
+        if not first and self._ticks:
+            first = self._ticks[0]
+        if not first or not last or last.at <= first.at:
+            return None
+        return (last.num_requests - first.num_requests) / (last.at -
+                                                           first.at)
+
+    def on_disable(self, member, members, quorum_size):
+        if self._current:
+            self._close(self._current)
+
+        now = time.monotonic()
+        p = Perturbation(self._next_id, 'disable', member.host_and_port,
+                         member.is_leader(), now,
+                         self._ticks[-1] if self._ticks else None)
+        self._next_id += 1
+        self._current = p
+
+        rps = self._rate(now - self.baseline_s, now)
+        if rps and self._ticks[0].at <= now - self.baseline_s / 2:
+            # Only trusted if most of the baseline period is covered.
+            p.baseline_rps = rps
+
+        self._event(p, EVENT_FAULT, now, host_port=p.host_port,
+                    was_leader=p.was_leader, baseline_rps=p.baseline_rps)
+
+        if p.was_leader:
+            gevent.spawn(self._poll_election, p,
+                         [m.host_and_port for m in members], quorum_size)
+        gevent.spawn_later(self.observe_s, self._close, p)
+
+    def _poll_election(self, p, hosts_and_ports, quorum_size):
+        probes = [self.member_factory(hp) for hp in hosts_and_ports]
+
+        while not p.closed and p.awaits_leader():
+            gevent.joinall([gevent.spawn(m.ping) for m in probes])
+            now = time.monotonic()
+
+            leaders = [m for m in probes if m.is_leader()]
+            n_up = len([m for m in probes if m.is_up()])
+
+            if p.leader_lost_s is None:
+                if not leaders or leaders[0].host_and_port != p.host_port:
+                    p.leader_lost_s = now - p.at
+                    self._event(p, EVENT_LEADER_LOST, now)
+            if p.leader_lost_s is not None and leaders and \
+               n_up >= quorum_size:
+                p.leader_elected_s = now - p.at
+                p.new_leader = leaders[0].host_and_port
+                self._event(p, EVENT_LEADER_ELECTED, now,
+                            host_port=p.new_leader)
+                break
+
+            gevent.sleep(self.poll_ms / 1000)
+
+    def on_stats_tick(self, stats, errors, user_count, **kwargs):
+        now = time.monotonic()
+        tick = _Tick(now, stats.num_requests, stats.num_failures,
+                     _count_errors(errors, _session_expired))
+
+        if self._ticks and tick.num_requests < self._ticks[-1].num_requests:
+            # Stats were reset.
+            self._ticks.clear()
+            if self._current:
+                self._current.tick = None
+        self._ticks.append(tick)
+
+        horizon = max(self.baseline_s, self.window_s) * 2
+        while len(self._ticks) > 2 and self._ticks[1].at < now - horizon:
+            self._ticks.popleft()
+
+        p = self._current
+        if not p or p.closed:
+            return
+
+        base = p.tick or _Tick(p.at, 0, 0, 0)
+        p.failures = max(tick.num_failures - base.num_failures, 0)
+        p.sessions_expired = max(
+            tick.sessions_expired - base.sessions_expired, 0)
+
+        if now - p.at < self.window_s:
+            return
+
+        rps = self._rate(max(now - self.window_s, p.at), now)
+        if rps is None:
+            return
+
+        p.min_rps = rps if p.min_rps is None else min(p.min_rps, rps)
+
+        if p.awaits_throughput() and rps >= p.baseline_rps * self.fraction:
+            p.throughput_recovery_s = now - p.at
+            self._event(p, EVENT_THROUGHPUT_RECOVERED, now, rps=rps)
+
+    def on_quitting(self, **kwargs):
+        if self._current:
+            self._close(self._current)
+
+    def _close(self, p):
+        if p.closed:
+            return
+        p.closed = True
+        if self._current is p:
+            self._current = None
+
+        self._event(p, EVENT_CLOSED, time.monotonic(),
+                    recovered=p.is_recovered(), mttr_s=p.mttr_s())
+        self._write(p.to_json())
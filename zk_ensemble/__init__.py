@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import logging
+import subprocess
+
+import requests
+
+_logger = logging.getLogger(__name__)
+
+MODE_AUTO, MODE_ZOOKEEPER, MODE_STANDIN = ['auto', 'zookeeper', 'standin']
+
+_zookeeper_home = os.getenv('ZK_ENSEMBLE_ZOOKEEPER_HOME')
+
+
+def find_zkserver_sh(zookeeper_home=_zookeeper_home):
+    """Returns the path of a local ZooKeeper install's `zkServer.sh`,
+    or None."""
+    if zookeeper_home:
+        path = os.path.join(zookeeper_home, 'bin', 'zkServer.sh')
+        return path if os.access(path, os.X_OK) else None
+    return shutil.which('zkServer.sh')
+
+
+def _python_env():
+    # Makes this package importable by `python -m` subprocesses.
+    env = dict(os.environ)
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    path = env.get('PYTHONPATH')
+    env['PYTHONPATH'] = base + (os.pathsep + path if path else '')
+    return env
+
+
+def _free_port(host):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+class LocalMember(object):
+    def __init__(self, id, host, client_port, admin_port, base_dir):
+        self.id = id
+        self.host = host
+        self.client_port = client_port
+        self.admin_port = admin_port
+        self.dir = os.path.join(base_dir, 'member-%d' % id)
+        self.pid_path = os.path.join(self.dir, 'pid')
+        self.process = None
+
+    @property
+    def host_and_port(self):
+        return '%s:%d' % (self.host, self.client_port)
+
+    def monitor(self, timeout_s=0.5):
+        url = 'http://%s:%d/commands/monitor' % (self.host, self.admin_port)
+        try:
+            r = requests.get(url, timeout=timeout_s)
+            r.raise_for_status()
+            return r.json()
+        except (requests.RequestException, ValueError):
+            return None
+
+    def spawn(self, args, env=None):
+        os.makedirs(self.dir, exist_ok=True)
+        with open(os.path.join(self.dir, 'out.log'), 'ab') as out:
+            self.process = subprocess.Popen(
+                args, stdout=out, stderr=subprocess.STDOUT, env=env)
+        with open(self.pid_path, 'w') as f:
+            f.write('%d\n' % self.process.pid)
+
+
+class LocalEnsemble(object):
+    """An N-member ensemble running on the local machine, with each
+    member on its own loopback address (`address_prefix` followed by
+    1..N), so that all of them can use the same client and admin
+    ports--as the load generators and dispatcher expect.  (This works
+    out of the box on Linux; other systems may require loopback
+    aliases.)
+
+    In `zookeeper` mode, members are ZooKeeper servers from a local
+    install (see `find_zkserver_sh`).  In `standin` mode, they are
+    lightweight front ends (`zk_ensemble.member`) to a shared
+    in-memory server (`zk_ensemble.server`) which implements the
+    commonly-used subset of the client protocol and simulates leader
+    elections.  `auto` picks the former if available.
+
+    Either way, each member is a separate process, whose PID is
+    written to `member-<id>/pid` in `base_dir`, so that it can be
+    paused and resumed by the `signal` dispatcher controller."""
+
+    def __init__(self,
+                 *,
+                 size=3,
+                 base_dir,
+                 mode=MODE_AUTO,
+                 address_prefix='127.0.100.',
+                 client_port=2181,
+                 admin_port=8080,
+                 zookeeper_home=_zookeeper_home,
+                 tick_ms=2000,
+                 election_ms=200):
+        self.base_dir = os.path.abspath(base_dir)
+        self.zkserver_sh = find_zkserver_sh(zookeeper_home)
+
+        if mode == MODE_AUTO:
+            mode = MODE_ZOOKEEPER if self.zkserver_sh else MODE_STANDIN
+        elif mode == MODE_ZOOKEEPER and not self.zkserver_sh:
+            raise ValueError('No local ZooKeeper install found; please set '
+                             'ZK_ENSEMBLE_ZOOKEEPER_HOME')
+        self.mode = mode
+
+        self.admin_port = admin_port
+        self.tick_ms = tick_ms
+        self.election_ms = election_ms
+        self.members = [
+            LocalMember(i + 1, '%s%d' % (address_prefix, i + 1),
+                        client_port, admin_port, self.base_dir)
+            for i in range(size)
+        ]
+        self.server_process = None
+
+    def connect_string(self):
+        return ','.join(m.host_and_port for m in self.members)
+
+    def env(self):
+        """Returns the environment variables directing `zk_locust`,
+        `zk_metrics` and `zk_dispatch` at the ensemble."""
+        return {
+            'ZK_LOCUST_HOSTS': self.connect_string(),
+            'ZK_ADMIN_PORT': str(self.admin_port),
+            'ZK_DISPATCH_CONTROLLER': 'signal',
+            'ZK_DISPATCH_PIDS': json.dumps(
+                {m.host_and_port: m.pid_path
+                 for m in self.members})
+        }
+
+    def write_env(self, path):
+        """Writes `env()` as a shell script which does not override
+        already-set variables."""
+        with open(path + '.tmp', 'w') as f:
+            for key, value in sorted(self.env().items()):
+                quoted = "'%s'" % value.replace("'", "'\\''")
+                f.write('if [ -z "$%s" ]; then %s=%s; fi\nexport %s\n' %
+                        (key, key, quoted, key))
+        os.rename(path + '.tmp', path)
+
+    def _start_zookeeper(self):
+        servers = [
+            'server.%d=%s:2888:3888' % (m.id, m.host) for m in self.members
+        ]
+        for m in self.members:
+            data_dir = os.path.join(m.dir, 'data')
+            os.makedirs(data_dir, exist_ok=True)
+            with open(os.path.join(data_dir, 'myid'), 'w') as f:
+                f.write('%d\n' % m.id)
+
+            cfg_path = os.path.join(m.dir, 'zoo.cfg')
+            with open(cfg_path, 'w') as f:
+                f.write('\n'.join([
+                    'tickTime=%d' % self.tick_ms, 'initLimit=10',
+                    'syncLimit=5',
+                    'dataDir=%s' % data_dir,
+                    'clientPort=%d' % m.client_port,
+                    'clientPortAddress=%s' % m.host,
+                    'admin.serverAddress=%s' % m.host,
+                    'admin.serverPort=%d' % m.admin_port,
+                    '4lw.commands.whitelist=*'
+                ] + servers) + '\n')
+
+            env = dict(os.environ)
+            env['ZOO_LOG_DIR'] = os.path.join(m.dir, 'logs')
+            # `start-foreground` execs the JVM, whose PID is thus known.
+            m.spawn([self.zkserver_sh, 'start-foreground', cfg_path], env=env)
+
+    def _start_standin(self):
+        server_addr = '127.0.0.1:%d' % _free_port('127.0.0.1')
+        control_addr = '127.0.0.1:%d' % _free_port('127.0.0.1')
+
+        env = _python_env()
+
+        os.makedirs(self.base_dir, exist_ok=True)
+        with open(os.path.join(self.base_dir, 'server.log'), 'ab') as out:
+            self.server_process = subprocess.Popen(
+                [
+                    sys.executable, '-m', 'zk_ensemble.server', '--size',
+                    str(len(self.members)), '--client', server_addr,
+                    '--control', control_addr, '--tick-ms',
+                    str(self.tick_ms), '--election-ms',
+                    str(self.election_ms)
+                ],
+                stdout=out,
+                stderr=subprocess.STDOUT,
+                env=env)
+
+        for m in self.members:
+            m.spawn([
+                sys.executable, '-m', 'zk_ensemble.member', '--id',
+                str(m.id), '--client', m.host_and_port, '--admin',
+                '%s:%d' % (m.host, m.admin_port), '--server', server_addr,
+                '--control', control_addr
+            ],
+                    env=env)
+
+    def start(self):
+        _logger.info('Starting %d-member %s ensemble in %s',
+                     len(self.members), self.mode, self.base_dir)
+        if self.mode == MODE_ZOOKEEPER:
+            self._start_zookeeper()
+        else:
+            self._start_standin()
+
+    def states(self):
+        states = {}
+        for m in self.members:
+            info = m.monitor()
+            states[m.host_and_port] = info.get('server_state') \
+                if info and not info.get('error') else None
+        return states
+
+    def wait_ready(self, timeout_s=60):
+        """Waits until a leader and all members are serving."""
+        deadline = time.monotonic() + timeout_s
+        while time.monotonic() < deadline:
+            states = self.states()
+            if all(states.values()) and 'leader' in states.values():
+                _logger.info('Ensemble ready: %s', states)
+                return True
+            for m in self.members:
+                if m.process and m.process.poll() is not None:
+                    raise RuntimeError('Member %d exited; see %s' %
+                                       (m.id, m.dir))
+            if self.server_process and self.server_process.poll() is not None:
+                raise RuntimeError('Stand-in server exited; see %s' %
+                                   self.base_dir)
+            time.sleep(0.2)
+        return False
+
+    def stop(self):
+        processes = [m.process for m in self.members] + [self.server_process]
+        for p in processes:
+            if p and p.poll() is None:
+                # Resume paused members, so that they can terminate.
+                p.send_signal(signal.SIGCONT)
+                p.terminate()
+        for p in processes:
+            if p:
+                try:
+                    p.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    p.kill()
@@ -0,0 +1,70 @@
+import sys
+import signal
+import logging
+
+import click
+
+from . import LocalEnsemble, MODE_AUTO, MODE_ZOOKEEPER, MODE_STANDIN
+
+
+@click.command()
+@click.option('--size', type=click.INT, default=3, show_default=True)
+@click.option('--dir', 'base_dir', required=True, help='Working directory')
+@click.option(
+    '--mode',
+    type=click.Choice([MODE_AUTO, MODE_ZOOKEEPER, MODE_STANDIN]),
+    default=MODE_AUTO,
+    show_default=True)
+@click.option(
+    '--address-prefix', default='127.0.100.', show_default=True,
+    help='Loopback address prefix; members get 1..N')
+@click.option('--client-port', type=click.INT, default=2181, show_default=True)
+@click.option('--admin-port', type=click.INT, default=8080, show_default=True)
+@click.option('--tick-ms', type=click.INT, default=2000, show_default=True)
+@click.option(
+    '--election-ms', type=click.INT, default=200, show_default=True,
+    help='Simulated election duration (stand-in mode)')
+@click.option(
+    '--env-file',
+    help='Shell script to write, exporting the variables which direct '
+    'the benchmark at the ensemble, once it is ready')
+@click.option('--ready-timeout-s', type=click.INT, default=60)
+def main(size, base_dir, mode, address_prefix, client_port, admin_port,
+         tick_ms, election_ms, env_file, ready_timeout_s):
+    """Runs a local ensemble until interrupted."""
+    logging.basicConfig(level=logging.INFO)
+
+    ensemble = LocalEnsemble(
+        size=size,
+        base_dir=base_dir,
+        mode=mode,
+        address_prefix=address_prefix,
+        client_port=client_port,
+        admin_port=admin_port,
+        tick_ms=tick_ms,
+        election_ms=election_ms)
+
+    def on_signal(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, on_signal)
+
+    try:
+        ensemble.start()
+        if not ensemble.wait_ready(ready_timeout_s):
+            raise click.ClickException('Ensemble not ready after %ds: %s' %
+                                       (ready_timeout_s, ensemble.states()))
+        if env_file:
+            ensemble.write_env(env_file)
+        else:
+            for key, value in sorted(ensemble.env().items()):
+                click.echo('%s=%s' % (key, value))
+        signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ensemble.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
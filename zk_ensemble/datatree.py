@@ -0,0 +1,414 @@
+import time
+import copy
+
+from . import jute
+
+
+class ZKError(Exception):
+    def __init__(self, code):
+        super(ZKError, self).__init__(code)
+        self.code = code
+
+
+class Stat(object):
+    __slots__ = [
+        'czxid', 'mzxid', 'ctime', 'mtime', 'version', 'cversion', 'aversion',
+        'ephemeral_owner', 'data_length', 'num_children', 'pzxid'
+    ]
+
+    def __init__(self, zxid, now_ms, ephemeral_owner=0):
+        self.czxid = self.mzxid = self.pzxid = zxid
+        self.ctime = self.mtime = now_ms
+        self.version = self.cversion = self.aversion = 0
+        self.ephemeral_owner = ephemeral_owner
+        self.data_length = 0
+        self.num_children = 0
+
+
+class Node(object):
+    def __init__(self, data, stat, acls):
+        self.data = data
+        self.stat = stat
+        self.acls = acls
+        self.children = set()
+
+    def clone(self):
+        node = Node(self.data, copy.copy(self.stat), self.acls)
+        node.children = set(self.children)
+        return node
+
+
+_open_acl = [(31, 'world', 'anyone')]
+
+
+def _parent(path):
+    i = path.rindex('/')
+    return path[:i] if i > 0 else '/'
+
+
+def _name(path):
+    return path[path.rindex('/') + 1:]
+
+
+def _ancestors(path):
+    while path != '/':
+        path = _parent(path)
+        yield path
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class DataTree(object):
+    """An in-memory ZooKeeper data tree, with ephemeral nodes, one-shot
+    and persistent watches.
+
+    Watch events are delivered via `notify(session_id, event_type,
+    path)`.  All operations are synchronous; callers are expected to
+    serialize them."""
+
+    def __init__(self, notify):
+        self.notify = notify
+        self.zxid = 0
+        self.nodes = {}
+        self.ephemerals = {}
+        # {kind: {path: set(session_id)}}
+        self.watches = {'data': {}, 'exist': {}, 'child': {}}
+        # {path: {session_id: recursive}}
+        self.persistent_watches = {}
+
+        self._undo = None
+        self._pending_events = None
+
+        root = Node(b'', Stat(0, 0), _open_acl)
+        self.nodes['/'] = root
+        self._add_node('/zookeeper', Node(b'', Stat(0, 0), _open_acl))
+
+    # Statistics.
+
+    def znode_count(self):
+        return len(self.nodes)
+
+    def watch_count(self):
+        n = sum(
+            len(s) for kind in self.watches.values() for s in kind.values())
+        return n + sum(len(s) for s in self.persistent_watches.values())
+
+    def ephemerals_count(self):
+        return sum(len(s) for s in self.ephemerals.values())
+
+    def approximate_data_size(self):
+        return sum(
+            len(path) + len(node.data or b'')
+            for path, node in self.nodes.items())
+
+    # Helpers.
+
+    def _next_zxid(self):
+        self.zxid += 1
+        return self.zxid
+
+    def _get(self, path):
+        node = self.nodes.get(path)
+        if not node:
+            raise ZKError(jute.NO_NODE)
+        return node
+
+    def _touch(self, path):
+        # Saves the state of `path` before a modification, if within a
+        # multi-op.
+        if self._undo is not None and path not in self._undo:
+            node = self.nodes.get(path)
+            self._undo[path] = node.clone() if node else None
+
+    def _add_node(self, path, node):
+        self.nodes[path] = node
+        parent = self.nodes[_parent(path)]
+        parent.children.add(_name(path))
+        parent.stat.num_children = len(parent.children)
+
+    def _validate_path(self, path):
+        if not path or not path.startswith('/') or \
+           (len(path) > 1 and path.endswith('/')) or '//' in path:
+            raise ZKError(jute.BAD_ARGUMENTS)
+
+    # Watches.
+
+    def _add_watch(self, kind, path, session_id):
+        self.watches[kind].setdefault(path, set()).add(session_id)
+
+    def _pop_watchers(self, kinds, path):
+        session_ids = set()
+        for kind in kinds:
+            session_ids.update(self.watches[kind].pop(path, ()))
+        return session_ids
+
+    def _trigger(self, event_type, path, kinds):
+        session_ids = self._pop_watchers(kinds, path)
+
+        watchers = self.persistent_watches.get(path, {})
+        session_ids.update(watchers)
+
+        if event_type != jute.EVENT_NODE_CHILDREN_CHANGED:
+            for ancestor in _ancestors(path):
+                for session_id, recursive in self.persistent_watches.get(
+                        ancestor, {}).items():
+                    if recursive:
+                        session_ids.add(session_id)
+
+        for session_id in session_ids:
+            self._pending_events.append((session_id, event_type, path))
+
+    def _flush_events(self):
+        events = self._pending_events
+        self._pending_events = None
+        for event in events:
+            self.notify(*event)
+
+    def add_persistent_watch(self, path, session_id, recursive):
+        self.persistent_watches.setdefault(path, {})[session_id] = recursive
+
+    def remove_watches(self, session_id, path=None):
+        for kind in self.watches.values():
+            for p in [path] if path else list(kind):
+                s = kind.get(p)
+                if s:
+                    s.discard(session_id)
+                    if not s:
+                        del kind[p]
+        for p in [path] if path else list(self.persistent_watches):
+            watchers = self.persistent_watches.get(p)
+            if watchers:
+                watchers.pop(session_id, None)
+                if not watchers:
+                    del self.persistent_watches[p]
+
+    def set_watches(self, session_id, relative_zxid, data, exist, child):
+        """Re-registers watches after a reconnection, delivering the
+        events missed since `relative_zxid`."""
+        self._pending_events = []
+        for path in data:
+            node = self.nodes.get(path)
+            if not node:
+                self._pending_events.append(
+                    (session_id, jute.EVENT_NODE_DELETED, path))
+            elif node.stat.mzxid > relative_zxid:
+                self._pending_events.append(
+                    (session_id, jute.EVENT_NODE_DATA_CHANGED, path))
+            else:
+                self._add_watch('data', path, session_id)
+        for path in exist:
+            node = self.nodes.get(path)
+            if node:
+                self._pending_events.append(
+                    (session_id, jute.EVENT_NODE_CREATED, path))
+            else:
+                self._add_watch('exist', path, session_id)
+        for path in child:
+            node = self.nodes.get(path)
+            if not node:
+                self._pending_events.append(
+                    (session_id, jute.EVENT_NODE_DELETED, path))
+            elif node.stat.pzxid > relative_zxid:
+                self._pending_events.append(
+                    (session_id, jute.EVENT_NODE_CHILDREN_CHANGED, path))
+            else:
+                self._add_watch('child', path, session_id)
+        self._flush_events()
+
+    # Reads.
+
+    def get_data(self, path, watcher=None):
+        node = self._get(path)
+        if watcher:
+            self._add_watch('data', path, watcher)
+        return node.data, node.stat
+
+    def exists(self, path, watcher=None):
+        node = self.nodes.get(path)
+        if watcher:
+            self._add_watch('data' if node else 'exist', path, watcher)
+        if not node:
+            raise ZKError(jute.NO_NODE)
+        return node.stat
+
+    def get_children(self, path, watcher=None):
+        node = self._get(path)
+        if watcher:
+            self._add_watch('child', path, watcher)
+        return sorted(node.children), node.stat
+
+    def get_acl(self, path):
+        node = self._get(path)
+        return node.acls, node.stat
+
+    # Writes.  The `_do_*` variants neither allocate zxids nor flush
+    # events, for use within multi-ops.
+
+    def _do_create(self, zxid, path, data, acls, flags, session_id):
+        self._validate_path(path)
+        if path == '/':
+            raise ZKError(jute.NODE_EXISTS)
+        parent_path = _parent(path)
+        parent = self._get(parent_path)
+        if parent.stat.ephemeral_owner:
+            raise ZKError(jute.NO_CHILDREN_FOR_EPHEMERALS)
+
+        if flags & jute.FLAG_SEQUENTIAL:
+            path = '%s%010d' % (path, parent.stat.cversion)
+        if path in self.nodes:
+            raise ZKError(jute.NODE_EXISTS)
+
+        is_ephemeral = bool(flags & jute.FLAG_EPHEMERAL)
+        stat = Stat(zxid, _now_ms(), session_id if is_ephemeral else 0)
+        stat.data_length = len(data or b'')
+
+        self._touch(parent_path)
+        self._touch(path)
+        self._add_node(path, Node(data, stat, acls or _open_acl))
+        parent.stat.cversion += 1
+        parent.stat.pzxid = zxid
+
+        if is_ephemeral:
+            self.ephemerals.setdefault(session_id, set()).add(path)
+
+        self._trigger(jute.EVENT_NODE_CREATED, path, ['data', 'exist'])
+        self._trigger(jute.EVENT_NODE_CHILDREN_CHANGED, parent_path,
+                      ['child'])
+
+        return path, stat
+
+    def _do_delete(self, zxid, path, version):
+        self._validate_path(path)
+        if path == '/':
+            raise ZKError(jute.BAD_ARGUMENTS)
+        node = self._get(path)
+        if version != -1 and version != node.stat.version:
+            raise ZKError(jute.BAD_VERSION)
+        if node.children:
+            raise ZKError(jute.NOT_EMPTY)
+
+        parent_path = _parent(path)
+        parent = self.nodes[parent_path]
+
+        self._touch(parent_path)
+        self._touch(path)
+        del self.nodes[path]
+        parent.children.discard(_name(path))
+        parent.stat.num_children = len(parent.children)
+        parent.stat.cversion += 1
+        parent.stat.pzxid = zxid
+
+        owner = node.stat.ephemeral_owner
+        if owner:
+            paths = self.ephemerals.get(owner)
+            if paths:
+                paths.discard(path)
+                if not paths:
+                    del self.ephemerals[owner]
+
+        self._trigger(jute.EVENT_NODE_DELETED, path, ['data', 'exist', 'child'])
+        self._trigger(jute.EVENT_NODE_CHILDREN_CHANGED, parent_path,
+                      ['child'])
+
+    def _do_set_data(self, zxid, path, data, version):
+        node = self._get(path)
+        if version != -1 and version != node.stat.version:
+            raise ZKError(jute.BAD_VERSION)
+
+        self._touch(path)
+        node.data = data
+        node.stat.mzxid = zxid
+        node.stat.mtime = _now_ms()
+        node.stat.version += 1
+        node.stat.data_length = len(data or b'')
+
+        self._trigger(jute.EVENT_NODE_DATA_CHANGED, path, ['data', 'exist'])
+
+        return node.stat
+
+    def _do_check(self, path, version):
+        node = self._get(path)
+        if version != -1 and version != node.stat.version:
+            raise ZKError(jute.BAD_VERSION)
+
+    def _write(self, fn, *args):
+        self._pending_events = []
+        try:
+            result = fn(self._next_zxid(), *args)
+        except ZKError:
+            self._pending_events = None
+            raise
+        self._flush_events()
+        return result
+
+    def create(self, path, data, acls, flags, session_id):
+        return self._write(self._do_create, path, data, acls, flags,
+                           session_id)
+
+    def delete(self, path, version):
+        return self._write(self._do_delete, path, version)
+
+    def set_data(self, path, data, version):
+        return self._write(self._do_set_data, path, data, version)
+
+    def multi(self, ops, session_id):
+        """Atomically applies `ops`, a list of `(op_code, args)` tuples.
+        Returns a list of `(op_code, result)` tuples on success, or of
+        `(jute.OP_ERROR, error_code)` tuples on failure."""
+        zxid = self._next_zxid()
+        self._pending_events = []
+        self._undo = {}
+        ephemerals = {k: set(v) for k, v in self.ephemerals.items()}
+
+        results = []
+        failed = None
+        for i, (op, args) in enumerate(ops):
+            try:
+                if op in [jute.OP_CREATE, jute.OP_CREATE2]:
+                    result = self._do_create(zxid, *args, session_id)
+                elif op == jute.OP_DELETE:
+                    result = self._do_delete(zxid, *args)
+                elif op == jute.OP_SET_DATA:
+                    result = self._do_set_data(zxid, *args)
+                elif op == jute.OP_CHECK:
+                    result = self._do_check(*args)
+                else:
+                    raise ZKError(jute.UNIMPLEMENTED)
+                results.append((op, result))
+            except ZKError as e:
+                failed = (i, e.code)
+                break
+
+        undo = self._undo
+        self._undo = None
+
+        if failed is None:
+            self._flush_events()
+            return results
+
+        # Roll back, in reverse order of modification.
+        for path, node in reversed(list(undo.items())):
+            if node is None:
+                self.nodes.pop(path, None)
+            else:
+                self.nodes[path] = node
+        self.ephemerals = ephemerals
+        self._pending_events = None
+
+        index, code = failed
+        return [(jute.OP_ERROR, jute.OK if i < index else
+                 code if i == index else jute.RUNTIME_INCONSISTENCY)
+                for i in range(len(ops))]
+
+    def kill_session(self, session_id):
+        """Deletes the ephemeral nodes owned by, and the watches of, an
+        expired or closed session."""
+        for path in sorted(self.ephemerals.get(session_id, ()), reverse=True):
+            try:
+                self.delete(path, -1)
+            except ZKError:
+                pass
+        self.ephemerals.pop(session_id, None)
+        self.remove_watches(session_id)
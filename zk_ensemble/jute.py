@@ -0,0 +1,179 @@
+import struct
+
+# Subset of the ZooKeeper wire protocol ("jute" serialization) used by
+# the stand-in server.
+
+_int = struct.Struct('!i')
+_long = struct.Struct('!q')
+_bool = struct.Struct('!?')
+
+# Operation codes.
+OP_NOTIFICATION = 0
+OP_CREATE = 1
+OP_DELETE = 2
+OP_EXISTS = 3
+OP_GET_DATA = 4
+OP_SET_DATA = 5
+OP_GET_ACL = 6
+OP_SET_ACL = 7
+OP_GET_CHILDREN = 8
+OP_SYNC = 9
+OP_PING = 11
+OP_GET_CHILDREN2 = 12
+OP_CHECK = 13
+OP_MULTI = 14
+OP_CREATE2 = 15
+OP_RECONFIG = 16
+OP_CHECK_WATCHES = 17
+OP_REMOVE_WATCHES = 18
+OP_CREATE_CONTAINER = 19
+OP_CREATE_TTL = 21
+OP_MULTI_READ = 22
+OP_AUTH = 100
+OP_SET_WATCHES = 101
+OP_SASL = 102
+OP_GET_EPHEMERALS = 103
+OP_GET_ALL_CHILDREN_NUMBER = 104
+OP_SET_WATCHES2 = 105
+OP_ADD_WATCH = 106
+OP_CLOSE_SESSION = -11
+OP_ERROR = -1
+
+# Special xids.
+XID_NOTIFICATION = -1
+XID_PING = -2
+XID_AUTH = -4
+XID_SET_WATCHES = -8
+
+# Error codes.
+OK = 0
+RUNTIME_INCONSISTENCY = -2
+UNIMPLEMENTED = -6
+BAD_ARGUMENTS = -8
+NO_NODE = -101
+BAD_VERSION = -103
+NO_CHILDREN_FOR_EPHEMERALS = -108
+NODE_EXISTS = -110
+NOT_EMPTY = -111
+SESSION_EXPIRED = -112
+INVALID_ACL = -114
+NO_WATCHER = -121
+
+# Create flags.
+FLAG_EPHEMERAL = 1
+FLAG_SEQUENTIAL = 2
+
+# Watch event types and states.
+EVENT_NODE_CREATED = 1
+EVENT_NODE_DELETED = 2
+EVENT_NODE_DATA_CHANGED = 3
+EVENT_NODE_CHILDREN_CHANGED = 4
+STATE_SYNC_CONNECTED = 3
+
+# addWatch modes.
+WATCH_MODE_PERSISTENT = 0
+WATCH_MODE_PERSISTENT_RECURSIVE = 1
+
+
+class Reader(object):
+    def __init__(self, buf, offset=0):
+        self.buf = buf
+        self.offset = offset
+
+    def _unpack(self, s):
+        v = s.unpack_from(self.buf, self.offset)[0]
+        self.offset += s.size
+        return v
+
+    def int(self):
+        return self._unpack(_int)
+
+    def long(self):
+        return self._unpack(_long)
+
+    def bool(self):
+        return self._unpack(_bool)
+
+    def has_more(self):
+        return self.offset < len(self.buf)
+
+    def buffer(self):
+        n = self.int()
+        if n < 0:
+            return None
+        v = bytes(self.buf[self.offset:self.offset + n])
+        self.offset += n
+        return v
+
+    def string(self):
+        v = self.buffer()
+        return None if v is None else v.decode('utf-8')
+
+    def vector(self, item):
+        n = self.int()
+        if n < 0:
+            return None
+        return [item(self) for i in range(n)]
+
+    def acl(self):
+        return (self.int(), self.string(), self.string())
+
+    def acls(self):
+        return self.vector(Reader.acl)
+
+    def strings(self):
+        return self.vector(Reader.string)
+
+
+class Writer(object):
+    def __init__(self):
+        self.parts = []
+
+    def int(self, v):
+        self.parts.append(_int.pack(v))
+        return self
+
+    def long(self, v):
+        self.parts.append(_long.pack(v))
+        return self
+
+    def bool(self, v):
+        self.parts.append(_bool.pack(v))
+        return self
+
+    def buffer(self, v):
+        if v is None:
+            return self.int(-1)
+        self.int(len(v))
+        self.parts.append(bytes(v))
+        return self
+
+    def string(self, v):
+        return self.buffer(None if v is None else v.encode('utf-8'))
+
+    def strings(self, vs):
+        self.int(len(vs))
+        for v in vs:
+            self.string(v)
+        return self
+
+    def acls(self, acls):
+        self.int(len(acls))
+        for perms, scheme, id in acls:
+            self.int(perms).string(scheme).string(id)
+        return self
+
+    def stat(self, stat):
+        (self.long(stat.czxid).long(stat.mzxid).long(stat.ctime)
+         .long(stat.mtime).int(stat.version).int(stat.cversion)
+         .int(stat.aversion).long(stat.ephemeral_owner)
+         .int(stat.data_length).int(stat.num_children).long(stat.pzxid))
+        return self
+
+    def getvalue(self):
+        return b''.join(self.parts)
+
+    def framed(self):
+        """Returns the serialized data, prefixed with its length."""
+        payload = self.getvalue()
+        return _int.pack(len(payload)) + payload
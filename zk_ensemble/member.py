@@ -0,0 +1,186 @@
+import sys
+import json
+import time
+import socket
+import logging
+
+import click
+import gevent
+import gevent.server
+import gevent.socket
+import gevent.pywsgi
+
+from .server import STATE_LOOKING
+
+_logger = logging.getLogger(__name__)
+
+_not_serving = 'This ZooKeeper instance is not currently serving requests'
+
+
+def _split(host_port):
+    host, port = host_port.rsplit(':', 1)
+    return (host, int(port))
+
+
+class StandinMember(object):
+    """The front end of a stand-in ensemble member: forwards client
+    connections to the shared server, reports to it, and exposes a
+    ZooKeeper-like admin `monitor` command.
+
+    Like a real member, it drops its clients and refuses new ones
+    while not serving (i.e., during elections, or when cut off from
+    the server).  Running in its own process, it can be paused and
+    resumed via SIGSTOP/SIGCONT."""
+
+    def __init__(self, *, id, server, control, tick_ms=100,
+                 sync_limit_ms=1000):
+        self.id = id
+        self.server = server
+        self.control = control
+        self.tick_ms = tick_ms
+        self.sync_limit_ms = sync_limit_ms
+
+        self.state = STATE_LOOKING
+        self.last_reply = None
+        self.server_stats = {}
+        self.connections = set()
+        self.packets_received = 0
+        self.packets_sent = 0
+
+    def is_serving(self):
+        return self.state != STATE_LOOKING
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        _logger.info('Member %d: %s -> %s', self.id, self.state, state)
+        self.state = state
+        if not self.is_serving():
+            for sock in list(self.connections):
+                sock.close()
+            self.connections.clear()
+
+    def report_loop(self):
+        while True:
+            try:
+                sock = gevent.socket.create_connection(_split(self.control))
+                f = sock.makefile('rwb')
+                while True:
+                    report = {
+                        'member': self.id,
+                        'num_alive_connections': len(self.connections) // 2
+                    }
+                    f.write(json.dumps(report).encode('utf-8') + b'\n')
+                    f.flush()
+                    with gevent.Timeout(self.sync_limit_ms / 1000):
+                        line = f.readline()
+                    if not line:
+                        break
+                    reply = json.loads(line)
+                    self.last_reply = time.monotonic()
+                    self.server_stats = reply
+                    self._set_state(reply['state'])
+                    gevent.sleep(self.tick_ms / 1000)
+            except (OSError, ValueError, gevent.Timeout):
+                pass
+            self._set_state(STATE_LOOKING)
+            gevent.sleep(self.tick_ms / 1000)
+
+    def _pump(self, src, dst, counter):
+        try:
+            while True:
+                data = src.recv(64 * 1024)
+                if not data:
+                    break
+                setattr(self, counter, getattr(self, counter) + 1)
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in [src, dst]:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def handle_client(self, client, address):
+        if not self.is_serving():
+            client.close()
+            return
+        try:
+            upstream = gevent.socket.create_connection(_split(self.server))
+        except OSError:
+            client.close()
+            return
+
+        pair = [client, upstream]
+        for sock in pair:
+            # Pipelined requests must not wait for delayed ACKs.
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections.update(pair)
+        try:
+            gevent.joinall([
+                gevent.spawn(self._pump, client, upstream,
+                             'packets_received'),
+                gevent.spawn(self._pump, upstream, client, 'packets_sent')
+            ])
+        finally:
+            for sock in pair:
+                self.connections.discard(sock)
+                sock.close()
+
+    def monitor(self):
+        info = {'command': 'monitor'}
+        if not self.is_serving():
+            info['error'] = _not_serving
+            return info
+
+        info.update({
+            'error': None,
+            'version': 'stand-in',
+            'server_state': self.state,
+            'num_alive_connections': len(self.connections) // 2,
+            'outstanding_requests': 0,
+            'packets_received': self.packets_received,
+            'packets_sent': self.packets_sent
+        })
+        for key in [
+                'znode_count', 'watch_count', 'ephemerals_count',
+                'approximate_data_size', 'global_sessions'
+        ]:
+            info[key] = self.server_stats.get(key)
+        return info
+
+    def admin_app(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.rstrip('/') != '/commands/monitor':
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Unknown command\n']
+
+        body = json.dumps(self.monitor()).encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'application/json'),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+
+
+@click.command()
+@click.option('--id', type=click.INT, required=True)
+@click.option('--client', required=True, help='host:port for clients')
+@click.option('--admin', required=True, help='host:port for admin')
+@click.option('--server', required=True, help='host:port of the server')
+@click.option('--control', required=True, help='host:port of the server')
+@click.option('--sync-limit-ms', type=click.INT, default=1000)
+def main(id, client, admin, server, control, sync_limit_ms):
+    logging.basicConfig(level=logging.INFO)
+
+    member = StandinMember(
+        id=id, server=server, control=control, sync_limit_ms=sync_limit_ms)
+
+    gevent.server.StreamServer(_split(client), member.handle_client).start()
+    gevent.pywsgi.WSGIServer(
+        _split(admin), member.admin_app, log=None).start()
+    member.report_loop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
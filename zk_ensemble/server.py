@@ -0,0 +1,399 @@
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import logging
+
+import click
+import gevent
+import gevent.server
+
+from . import jute
+from .datatree import DataTree, ZKError
+
+_logger = logging.getLogger(__name__)
+
+STATE_LEADER, STATE_FOLLOWER, STATE_LOOKING = [
+    'leader', 'follower', 'looking'
+]
+
+_int = struct.Struct('!i')
+
+
+class Session(object):
+    def __init__(self, id, passwd, timeout_ms):
+        self.id = id
+        self.passwd = passwd
+        self.timeout_ms = timeout_ms
+        self.connection = None
+        self.last_seen = time.monotonic()
+
+
+class _Connection(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.session = None
+
+    def read_packet(self):
+        header = self._read_exactly(4)
+        if header is None:
+            return None
+        n = _int.unpack(header)[0]
+        return self._read_exactly(n)
+
+    def _read_exactly(self, n):
+        parts = []
+        while n > 0:
+            data = self.sock.recv(min(n, 64 * 1024))
+            if not data:
+                return None
+            parts.append(data)
+            n -= len(data)
+        return b''.join(parts)
+
+    def send(self, writer):
+        self.sock.sendall(writer.framed())
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class StandinServer(object):
+    """The shared state of a stand-in ensemble: a data tree served
+    over the ZooKeeper client protocol (via the members' front ends,
+    see `zk_ensemble.member`), and a simulated leader election.
+
+    Members report to the control port every few ticks; a member
+    which has not been heard from for `sync_limit_ms` is considered
+    down.  Losing the leader or the quorum triggers an "election",
+    which completes `election_ms` after a quorum is available again,
+    and elects the live member with the highest id."""
+
+    def __init__(self,
+                 *,
+                 size,
+                 tick_ms=2000,
+                 sync_limit_ms=1000,
+                 election_ms=200):
+        self.size = size
+        self.quorum_size = size // 2 + 1
+        self.min_session_timeout_ms = 2 * tick_ms
+        self.max_session_timeout_ms = 20 * tick_ms
+        self.sync_limit_ms = sync_limit_ms
+        self.election_ms = election_ms
+
+        self.tree = DataTree(self._notify)
+        self.sessions = {}
+        self._next_session_id = (int(time.time() * 1000) & 0xffffffffff) << 8
+
+        self.last_heard = {}
+        self.member_stats = {}
+        self.leader = None
+        self.election_until = None
+
+    # Election.
+
+    def alive_members(self):
+        now = time.monotonic()
+        return sorted(m for m, at in self.last_heard.items()
+                      if now - at <= self.sync_limit_ms / 1000)
+
+    def _update_election(self):
+        now = time.monotonic()
+        alive = self.alive_members()
+        has_quorum = len(alive) >= self.quorum_size
+
+        if self.leader is not None and (self.leader not in alive
+                                        or not has_quorum):
+            _logger.info('Lost leader %r (alive: %r); electing',
+                         self.leader, alive)
+            self.leader = None
+            self.election_until = None
+
+        if self.leader is None and has_quorum:
+            if self.election_until is None:
+                self.election_until = now + self.election_ms / 1000
+            elif now >= self.election_until:
+                self.leader = alive[-1]
+                self.election_until = None
+                _logger.info('Elected leader %r (alive: %r)', self.leader,
+                             alive)
+
+    def state_of(self, member):
+        if self.leader is None or member not in self.alive_members():
+            return STATE_LOOKING
+        return STATE_LEADER if member == self.leader else STATE_FOLLOWER
+
+    def election_loop(self):
+        while True:
+            self._update_election()
+            gevent.sleep(0.02)
+
+    def handle_control(self, sock, address):
+        f = sock.makefile('rwb')
+        try:
+            for line in f:
+                report = json.loads(line)
+                member = report['member']
+                self.last_heard[member] = time.monotonic()
+                self.member_stats[member] = report
+                self._update_election()
+                reply = {
+                    'state': self.state_of(member),
+                    'znode_count': self.tree.znode_count(),
+                    'watch_count': self.tree.watch_count(),
+                    'ephemerals_count': self.tree.ephemerals_count(),
+                    'approximate_data_size':
+                    self.tree.approximate_data_size(),
+                    'global_sessions': len(self.sessions)
+                }
+                f.write(json.dumps(reply).encode('utf-8') + b'\n')
+                f.flush()
+        except (OSError, ValueError, KeyError):
+            _logger.exception('Control connection from %r', address)
+        finally:
+            sock.close()
+
+    # Sessions.
+
+    def _notify(self, session_id, event_type, path):
+        session = self.sessions.get(session_id)
+        if not session or not session.connection:
+            return
+        w = jute.Writer()
+        w.int(jute.XID_NOTIFICATION).long(-1).int(jute.OK)
+        w.int(event_type).int(jute.STATE_SYNC_CONNECTED).string(path)
+        try:
+            session.connection.send(w)
+        except OSError:
+            pass
+
+    def _expire(self, session):
+        _logger.debug('Expiring session 0x%x', session.id)
+        self.sessions.pop(session.id, None)
+        self.tree.kill_session(session.id)
+        if session.connection:
+            session.connection.close()
+            session.connection = None
+
+    def expiry_loop(self):
+        while True:
+            now = time.monotonic()
+            for session in list(self.sessions.values()):
+                if now - session.last_seen > session.timeout_ms / 1000:
+                    self._expire(session)
+            gevent.sleep(0.1)
+
+    def _connect(self, conn, packet):
+        r = jute.Reader(packet)
+        r.int()  # Protocol version
+        r.long()  # Last zxid seen
+        timeout_ms = r.int()
+        session_id = r.long()
+        passwd = r.buffer()
+
+        timeout_ms = max(
+            min(timeout_ms, self.max_session_timeout_ms),
+            self.min_session_timeout_ms)
+
+        w = jute.Writer()
+        if session_id:
+            session = self.sessions.get(session_id)
+            if not session or session.passwd != passwd:
+                # Expired (or invalid) session.
+                w.int(0).int(0).long(0).buffer(b'\0' * 16).bool(False)
+                conn.send(w)
+                return None
+            if session.connection and session.connection is not conn:
+                session.connection.close()
+        else:
+            self._next_session_id += 1
+            session = Session(self._next_session_id, os.urandom(16),
+                              timeout_ms)
+            self.sessions[session.id] = session
+
+        session.connection = conn
+        session.last_seen = time.monotonic()
+        conn.session = session
+
+        w.int(0).int(session.timeout_ms).long(session.id)
+        w.buffer(session.passwd).bool(False)
+        conn.send(w)
+        return session
+
+    def handle_client(self, sock, address):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = _Connection(sock)
+        try:
+            packet = conn.read_packet()
+            if packet is None or not self._connect(conn, packet):
+                return
+            session = conn.session
+
+            while True:
+                packet = conn.read_packet()
+                if packet is None:
+                    break
+                if session.connection is not conn:
+                    # Moved to another connection.
+                    break
+                session.last_seen = time.monotonic()
+
+                r = jute.Reader(packet)
+                xid = r.int()
+                op = r.int()
+                if not self._handle_request(conn, session, xid, op, r):
+                    break
+        except OSError:
+            pass
+        except Exception:
+            _logger.exception('Client connection from %r', address)
+        finally:
+            if conn.session and conn.session.connection is conn:
+                conn.session.connection = None
+            conn.close()
+
+    def _reply(self, conn, xid, err=jute.OK, body=None):
+        w = jute.Writer()
+        w.int(xid).long(self.tree.zxid).int(err)
+        if body and err == jute.OK:
+            w.parts.extend(body.parts)
+        conn.send(w)
+
+    def _handle_request(self, conn, session, xid, op, r):
+        tree = self.tree
+        w = jute.Writer()
+        watcher = session.id
+
+        try:
+            if op == jute.OP_PING:
+                pass
+            elif op == jute.OP_CLOSE_SESSION:
+                self.sessions.pop(session.id, None)
+                tree.kill_session(session.id)
+                self._reply(conn, xid)
+                return False
+            elif op in [jute.OP_CREATE, jute.OP_CREATE2]:
+                path, stat = tree.create(r.string(), r.buffer(), r.acls(),
+                                         r.int(), session.id)
+                w.string(path)
+                if op == jute.OP_CREATE2:
+                    w.stat(stat)
+            elif op == jute.OP_DELETE:
+                tree.delete(r.string(), r.int())
+            elif op == jute.OP_EXISTS:
+                path = r.string()
+                w.stat(tree.exists(path, watcher if r.bool() else None))
+            elif op == jute.OP_GET_DATA:
+                path = r.string()
+                data, stat = tree.get_data(path, watcher if r.bool() else None)
+                w.buffer(data).stat(stat)
+            elif op == jute.OP_SET_DATA:
+                w.stat(tree.set_data(r.string(), r.buffer(), r.int()))
+            elif op == jute.OP_GET_ACL:
+                acls, stat = tree.get_acl(r.string())
+                w.acls(acls).stat(stat)
+            elif op in [jute.OP_GET_CHILDREN, jute.OP_GET_CHILDREN2]:
+                path = r.string()
+                children, stat = tree.get_children(
+                    path, watcher if r.bool() else None)
+                w.strings(children)
+                if op == jute.OP_GET_CHILDREN2:
+                    w.stat(stat)
+            elif op == jute.OP_SYNC:
+                w.string(r.string())
+            elif op == jute.OP_MULTI:
+                self._multi(session, r, w)
+            elif op == jute.OP_SET_WATCHES:
+                relative_zxid = r.long()
+                tree.set_watches(session.id, relative_zxid, r.strings(),
+                                 r.strings(), r.strings())
+            elif op == jute.OP_ADD_WATCH:
+                path = r.string()
+                tree.add_persistent_watch(
+                    path, session.id,
+                    r.int() == jute.WATCH_MODE_PERSISTENT_RECURSIVE)
+            elif op == jute.OP_REMOVE_WATCHES:
+                tree.remove_watches(session.id, r.string())
+            elif op == jute.OP_AUTH:
+                pass
+            else:
+                self._reply(conn, xid, jute.UNIMPLEMENTED)
+                return True
+        except ZKError as e:
+            self._reply(conn, xid, e.code)
+            return True
+
+        self._reply(conn, xid, body=w)
+        return True
+
+    def _multi(self, session, r, w):
+        ops = []
+        while True:
+            op = r.int()
+            done = r.bool()
+            r.int()  # err
+            if done:
+                break
+            if op in [jute.OP_CREATE, jute.OP_CREATE2]:
+                args = (r.string(), r.buffer(), r.acls(), r.int())
+            elif op == jute.OP_DELETE:
+                args = (r.string(), r.int())
+            elif op == jute.OP_SET_DATA:
+                args = (r.string(), r.buffer(), r.int())
+            elif op == jute.OP_CHECK:
+                args = (r.string(), r.int())
+            else:
+                raise ZKError(jute.UNIMPLEMENTED)
+            ops.append((op, args))
+
+        for op, result in self.tree.multi(ops, session.id):
+            w.int(op).bool(False)
+            if op == jute.OP_ERROR:
+                w.int(result).int(result)
+            elif op in [jute.OP_CREATE, jute.OP_CREATE2]:
+                path, stat = result
+                w.int(jute.OK).string(path)
+                if op == jute.OP_CREATE2:
+                    w.stat(stat)
+            elif op == jute.OP_SET_DATA:
+                w.int(jute.OK).stat(result)
+            else:
+                w.int(jute.OK)
+        w.int(-1).bool(True).int(-1)
+
+
+@click.command()
+@click.option('--size', type=click.INT, required=True)
+@click.option('--client', required=True, help='host:port for clients')
+@click.option('--control', required=True, help='host:port for members')
+@click.option('--tick-ms', type=click.INT, default=2000)
+@click.option('--sync-limit-ms', type=click.INT, default=1000)
+@click.option('--election-ms', type=click.INT, default=200)
+def main(size, client, control, tick_ms, sync_limit_ms, election_ms):
+    logging.basicConfig(level=logging.INFO)
+
+    server = StandinServer(
+        size=size,
+        tick_ms=tick_ms,
+        sync_limit_ms=sync_limit_ms,
+        election_ms=election_ms)
+
+    def split(host_port):
+        host, port = host_port.rsplit(':', 1)
+        return (host, int(port))
+
+    gevent.server.StreamServer(split(client), server.handle_client).start()
+    gevent.server.StreamServer(split(control),
+                               server.handle_control).start()
+    gevent.spawn(server.expiry_loop)
+    server.election_loop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
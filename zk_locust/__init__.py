@@ -14,6 +14,10 @@ PSEUDO_ROOT = os.getenv('ZK_LOCUST_PSEUDO_ROOT') or \
     os.getenv('KAZOO_LOCUST_PSEUDO_ROOT') or '/kl'
 MIN_WAIT = int(os.getenv('ZK_LOCUST_MIN_WAIT', '0'))
 MAX_WAIT = max(int(os.getenv('ZK_LOCUST_MAX_WAIT', '0')), MIN_WAIT)
+# Position of this process among the workers started by
+# `multi-locust.sh`.
+WORKER_INDEX = int(os.getenv('ZK_LOCUST_WORKER_INDEX') or '0')
+WORKER_COUNT = max(int(os.getenv('ZK_LOCUST_WORKER_COUNT') or '1'), 1)
 
 
 class ExcBehavior(Enum):
@@ -31,7 +35,7 @@ _backend_exceptions = ()
 _backend_exceptions_non_suppress_set = set()
 _backend_exceptions_non_suppress = ()
 
-_zk_re_port = re.compile(r"(.*):(\d{1,4})$")
+_zk_re_port = re.compile(r"(.*):(\d{1,5})$")
 
 
 def get_zk_hosts():
@@ -174,6 +178,10 @@ class LocustTimer(object):
         self._start_time = time.time()
         return self
 
+    def restart(self):
+        """Restarts the clock, e.g., after untimed setup."""
+        self._start_time = time.time()
+
     def __exit__(self, exc, value, traceback):
         if self._is_reported:
             # if the user has already manually marked this response as
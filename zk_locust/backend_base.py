@@ -5,6 +5,12 @@ class ZKLocustException(Exception):
     pass
 
 
+# Session states reported to `add_session_listener` listeners.
+SESSION_CONNECTED, SESSION_SUSPENDED, SESSION_LOST = [
+    'connected', 'suspended', 'lost'
+]
+
+
 class AbstractZKLocustClient(metaclass=ABCMeta):
     _pseudo_root = None
     _zk_client = None
@@ -25,6 +31,52 @@ class AbstractZKLocustClient(metaclass=ABCMeta):
     def has_sasl_auth(self):
         return False
 
+    def supports_transactions(self):
+        return False
+
+    def transaction_error(self, results):
+        """Returns the exception which caused a transaction to fail,
+        given its `results`, or None if it succeeded."""
+        return None
+
+    def supports_persistent_watches(self):
+        return False
+
+    def add_persistent_watch(self, path, callback, recursive=False):
+        """Adds a persistent (or, if `recursive`, persistent-recursive)
+        watch on `path`, calling `callback` with each event."""
+        raise ZKLocustException(
+            'The active backend does not support persistent watches')
+
+    def new_session_client(self, timeout_s=None):
+        """Returns a new, unstarted, client with the same parameters
+        but its own session--with a timeout of `timeout_s` seconds if
+        set--and no pseudo-root."""
+        raise ZKLocustException(
+            'The active backend cannot create session clients')
+
+    def abandon_session(self):
+        """Drops the connection without closing the session, which the
+        server thus expires after its timeout."""
+        raise ZKLocustException(
+            'The active backend cannot abandon sessions')
+
+    def add_session_listener(self, listener):
+        """Calls `listener` with one of `SESSION_CONNECTED`,
+        `SESSION_SUSPENDED` or `SESSION_LOST` on each change of the
+        session state.  `listener` must not block."""
+        raise ZKLocustException(
+            'The active backend does not support session listeners')
+
+    def connect_timeout_except(self):
+        """Returns the exception raised by `start` when the connection
+        times out."""
+        return ZKLocustException
+
+    def no_node_except(self):
+        raise ZKLocustException(
+            'The active backend does not expose a "no node" exception')
+
     def ensure_pseudo_root(self):
         if self._pseudo_root:
             try:
@@ -1,15 +1,22 @@
 import os
+import socket
 import importlib
 import logging
 import json
 
+from collections import namedtuple
+
+import kazoo
 import kazoo.handlers.gevent
 import kazoo.handlers.threading
 import kazoo.client
 import kazoo.exceptions
-from kazoo.protocol.states import KeeperState
+from kazoo.protocol.serialization import Watch, write_string, int_struct
+from kazoo.protocol.states import KeeperState, KazooState, WatchedEvent, \
+    Callback, EventType, EVENT_TYPE_MAP
 
-from .backend_base import ZKLocustException, AbstractZKLocustClient
+from .backend_base import ZKLocustException, AbstractZKLocustClient, \
+    SESSION_CONNECTED, SESSION_SUSPENDED, SESSION_LOST
 
 _logger = logging.getLogger(__name__)
 
@@ -34,6 +41,50 @@ class KazooLocustStoppedException(KazooLocustException):
     pass
 
 
+class KazooLocustInternalsException(KazooLocustException):
+    pass
+
+
+# Private Kazoo attributes (as paths from the client) used by
+# `_PersistentWatches`, for Kazoo versions without `add_watch`, and by
+# `abandon_session`.  Both are known to work with Kazoo 2.11.
+_persistent_watch_internals = [
+    '_connection._read_watch_event', '_call', 'chroot', 'handler'
+]
+_abandon_session_internals = [
+    '_stopped', '_connection._socket', '_connection._write_sock',
+    '_safe_close'
+]
+
+
+def _check_internals(zk, names, feature, requirement='Kazoo 2.11'):
+    """Raises a `KazooLocustInternalsException` up front, rather than
+    an `AttributeError` in the middle of a run, if Kazoo lacks any of
+    the private attributes `names`."""
+    missing = []
+    for name in names:
+        obj = zk
+        for part in name.split('.'):
+            if not hasattr(obj, part):
+                missing.append(name)
+                break
+            obj = getattr(obj, part)
+    if missing:
+        raise KazooLocustInternalsException(
+            '%s relies on Kazoo internals missing from Kazoo %s (%s); '
+            'it requires %s' % (feature, getattr(kazoo, '__version__', '?'),
+                                ', '.join(missing), requirement))
+
+
+_collateral_transaction_errors = (kazoo.exceptions.RolledBackError,
+                                  kazoo.exceptions.RuntimeInconsistency)
+
+_session_states = {
+    KazooState.CONNECTED: SESSION_CONNECTED,
+    KazooState.SUSPENDED: SESSION_SUSPENDED,
+    KazooState.LOST: SESSION_LOST
+}
+
 _global_handler = os.getenv('KAZOO_LOCUST_HANDLER')
 _global_timeout_s = os.getenv('KAZOO_LOCUST_TIMEOUT_S')
 
@@ -72,10 +123,108 @@ else:
     _create_kazoo_client_fn = kazoo.client.KazooClient
 
 
+# `addWatch` modes.
+_ADD_WATCH_PERSISTENT, _ADD_WATCH_PERSISTENT_RECURSIVE = [0, 1]
+
+
+class _AddWatch(namedtuple('_AddWatch', 'path mode')):
+    type = 106
+
+    def serialize(self):
+        b = bytearray()
+        b.extend(write_string(self.path))
+        b.extend(int_struct.pack(self.mode))
+        return b
+
+    @classmethod
+    def deserialize(cls, bytes, offset):
+        return True
+
+
+def _ancestors(path):
+    while path != '/':
+        path = path[:path.rindex('/')] or '/'
+        yield path
+
+
+class _PersistentWatches(object):
+    """Persistent and persistent-recursive watches (ZooKeeper 3.6+) for
+    Kazoo versions without `add_watch`: sends the `addWatch` requests,
+    and routes the resulting notifications to the watchers--Kazoo only
+    knows about one-shot watches, and would drop them.
+
+    Watches are re-added after a reconnection; events which occurred
+    while disconnected are lost."""
+
+    def __init__(self, zk):
+        self.zk = zk
+        # {path: [(callback, recursive)]}
+        self.watchers = {}
+        self._lost = False
+
+        connection = zk._connection
+        read_watch_event = connection._read_watch_event
+
+        def _read_watch_event(buffer, offset):
+            self._dispatch(buffer, offset)
+            read_watch_event(buffer, offset)
+
+        connection._read_watch_event = _read_watch_event
+        zk.add_listener(self._on_state)
+
+    def _add_watch(self, path, recursive):
+        mode = _ADD_WATCH_PERSISTENT_RECURSIVE if recursive \
+            else _ADD_WATCH_PERSISTENT
+        async_result = self.zk.handler.async_result()
+        self.zk._call(_AddWatch(self.zk.chroot + path, mode), async_result)
+        return async_result
+
+    def add(self, path, callback, recursive):
+        self._add_watch(path, recursive).get()
+        self.watchers.setdefault(path, []).append((callback, recursive))
+
+    def _dispatch(self, buffer, offset):
+        watch = Watch.deserialize(buffer, offset)[0]
+        path = self.zk.unchroot(watch.path)
+        event_type = EVENT_TYPE_MAP.get(watch.type)
+        if event_type is None:
+            return
+
+        callbacks = [callback for callback, _ in self.watchers.get(path, ())]
+        if event_type != EventType.CHILD:
+            for ancestor in _ancestors(path):
+                callbacks.extend(
+                    callback
+                    for callback, recursive in self.watchers.get(ancestor, ())
+                    if recursive)
+
+        event = WatchedEvent(event_type, self.zk._state, path)
+        for callback in callbacks:
+            self.zk.handler.dispatch_callback(
+                Callback('watch', callback, (event, )))
+
+    def _readd(self):
+        for path, watchers in list(self.watchers.items()):
+            for recursive in set(recursive for _, recursive in watchers):
+                try:
+                    self._add_watch(path, recursive).get()
+                except kazoo.exceptions.KazooException:
+                    _logger.exception('Re-adding watch on %s', path)
+
+    def _on_state(self, state):
+        # Called from the connection thread, which must not block.
+        if state != KazooState.CONNECTED:
+            self._lost = True
+        elif self._lost:
+            self._lost = False
+            self.zk.handler.spawn(self._readd)
+
+
 class KazooLocustClient(AbstractZKLocustClient):
     _started = False
     _sasl_options = None
     _pseudo_root = None
+    _persistent_watches = None
 
     def __init__(self,
                  hosts,
@@ -111,6 +260,8 @@ class KazooLocustClient(AbstractZKLocustClient):
 
         self._set_zk_client(_create_kazoo_client_fn(hosts=hosts, **kwargs))
 
+        self._hosts = hosts
+        self._handler = handler
         self._sasl_options = sasl_options
 
         if autostart:
@@ -119,6 +270,15 @@ class KazooLocustClient(AbstractZKLocustClient):
     def node_exists_except(self):
         return kazoo.exceptions.NodeExistsError
 
+    def no_node_except(self):
+        return kazoo.exceptions.NoNodeError
+
+    def connect_timeout_except(self):
+        # Not a `KazooException`: `gevent.Timeout` or
+        # `KazooTimeoutError`, depending on the handler.
+        return super(KazooLocustClient,
+                     self).get_zk_client().handler.timeout_exception
+
     def start(self):
         if self._started:
             raise KazooLocustStartedException()
@@ -135,6 +295,74 @@ class KazooLocustClient(AbstractZKLocustClient):
     def has_sasl_auth(self):
         return self._sasl_options is not None
 
+    def supports_transactions(self):
+        return True
+
+    def supports_persistent_watches(self):
+        zk = super(KazooLocustClient, self).get_zk_client()
+        if not hasattr(zk, 'add_watch'):
+            _check_internals(zk, _persistent_watch_internals,
+                             'Persistent watch emulation',
+                             'Kazoo 2.11, or a version with add_watch')
+        return True
+
+    def add_persistent_watch(self, path, callback, recursive=False):
+        zk = self.get_zk_client()
+        if hasattr(zk, 'add_watch'):
+            from kazoo.protocol.states import AddWatchMode
+            mode = AddWatchMode.PERSISTENT_RECURSIVE if recursive \
+                else AddWatchMode.PERSISTENT
+            zk.add_watch(path, callback, mode)
+            return
+        if not self._persistent_watches:
+            self._persistent_watches = _PersistentWatches(zk)
+        self._persistent_watches.add(path, callback, recursive)
+
+    def new_session_client(self, timeout_s=None):
+        # Such sessions may be abandoned; see `abandon_session`.
+        _check_internals(
+            super(KazooLocustClient, self).get_zk_client(),
+            _abandon_session_internals, 'Session abandonment')
+        return KazooLocustClient(
+            hosts=self._hosts,
+            pseudo_root=None,
+            handler=self._handler,
+            sasl_options=self._sasl_options,
+            timeout=timeout_s,
+            autostart=False)
+
+    def abandon_session(self):
+        if not self._started:
+            return
+        zk = super(KazooLocustClient, self).get_zk_client()
+        # Unlike `stop`, does not queue a `closeSession` request: the
+        # connection loop notices the dropped socket, and exits.
+        zk._stopped.set()
+        sock = zk._connection._socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        zk._connection._write_sock.send(b'\0')
+        zk._safe_close()
+        self._started = False
+
+    def add_session_listener(self, listener):
+        def on_state(state):
+            listener(_session_states[state])
+
+        super(KazooLocustClient, self).get_zk_client().add_listener(on_state)
+
+    def transaction_error(self, results):
+        errors = [r for r in results if isinstance(r, Exception)]
+        for e in errors:
+            # Other ops of a failed transaction are reported as rolled
+            # back or "inconsistent."
+            if not isinstance(e, _collateral_transaction_errors):
+                return e
+        return errors[0] if errors else None
+
     def get_zk_client(self):
         if self._started:
             return super(KazooLocustClient, self).get_zk_client()
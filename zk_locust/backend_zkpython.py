@@ -99,6 +99,9 @@ class ZKLocustClient(AbstractZKLocustClient):
     def node_exists_except(self):
         return zookeeper.NodeExistsException
 
+    def no_node_except(self):
+        return zookeeper.NoNodeException
+
     def stop(self):
         self.get_zk_client().close()
 
@@ -0,0 +1,114 @@
+import os
+import time
+import logging
+
+import gevent
+
+import locust.runners
+from locust import events
+
+_logger = logging.getLogger(__name__)
+
+# Time after which the notifications of an update are considered to
+# have all been reported.  Must exceed the slave reporting interval.
+_settle_ms = int(os.getenv('ZK_LOCUST_WATCH_FANOUT_SETTLE_MS') or '10000')
+
+_report_key = 'zk_watch_fanout'
+
+# [(name, seq, latency_ms)] noted by this process since the last report.
+_pending = []
+_registered = False
+
+
+def note_notification(name, seq, latency_ms):
+    """Notes the delivery of update `seq` to one of the watchers of the
+    fan-out benchmark `name` (see `ZKWatchFanOutOp`)."""
+    if _registered:
+        _pending.append((name, seq, latency_ms))
+
+
+def _take_pending():
+    global _pending
+    pending = _pending
+    _pending = []
+    return pending
+
+
+class _Aggregator(object):
+    """Gathers the notification latencies of each update, across all
+    watchers (and workers), and reports the first, median and last of
+    them as `fanout_first`, `fanout_median` and `fanout_last`
+    requests, with the number of notified watchers as the response
+    length."""
+
+    def __init__(self, settle_ms):
+        self.settle_s = settle_ms / 1000
+        # {(name, seq): (first_seen, [latency_ms])}
+        self.updates = {}
+
+    def add(self, notifications):
+        now = time.monotonic()
+        for name, seq, latency_ms in notifications:
+            key = (name, seq)
+            update = self.updates.get(key)
+            if update is None:
+                update = (now, [])
+                self.updates[key] = update
+            update[1].append(latency_ms)
+
+    def settle(self):
+        now = time.monotonic()
+        settled = [
+            key for key, (first_seen, _) in self.updates.items()
+            if now - first_seen >= self.settle_s
+        ]
+        for key in sorted(settled):
+            name, seq = key
+            latencies = sorted(self.updates.pop(key)[1])
+            for request_type, latency_ms in [
+                ('fanout_first', latencies[0]),
+                ('fanout_median', latencies[len(latencies) // 2]),
+                ('fanout_last', latencies[-1]),
+            ]:
+                events.request_success.fire(
+                    request_type=request_type,
+                    name=name,
+                    response_time=latency_ms,
+                    response_length=len(latencies))
+
+
+def _fanout_loop(settle_ms):
+    while not locust.runners.locust_runner:
+        gevent.idle()
+
+    if isinstance(locust.runners.locust_runner,
+                  locust.runners.SlaveLocustRunner):
+
+        def on_report_to_master(client_id, data):
+            data[_report_key] = _take_pending()
+
+        events.report_to_master += on_report_to_master
+        return
+
+    aggregator = _Aggregator(settle_ms)
+
+    if isinstance(locust.runners.locust_runner,
+                  locust.runners.MasterLocustRunner):
+
+        def on_slave_report(client_id, data):
+            aggregator.add(data.get(_report_key) or [])
+
+        events.slave_report += on_slave_report
+
+    while True:
+        aggregator.add(_take_pending())
+        aggregator.settle()
+        gevent.sleep(1)
+
+
+def register_watch_fanout(settle_ms=_settle_ms):
+    """Enables the per-update aggregation of `ZKWatchFanOutOp`
+    notification latencies, on the master or in standalone mode."""
+    global _registered
+    _registered = True
+    gevent.spawn(_fanout_loop, settle_ms)
@@ -0,0 +1,241 @@
+import os
+import re
+import random
+
+from abc import ABCMeta, abstractmethod
+from array import array
+
+_env_prefix = 'ZK_LOCUST_KEY_DISTRIBUTION'
+
+# {suffix: spec}, where suffix is '' for the global default, or
+# '_<TASK_SET>' or '_<TASK_SET>_<REQUEST_TYPE>' for overrides.
+_env_specs = {
+    key[len(_env_prefix):]: value
+    for key, value in os.environ.items()
+    if key.startswith(_env_prefix) and value
+}
+
+UNIFORM, SEQUENTIAL, ZIPFIAN, SCRAMBLED_ZIPFIAN, HOTSPOT, LATEST = [
+    'uniform', 'sequential', 'zipfian', 'scrambled_zipfian', 'hotspot',
+    'latest'
+]
+
+_default_theta = 0.99
+
+
+def _alias_table(weights):
+    """Builds a Vose alias table for `weights`, allowing O(1) sampling
+    (see `AliasDistribution`).  Returns a `(prob, alias)` tuple."""
+    n = len(weights)
+    total = float(sum(weights))
+    scaled = [w * n / total for w in weights]
+
+    prob = array('d', [1.0]) * n
+    alias = array('l', range(n))
+
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s = small.pop()
+        g = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = g
+        scaled[g] -= 1.0 - scaled[s]
+        (small if scaled[g] < 1.0 else large).append(g)
+    # Leftovers are 1.0, modulo rounding errors.
+    return prob, alias
+
+
+def _zipfian_weights(n, theta):
+    return [1.0 / (i + 1)**theta for i in range(n)]
+
+
+def _fnv1a_64(i):
+    h = 0xcbf29ce484222325
+    for _ in range(8):
+        h ^= i & 0xff
+        h = (h * 0x100000001b3) & 0xffffffffffffffff
+        i >>= 8
+    return h
+
+
+class KeyDistribution(metaclass=ABCMeta):
+    """Samples key indices in `[0, n)`."""
+
+    def __init__(self, n):
+        self.n = n
+
+    @abstractmethod
+    def next(self):
+        pass
+
+    def record(self, i):
+        """Notes that key `i` has just been written."""
+        pass
+
+
+class UniformDistribution(KeyDistribution):
+    def next(self):
+        return random.randrange(self.n)
+
+
+class SequentialDistribution(KeyDistribution):
+    def __init__(self, n):
+        super(SequentialDistribution, self).__init__(n)
+        self._seq = 0
+
+    def next(self):
+        i = self._seq % self.n
+        self._seq += 1
+        return i
+
+
+class AliasDistribution(KeyDistribution):
+    """Samples from arbitrary `weights` in constant time, using a
+    precomputed alias table: a uniformly-chosen column `i` yields `i`
+    with probability `prob[i]`, and `alias[i]` otherwise."""
+
+    def __init__(self, weights):
+        super(AliasDistribution, self).__init__(len(weights))
+        self._prob, self._alias = _alias_table(weights)
+
+    def next(self):
+        u = random.random() * self.n
+        i = int(u)
+        return i if u - i < self._prob[i] else self._alias[i]
+
+
+class ZipfianDistribution(AliasDistribution):
+    """Key `i` has a probability proportional to `1 / (i + 1)**theta`;
+    low keys are thus the hottest."""
+
+    def __init__(self, n, theta=_default_theta):
+        super(ZipfianDistribution, self).__init__(_zipfian_weights(n, theta))
+
+
+class ScrambledZipfianDistribution(AliasDistribution):
+    """A zipfian distribution whose popular keys are scattered over the
+    key space by hashing, as in YCSB.  The hashing is folded into the
+    table, so sampling remains O(1)."""
+
+    def __init__(self, n, theta=_default_theta):
+        weights = [0.0] * n
+        for i, w in enumerate(_zipfian_weights(n, theta)):
+            weights[_fnv1a_64(i) % n] += w
+        super(ScrambledZipfianDistribution, self).__init__(weights)
+
+
+class HotspotDistribution(AliasDistribution):
+    """The first `fraction` of the key space receives `probability` of
+    the accesses, uniformly; the rest of the keys share the remainder."""
+
+    def __init__(self, n, fraction=0.2, probability=0.8):
+        hot = min(max(int(n * fraction), 1), n)
+        cold = n - hot
+        if cold == 0:
+            weights = [1.0] * n
+        else:
+            weights = [probability / hot] * hot + \
+                [(1.0 - probability) / cold] * cold
+        super(HotspotDistribution, self).__init__(weights)
+
+
+class LatestDistribution(ZipfianDistribution):
+    """Favors the most recently written keys: samples a zipfian
+    "distance" back from the last key passed to `record`."""
+
+    def __init__(self, n, theta=_default_theta):
+        super(LatestDistribution, self).__init__(n, theta)
+        self._latest = 0
+
+    def next(self):
+        distance = super(LatestDistribution, self).next()
+        return (self._latest - distance) % self.n
+
+    def record(self, i):
+        self._latest = i
+
+
+_factories = {
+    UNIFORM: UniformDistribution,
+    SEQUENTIAL: SequentialDistribution,
+    ZIPFIAN: ZipfianDistribution,
+    SCRAMBLED_ZIPFIAN: ScrambledZipfianDistribution,
+    HOTSPOT: HotspotDistribution,
+    LATEST: LatestDistribution
+}
+
+
+def parse_spec(spec):
+    """Parses a distribution spec of the form `<kind>[:<key>=<value>,...]`,
+    e.g. `zipfian:theta=0.8` or `hotspot:fraction=0.1,probability=0.9`.
+    Returns a `(kind, params)` tuple."""
+    kind, _, rest = spec.strip().partition(':')
+    kind = kind.strip().replace('-', '_')
+    if kind not in _factories:
+        raise ValueError('Unknown key distribution %r; expected one of %s' %
+                         (kind, ', '.join(sorted(_factories))))
+    params = {}
+    for item in filter(None, (s.strip() for s in rest.split(','))):
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError('Malformed key distribution parameter %r' % item)
+        params[key.strip()] = float(value)
+    return kind, params
+
+
+# Tables are shared by all ops (of a process) with the same spec.
+_cache = {}
+
+
+def create_distribution(spec, key_space_size):
+    """Returns the (shared) `KeyDistribution` described by `spec`, a
+    string (see `parse_spec`), over `key_space_size` keys."""
+    n = key_space_size
+    kind, params = parse_spec(spec)
+    key = (kind, tuple(sorted(params.items())), n)
+    distribution = _cache.get(key)
+    if distribution is None:
+        distribution = _factories[kind](n, **params)
+        _cache[key] = distribution
+    return distribution
+
+
+def _env_suffix(name):
+    return '_' + re.sub(r'[^A-Z0-9]', '_', name.upper())
+
+
+def spec_from_env(task_set_name=None, request_type=None):
+    """Returns the distribution spec configured for an op via the
+    environment, or None.  The most specific of
+    `ZK_LOCUST_KEY_DISTRIBUTION_<TASK_SET>_<REQUEST_TYPE>`,
+    `ZK_LOCUST_KEY_DISTRIBUTION_<TASK_SET>` and
+    `ZK_LOCUST_KEY_DISTRIBUTION` wins."""
+    candidates = []
+    if task_set_name:
+        suffix = _env_suffix(task_set_name)
+        if request_type:
+            candidates.append(suffix + _env_suffix(request_type))
+        candidates.append(suffix)
+    candidates.append('')
+    for suffix in candidates:
+        spec = _env_specs.get(suffix)
+        if spec:
+            return spec
+    return None
+
+
+def resolve_distribution(key_distribution,
+                         key_space_size,
+                         *,
+                         task_set_name=None,
+                         request_type=None):
+    """Resolves an op's `key_distribution` argument--a
+    `KeyDistribution`, a spec string, or None to consult the
+    environment.  Returns None if no distribution is configured."""
+    if isinstance(key_distribution, KeyDistribution):
+        return key_distribution
+    spec = key_distribution or spec_from_env(task_set_name, request_type)
+    if not spec:
+        return None
+    return create_distribution(spec, key_space_size)
@@ -0,0 +1,188 @@
+import os
+import json
+
+from collections import deque
+
+from .keys import AliasDistribution
+from .ops import ZKGetOp, ZKSetOp, ZKIncrementingSetOp, \
+    ZKCreateEphemeralOp, ZKDeleteFromQueueOp, ZKExistsOp, ZKGetChildrenOp, \
+    ZKGetChildren2Op, ZKCountChildrenOp, ZKTransactionOp
+
+_default_spec = os.getenv('ZK_LOCUST_MIX')
+
+_key_options = ['key_distribution', 'key_space_size', 'val_size']
+
+# {op: (options, factory)}, where `factory` is called with the client,
+# the task set name, the options set for the entry, and the state
+# shared by the ops of a mix.
+_op_kinds = {
+    'get': (_key_options, lambda client, name, options, shared: ZKGetOp(
+        client, task_set_name=name, **options)),
+    'set': (_key_options, lambda client, name, options, shared: ZKSetOp(
+        client, task_set_name=name, **options)),
+    'incrementing_set':
+    (_key_options, lambda client, name, options, shared: ZKIncrementingSetOp(
+        client, task_set_name=name, **options)),
+    'create': (['val_size'],
+               lambda client, name, options, shared: ZKCreateEphemeralOp(
+                   client,
+                   task_set_name=name,
+                   push=shared['created'].append,
+                   **options)),
+    'delete': ([], lambda client, name, options, shared: ZKDeleteFromQueueOp(
+        client, shared['created'].popleft, task_set_name=name)),
+    'exists': (['path'], lambda client, name, options, shared: ZKExistsOp(
+        client, options.get('path') or shared['path'], task_set_name=name)),
+    'get_children':
+    (['path'], lambda client, name, options, shared: ZKGetChildrenOp(
+        client, options.get('path') or shared['path'], task_set_name=name)),
+    'get_children2':
+    (['path'], lambda client, name, options, shared: ZKGetChildren2Op(
+        client, options.get('path') or shared['path'], task_set_name=name)),
+    'count_children':
+    (['path'], lambda client, name, options, shared: ZKCountChildrenOp(
+        client, path=options.get('path'), task_set_name=name)),
+    'multi': (['sub_ops', 'pipeline'] + _key_options,
+              lambda client, name, options, shared: ZKTransactionOp(
+                  client, task_set_name=name, **options))
+}  # yapf:disable
+
+
+def _parse_text(text, is_yaml=False):
+    if not is_yaml:
+        try:
+            return json.loads(text)
+        except ValueError:
+            # YAML being a superset of JSON.
+            pass
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError('PyYAML is required for YAML mix specs')
+    return yaml.safe_load(text)
+
+
+def load_mix_spec(spec):
+    """Loads a mix spec from `spec`: JSON or YAML text, or the path of
+    a `.json`, `.yaml` or `.yml` file."""
+    spec = spec.strip()
+    if spec[:1] not in '{[' and os.path.isfile(spec):
+        with open(spec) as f:
+            text = f.read()
+        if spec.endswith('.json'):
+            return json.loads(text)
+        return _parse_text(text, spec.endswith(('.yaml', '.yml')))
+    return _parse_text(spec)
+
+
+class MixEntry(object):
+    def __init__(self, op, weight, options):
+        self.op = op
+        self.weight = weight
+        self.options = options
+
+    def __repr__(self):
+        return 'MixEntry(%r, %r, %r)' % (self.op, self.weight, self.options)
+
+
+class Mix(object):
+    """A weighted mix of ops, described by a spec such as:
+
+        {
+          "name": "prod",
+          "defaults": {"key_distribution": "zipfian"},
+          "ops": [
+            {"op": "get", "weight": 90},
+            {"op": "set", "weight": 8, "val_size": "uniform:min=8,max=512"},
+            {"op": "create", "weight": 2}
+          ]
+        }
+
+    `ops` can also be a mapping from ops to weights (or to entries
+    without `op`), and the spec can be reduced to `ops`.  The
+    `defaults` apply to the entries of all ops accepting them.
+
+    Ops are `get`, `set` and `incrementing_set` (accepting
+    `key_distribution`, `key_space_size` and `val_size`), `create`
+    (ephemeral, accepting `val_size`), `delete` (of nodes created by
+    `create`), `exists`, `get_children`, `get_children2` and
+    `count_children` (accepting `path`), and `multi` (also accepting
+    `sub_ops` and `pipeline`)."""
+
+    def __init__(self, spec):
+        if isinstance(spec, str):
+            spec = load_mix_spec(spec)
+        if isinstance(spec, (list, tuple)) or (isinstance(spec, dict)
+                                               and 'ops' not in spec):
+            spec = {'ops': spec}
+        if not isinstance(spec, dict):
+            raise ValueError('Malformed mix spec %r' % spec)
+
+        self.name = spec.get('name')
+        defaults = spec.get('defaults') or {}
+        ops = spec.get('ops')
+        if isinstance(ops, dict):
+            ops = [
+                dict(entry, op=op) if isinstance(entry, dict) else {
+                    'op': op,
+                    'weight': entry
+                } for op, entry in ops.items()
+            ]
+        if not ops:
+            raise ValueError('Empty mix spec')
+
+        self.entries = [self._parse_entry(entry, defaults) for entry in ops]
+
+    def _parse_entry(self, entry, defaults):
+        entry = dict(entry)
+        op = entry.pop('op', None)
+        if op not in _op_kinds:
+            raise ValueError('Unknown mix op %r; expected one of %s' %
+                             (op, ', '.join(sorted(_op_kinds))))
+        try:
+            weight = float(entry.pop('weight'))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Mix op %r requires a numeric weight' % op)
+        if weight <= 0:
+            raise ValueError('Mix op %r has a non-positive weight' % op)
+
+        accepted = _op_kinds[op][0]
+        unknown = [key for key in entry if key not in accepted]
+        if unknown:
+            raise ValueError('Mix op %r does not accept %s' %
+                             (op, ', '.join(sorted(unknown))))
+        options = {
+            key: value
+            for key, value in defaults.items() if key in accepted
+        }
+        options.update(entry)
+        return MixEntry(op, weight, options)
+
+    def create_ops(self, client, task_set_name):
+        """Returns the ops of the mix, in the order of its entries."""
+        shared = {'created': deque(), 'path': client.join_path('/')}
+        return [
+            _op_kinds[entry.op][1](client, task_set_name,
+                                   dict(entry.options), shared)
+            for entry in self.entries
+        ]
+
+    def create_sampler(self):
+        """Returns an `AliasDistribution` over the entries of the mix."""
+        return AliasDistribution([entry.weight for entry in self.entries])
+
+
+# Mixes are parsed once per process and spec.
+_mixes = {}
+
+
+def get_mix(spec=None):
+    spec = spec or _default_spec
+    if not spec:
+        raise ValueError('No mix spec (ZK_LOCUST_MIX) provided')
+    key = spec if isinstance(spec, str) else json.dumps(spec, sort_keys=True)
+    mix = _mixes.get(key)
+    if mix is None:
+        mix = Mix(spec)
+        _mixes[key] = mix
+    return mix
@@ -1,18 +1,66 @@
 import random
 import os
-import sys
+import re
 import time
+import struct
 
+from collections import deque
 from datetime import datetime
 
+import gevent
+import gevent.event
+import gevent.queue
 from gevent import GreenletExit
 
 from locust import Locust, TaskSet, events
 
-from . import LocustTimer, get_backend_exceptions, note_backend_exception
+from . import LocustTimer, WORKER_INDEX, WORKER_COUNT, \
+    get_backend_exceptions, note_backend_exception
+from .backend_base import ZKLocustException
+from .keys import resolve_distribution, create_distribution, UNIFORM
+from .payloads import SizeDistribution, get_payload_pool, \
+    random_printable_bytes
+from .fanout import note_notification
+from .sessions import get_session_storm
+from .sub_ops import note_sub_ops
+from .replay import get_trace_replay
 
 _default_key_size = int(os.getenv('ZK_LOCUST_KEY_SIZE') or '8')
 _default_val_size = int(os.getenv('ZK_LOCUST_VAL_SIZE') or '8')
+_default_val_size_distribution = os.getenv('ZK_LOCUST_VAL_SIZE_DISTRIBUTION')
+_default_key_space_size = int(os.getenv('ZK_LOCUST_KEY_SPACE_SIZE') or '128')
+_key_manifest_path = os.getenv('ZK_LOCUST_KEY_MANIFEST')
+
+_default_multi_ops = os.getenv('ZK_LOCUST_MULTI_OPS') or \
+    'check=1,set=2,create=1,delete=1'
+_default_multi_pipeline = int(os.getenv('ZK_LOCUST_MULTI_PIPELINE') or '0')
+
+_default_fanout_interval_ms = int(
+    os.getenv('ZK_LOCUST_WATCH_FANOUT_INTERVAL_MS') or '1000')
+
+WATCH_CLOCK_MONOTONIC, WATCH_CLOCK_WALL = ['monotonic', 'wall']
+
+_default_watch_clock = os.getenv('ZK_LOCUST_WATCH_CLOCK') or \
+    WATCH_CLOCK_MONOTONIC
+_default_watch_verify = int(os.getenv('ZK_LOCUST_WATCH_VERIFY') or '0') > 0
+
+PURGE_CLOSE, PURGE_EXPIRE = ['close', 'expire']
+
+_default_purge_count = int(
+    os.getenv('ZK_LOCUST_EPHEMERAL_PURGE_COUNT') or '1000')
+_default_purge_hold_ms = int(
+    os.getenv('ZK_LOCUST_EPHEMERAL_PURGE_HOLD_MS') or '5000')
+_default_purge_mode = os.getenv('ZK_LOCUST_EPHEMERAL_PURGE_MODE') or \
+    PURGE_CLOSE
+_default_purge_timeout_ms = int(
+    os.getenv('ZK_LOCUST_EPHEMERAL_PURGE_TIMEOUT_MS') or '0')
+_default_purge_pipeline = int(
+    os.getenv('ZK_LOCUST_EPHEMERAL_PURGE_PIPELINE') or '64')
+
+_default_persistent_watch_depth = int(
+    os.getenv('ZK_LOCUST_PERSISTENT_WATCH_DEPTH') or '2')
+_default_persistent_watch_fanout = int(
+    os.getenv('ZK_LOCUST_PERSISTENT_WATCH_FANOUT') or '8')
 
 _default_ignore_connection_down = int(
     os.getenv('ZK_LOCUST_IGNORE_CONNECTION_DOWN') or '0') > 0
@@ -49,6 +97,10 @@ def duration(delta):
     return iteration
 
 
+def _key_path(client, key_size, key_i):
+    return client.join_path('/c-' + str(key_i).zfill(key_size - 2))
+
+
 def _gen_test_path(client, key_size, sequential_keys, key_space_size):
     if (sequential_keys):
         global key_seq
@@ -57,14 +109,15 @@ def _gen_test_path(client, key_size, sequential_keys, key_space_size):
     else:
         key_i = random.randrange(0, key_space_size)
 
-    return client.join_path('/c-' + str(key_i).zfill(key_size - 2))
+    return _key_path(client, key_size, key_i)
 
 
 def _gen_random_bytes(val_size):
     if val_size is None:
-        val_size = _default_val_size
-    # Note: zkpython does not support binary values!
-    return bytes(random.randint(32, 127) for _ in range(val_size))
+        val_size = _default_val_size_distribution or _default_val_size
+    # Drawn from a shared pool of pregenerated (printable, as zkpython
+    # does not support binary values) payloads.
+    return get_payload_pool(val_size).draw()
 
 
 def _create_random_key(client, key_size, sequential_keys, key_space_size,
@@ -81,6 +134,84 @@ def _create_random_key(client, key_size, sequential_keys, key_space_size,
     return (n, v)
 
 
+# Paths created by `_KeyPicker`s of this process.
+_created_paths = set()
+
+
+_key_manifest = None
+
+
+def _get_key_manifest():
+    global _key_manifest
+    if _key_manifest is None and _key_manifest_path:
+        from zk_preload import load_manifest
+        _key_manifest = load_manifest(_key_manifest_path)
+        if not _key_manifest.complete:
+            raise ValueError('Preload of %s is incomplete' %
+                             _key_manifest_path)
+    return _key_manifest
+
+
+class _KeyPicker(object):
+    """Picks a test path per operation according to a key distribution
+    (see `zk_locust.keys`).  Picks the leaves of a preloaded tree if a
+    `manifest` is provided (see `zk_preload`), and otherwise creates
+    each path when it is first picked."""
+
+    def __init__(self, client, distribution, key_size, val_size,
+                 manifest=None):
+        self._client = client
+        self._k = client.get_zk_client()
+        self._distribution = distribution
+        self._key_size = key_size
+        self._v = _gen_random_bytes(val_size)
+        self._manifest = manifest
+
+    def pick(self):
+        i = self._distribution.next()
+        if self._manifest:
+            return i, self._manifest.path(i)
+        n = _key_path(self._client, self._key_size, i)
+        if n not in _created_paths:
+            try:
+                self._k.create(n, self._v)
+            except self._client.node_exists_except():
+                pass
+            _created_paths.add(n)
+        return i, n
+
+    def record(self, i):
+        self._distribution.record(i)
+
+
+def _key_picker(client,
+                key_distribution,
+                key_space_size,
+                key_size,
+                val_size,
+                task_set_name,
+                request_type,
+                default_distribution=None):
+    manifest = _get_key_manifest()
+    if manifest:
+        key_space_size = manifest.count
+    else:
+        key_space_size = key_space_size or _default_key_space_size
+    distribution = resolve_distribution(
+        key_distribution,
+        key_space_size,
+        task_set_name=task_set_name,
+        request_type=request_type)
+    if distribution is None:
+        if manifest:
+            default_distribution = default_distribution or UNIFORM
+        if not default_distribution:
+            return None
+        distribution = create_distribution(default_distribution,
+                                           key_space_size)
+    return _KeyPicker(client, distribution, key_size, val_size, manifest)
+
+
 class AbstractOp(object):
     def __init__(self,
                  client,
@@ -158,28 +289,58 @@ class ZKConnectOp(AbstractSingleTimerOp):
             self.client.stop()
 
 
+class ZKSessionStormOp(AbstractOp):
+    """Drives the process-wide session storm `task_set_name` (see
+    `zk_locust.sessions.SessionStorm`, which `kwargs` are passed to)
+    from a Locust user."""
+
+    def __init__(self,
+                 client,
+                 *,
+                 task_set_name='session_storm',
+                 maybe_interrupt=None,
+                 **kwargs):
+        super(ZKSessionStormOp, self).__init__(
+            client, maybe_interrupt=maybe_interrupt)
+
+        self._task_set_name = task_set_name
+        self._storm = get_session_storm(client, name=task_set_name, **kwargs)
+
+    def get_task_set_name(self):
+        return self._task_set_name
+
+    def op(self):
+        self._storm.step()
+
+
 class ZKGetOp(AbstractSingleTimerOp):
     def __init__(self,
                  client,
                  *,
                  request_type='get',
                  sequential_keys=False,
-                 key_space_size=128,
+                 key_space_size=None,
                  key_size=_default_key_size,
                  val_size=None,
+                 key_distribution=None,
                  **kwargs):
         super(ZKGetOp, self).__init__(
             client, request_type=request_type, **kwargs)
         self._k = self.client.get_zk_client()
 
-        n, v = _create_random_key(client, key_size, sequential_keys,
-                                  key_space_size, val_size)
-
-        self._n = n
+        self._keys = _key_picker(client, key_distribution, key_space_size,
+                                 key_size, val_size, self._task_set_name,
+                                 request_type)
+        if not self._keys:
+            n, v = _create_random_key(client, key_size, sequential_keys,
+                                      key_space_size
+                                      or _default_key_space_size, val_size)
+            self._n = n
 
     def op(self):
+        n = self._keys.pick()[1] if self._keys else self._n
         with self.timing() as ctx:
-            self._k.get(self._n)
+            self._k.get(n)
             ctx.success()
 
 
@@ -189,24 +350,36 @@ class ZKSetOp(AbstractSingleTimerOp):
                  *,
                  request_type='set',
                  sequential_keys=False,
-                 key_space_size=128,
+                 key_space_size=None,
                  key_size=_default_key_size,
                  val_size=None,
+                 key_distribution=None,
                  **kwargs):
         super(ZKSetOp, self).__init__(
             client, request_type=request_type, **kwargs)
         self._k = self.client.get_zk_client()
 
-        n, v = _create_random_key(client, key_size, sequential_keys,
-                                  key_space_size, val_size)
-
-        self._n = n
-        self._v = v
+        self._val_size = val_size
+        self._keys = _key_picker(client, key_distribution, key_space_size,
+                                 key_size, val_size, self._task_set_name,
+                                 request_type)
+        if not self._keys:
+            n, v = _create_random_key(client, key_size, sequential_keys,
+                                      key_space_size
+                                      or _default_key_space_size, val_size)
+            self._n = n
 
     def op(self):
+        if self._keys:
+            i, n = self._keys.pick()
+        else:
+            i, n = None, self._n
+        v = _gen_random_bytes(self._val_size)
         with self.timing() as ctx:
-            self._k.set(self._n, self._v)
+            self._k.set(n, v)
             ctx.success()
+        if i is not None:
+            self._keys.record(i)
 
 
 class ZKIncrementingSetOp(AbstractSingleTimerOp):
@@ -215,19 +388,31 @@ class ZKIncrementingSetOp(AbstractSingleTimerOp):
                  *,
                  request_type='incr_set',
                  sequential_keys=False,
-                 key_space_size=128,
+                 key_space_size=None,
                  key_size=_default_key_size,
                  val_size=None,
+                 key_distribution=None,
                  **kwargs):
         super(ZKIncrementingSetOp, self).__init__(
             client, request_type=request_type, **kwargs)
         self._k = self.client.get_zk_client()
 
-        n = _gen_test_path(client, key_size, sequential_keys, key_space_size)
+        self._i = 0
+        # The value is the counter, zero-padded to a size drawn from
+        # `val_size` (a size or a `SizeDistribution` spec).
+        self._val_sizes = SizeDistribution(val_size or _default_val_size)
+        self._rng = random.Random()
+
+        self._keys = _key_picker(client, key_distribution, key_space_size,
+                                 key_size, val_size, self._task_set_name,
+                                 request_type)
+        if self._keys:
+            return
+
+        n = _gen_test_path(client, key_size, sequential_keys, key_space_size
+                           or _default_key_space_size)
 
         self._n = n
-        self._i = 0
-        self._val_size = val_size or _default_val_size
 
         v = self.next_val()
 
@@ -237,16 +422,23 @@ class ZKIncrementingSetOp(AbstractSingleTimerOp):
             pass
 
     def next_val(self):
-        v = str(self._i).zfill(self._val_size).encode('ascii')
+        v = str(self._i).zfill(self._val_sizes.sample(
+            self._rng)).encode('ascii')
         self._i += 1
         return v
 
     def op(self):
+        if self._keys:
+            i, n = self._keys.pick()
+        else:
+            i, n = None, self._n
         v = self.next_val()
 
         with self.timing() as ctx:
-            self._k.set(self._n, v)
+            self._k.set(n, v)
             ctx.success()
+        if i is not None:
+            self._keys.record(i)
 
 
 class ZKCreateEphemeralOp(AbstractSingleTimerOp):
@@ -266,19 +458,150 @@ class ZKCreateEphemeralOp(AbstractSingleTimerOp):
 
         self._k = client.get_zk_client()
         self._base_path = base_path
-        self._v = _gen_random_bytes(val_size)
+        self._val_size = val_size
         self._push = push
 
     def op(self):
         k = None
+        v = _gen_random_bytes(self._val_size)
         with self.timing() as ctx:
             k = self._k.create(
-                self._base_path, self._v, ephemeral=True, sequence=True)
+                self._base_path, v, ephemeral=True, sequence=True)
             ctx.success()
         if k and self._push:
             self._push(k)
 
 
+class ZKEphemeralPurgeOp(AbstractOp):
+    """Opens a session of its own, creates `count` ephemerals with it
+    (keeping up to `pipeline` creates in flight), holds them for
+    `hold_ms`, then drops the session--closing it (`close` mode) or
+    abandoning it to expire after `timeout_ms` (`expire` mode).
+
+    Reports `ephemeral_connect`, `ephemeral_create_all` (with the
+    number of created nodes as the response length) and, in `close`
+    mode, `ephemeral_close` requests.  The delay between dropping the
+    session and the deletion of its ephemerals, as observed via a
+    watch set from the main session, is reported as an
+    `ephemeral_purge` request--or a failure, if not observed within
+    `purge_timeout_ms` (plus `timeout_ms`, if set)."""
+
+    def __init__(self,
+                 client,
+                 *,
+                 count=None,
+                 hold_ms=None,
+                 mode=None,
+                 timeout_ms=None,
+                 pipeline=None,
+                 purge_timeout_ms=30000,
+                 task_set_name='ephemeral_purge',
+                 val_size=None,
+                 **kwargs):
+        super(ZKEphemeralPurgeOp, self).__init__(client, **kwargs)
+
+        self._k = client.get_zk_client()
+        self._count = count or _default_purge_count
+        self._hold_s = (hold_ms if hold_ms is not None else
+                        _default_purge_hold_ms) / 1000
+        self._mode = mode or _default_purge_mode
+        if self._mode not in [PURGE_CLOSE, PURGE_EXPIRE]:
+            raise ValueError('Unknown purge mode %r' % self._mode)
+        timeout_ms = timeout_ms or _default_purge_timeout_ms
+        self._timeout_s = timeout_ms / 1000 if timeout_ms else None
+        self._pipeline = max(pipeline or _default_purge_pipeline, 1)
+        self._purge_timeout_s = purge_timeout_ms / 1000
+        self._task_set_name = task_set_name
+        self._val_size = val_size
+
+        self._base_path = client.join_path('/ephemerals')
+        try:
+            self._k.create(self._base_path, b'')
+        except client.node_exists_except():
+            pass
+
+    def get_task_set_name(self):
+        return self._task_set_name
+
+    def _create_all(self, holder):
+        k = holder.get_zk_client()
+        path = self._base_path + '/e-'
+        v = _gen_random_bytes(self._val_size)
+        created = []
+        in_flight = deque()
+        with LocustTimer('ephemeral_create_all', self._task_set_name) as ctx:
+            for _ in range(self._count):
+                if len(in_flight) >= self._pipeline:
+                    created.append(in_flight.popleft().get())
+                in_flight.append(
+                    k.create_async(path, v, ephemeral=True, sequence=True))
+            while in_flight:
+                created.append(in_flight.popleft().get())
+            ctx.success(response_length=len(created))
+        return created
+
+    def _drop(self, holder):
+        if self._mode == PURGE_CLOSE:
+            with LocustTimer('ephemeral_close', self._task_set_name) as ctx:
+                holder.stop()
+                ctx.success()
+        else:
+            holder.abandon_session()
+
+    def op(self):
+        holder = self.client.new_session_client(self._timeout_s)
+        started = False
+        with LocustTimer('ephemeral_connect', self._task_set_name) as ctx:
+            try:
+                holder.start()
+            except holder.connect_timeout_except() as e:
+                ctx.failure(e)
+                holder.stop()
+            else:
+                ctx.success()
+                started = True
+        if not started:
+            return
+
+        try:
+            created = self._create_all(holder)
+            if not created:
+                holder.stop()
+                return
+            gevent.sleep(self._hold_s)
+
+            # All ephemerals of a session are deleted at once.
+            purged = gevent.event.Event()
+            purged_at = []
+
+            def zk_watch_trigger(event):
+                purged_at.append(time.monotonic())
+                purged.set()
+
+            self._k.exists(created[-1], watch=zk_watch_trigger)
+        except BaseException:
+            holder.stop()
+            raise
+
+        dropped_at = time.monotonic()
+        self._drop(holder)
+
+        timeout_s = self._purge_timeout_s + (self._timeout_s or 0)
+        if purged.wait(timeout_s):
+            events.request_success.fire(
+                request_type='ephemeral_purge',
+                name=self._task_set_name,
+                response_time=int((purged_at[0] - dropped_at) * 1000),
+                response_length=len(created))
+        else:
+            events.request_failure.fire(
+                request_type='ephemeral_purge',
+                name=self._task_set_name,
+                response_time=int(timeout_s * 1000),
+                exception=ZKLocustException(
+                    'Ephemerals not purged after %.1fs' % timeout_s))
+
+
 class ZKDeleteFromQueueOp(AbstractSingleTimerOp):
     def __init__(self, client, pop, *, request_type='delete', **kwargs):
         super(ZKDeleteFromQueueOp, self).__init__(
@@ -414,6 +737,17 @@ class ZKGetChildren2Op(AbstractSingleTimerOp):
 
 
 class ZKWatchOp(AbstractOp):
+    """Watches `path`, updates it, and reports the delay until the
+    watch fires as a `request_type` request.
+
+    With the `monotonic` clock (the default), the payload carries a
+    sequence number, and the update's send time is tracked in-process;
+    the trigger does not need to read the node back, unless `verify`
+    is set--in which case it checks that the node holds the expected
+    sequence number (or a later one).  With the `wall` clock, the
+    payload carries the wall-clock send time (in ms), which the
+    trigger reads back."""
+
     def __init__(self,
                  client,
                  path,
@@ -421,6 +755,8 @@ class ZKWatchOp(AbstractOp):
                  request_type='watch',
                  task_set_name='',
                  val_size=None,
+                 clock=None,
+                 verify=None,
                  **kwargs):
         super(ZKWatchOp, self).__init__(client, **kwargs)
 
@@ -428,24 +764,608 @@ class ZKWatchOp(AbstractOp):
         self._request_type = request_type
         self._task_set_name = task_set_name
         self._path = path
-        self._val_size = val_size or _default_val_size
+        self._val_size = max(val_size or _default_val_size, 8)
+        self._clock = clock or _default_watch_clock
+        if self._clock not in [WATCH_CLOCK_MONOTONIC, WATCH_CLOCK_WALL]:
+            raise ValueError('Unknown watch clock %r' % self._clock)
+        self._verify = _default_watch_verify if verify is None else verify
+
+        self._seq = 0
+        # (seq, monotonic send time in ns) of the updates whose watch
+        # has yet to fire, in order.
+        self._sent = deque()
+
+    def _fire(self, response_time, exception=None):
+        if exception is None:
+            events.request_success.fire(
+                request_type=self._request_type,
+                name=self._task_set_name,
+                response_time=response_time,
+                response_length=0)
+        else:
+            events.request_failure.fire(
+                request_type=self._request_type,
+                name=self._task_set_name,
+                response_time=response_time,
+                exception=exception)
+
+    def _on_monotonic_trigger(self, seq):
+        end_ns = time.monotonic_ns()
+        # Watches fire in order; those of earlier updates were lost
+        # (e.g., with the session).
+        while self._sent and self._sent[0][0] < seq:
+            self._sent.popleft()
+        if not self._sent or self._sent[0][0] != seq:
+            return
+        start_ns = self._sent.popleft()[1]
+        response_time = int((end_ns - start_ns) / 1000000)
+
+        exception = None
+        if self._verify:
+            v, stat = self._k.get(self._path)
+            found = int.from_bytes(v, byteorder='big')
+            if found < seq:
+                exception = ZKLocustException(
+                    'Watch fired for update %d, but found %d' % (seq, found))
+        self._fire(response_time, exception)
+
+    def _on_wall_trigger(self):
+        end_time = time.time()
+        v, stat = self._k.get(self._path)
+        # Decode start_time from payload
+        start_time = int.from_bytes(v, byteorder='big') / 1000
+        self._fire(int((end_time - start_time) * 1000))
 
     def op(self):
+        if self._clock == WATCH_CLOCK_WALL:
+
+            def zk_watch_trigger(event):
+                self._on_wall_trigger()
+
+            self._k.get(self._path, watch=zk_watch_trigger)
+            # Encode start_time as payload.
+            v = int(time.time() * 1000).to_bytes(
+                self._val_size, byteorder='big')
+            self._k.set_async(self._path, v)
+            return
+
+        self._seq += 1
+        seq = self._seq
+
         def zk_watch_trigger(event):
-            end_time = time.time()
-            v, stat = self._k.get(self._path)
-            # Decode start_time from payload
-            start_time = int.from_bytes(v, byteorder=sys.byteorder) / 1000
+            self._on_monotonic_trigger(seq)
 
+        # The watch is registered after the previous update has been
+        # applied, so it is triggered by this one.
+        self._k.get(self._path, watch=zk_watch_trigger)
+        v = seq.to_bytes(self._val_size, byteorder='big')
+        self._sent.append((seq, time.monotonic_ns()))
+        self._k.set_async(self._path, v)
+
+
+# Wall-clock write time (ns) and sequence number, prefixed to fan-out
+# payloads.
+_fanout_header = struct.Struct('>QQ')
+
+
+class ZKWatchFanOutOp(AbstractOp):
+    """One side of a watch fan-out benchmark: a single writer updates
+    `path` every `interval_ms`, while all other clients watch it.
+
+    The writer is elected via an ephemeral `<path>-writer` node (unless
+    `writer` is forced), and reports its updates as `fanout_write`
+    requests.  Watchers report each notification as a `fanout_notify`
+    request, whose latency is measured from the write time carried in
+    the payload, and each re-registration of their watch as a
+    `fanout_rewatch` request.  Per-update first/median/last latencies
+    are aggregated across watchers by `zk_locust.fanout`.
+
+    Latencies compare clocks of the writer and watcher machines, which
+    should thus be synchronized."""
+
+    def __init__(self,
+                 client,
+                 *,
+                 path=None,
+                 interval_ms=None,
+                 writer=None,
+                 task_set_name='watch_fanout',
+                 val_size=None,
+                 **kwargs):
+        super(ZKWatchFanOutOp, self).__init__(client, **kwargs)
+
+        self._k = client.get_zk_client()
+        self._path = path or client.join_path('/fanout')
+        self._interval_s = (interval_ms
+                            or _default_fanout_interval_ms) / 1000
+        self._task_set_name = task_set_name
+        self._val_size = val_size
+
+        try:
+            self._k.create(self._path, b'')
+        except client.node_exists_except():
+            pass
+
+        if writer is None:
+            try:
+                self._k.create(self._path + '-writer', b'', ephemeral=True)
+                writer = True
+            except client.node_exists_except():
+                writer = False
+        self._is_writer = writer
+
+        self._seq = 0
+        self._last_seq = None
+        self._registered = False
+
+    def get_task_set_name(self):
+        return self._task_set_name
+
+    def is_writer(self):
+        return self._is_writer
+
+    def _write(self):
+        self._seq += 1
+        payload = _gen_random_bytes(self._val_size)
+        v = _fanout_header.pack(time.time_ns(), self._seq) + \
+            payload[_fanout_header.size:]
+        with LocustTimer('fanout_write', self._task_set_name) as ctx:
+            self._k.set(self._path, v)
+            ctx.success(response_length=len(v))
+
+    def _watch(self, delivered_at=None):
+        try:
+            with LocustTimer('fanout_rewatch', self._task_set_name) as ctx:
+                v, stat = self._k.get(self._path, watch=self._on_event)
+                ctx.success()
+        except get_backend_exceptions():
+            self._registered = False
+            return
+        self._registered = True
+
+        if delivered_at is None or len(v) < _fanout_header.size:
+            return
+        written_at, seq = _fanout_header.unpack_from(v)
+        if seq == self._last_seq:
+            return
+        self._last_seq = seq
+        latency_ms = int((delivered_at - written_at) / 1000000)
+        if latency_ms < 0:
+            # Overtaken by a later write.
+            return
+        events.request_success.fire(
+            request_type='fanout_notify',
+            name=self._task_set_name,
+            response_time=latency_ms,
+            response_length=len(v))
+        note_notification(self._task_set_name, seq, latency_ms)
+
+    def _on_event(self, event):
+        self._watch(time.time_ns())
+
+    def op(self):
+        if self._is_writer:
+            self._write()
+        elif not self._registered:
+            self._watch()
+        gevent.sleep(self._interval_s)
+
+
+# Subtrees created by `ZKPersistentWatchOp`s of this process.
+_watched_subtrees = set()
+# {root: number of `ZKPersistentWatchOp`s of this process updating it}
+_subtree_writers = {}
+
+
+class ZKPersistentWatchOp(AbstractOp):
+    """Registers a persistent-recursive watch on the root of a subtree
+    of `fanout`^`depth` leaves (or, unless `recursive`, a persistent
+    watch on each of its nodes) and updates a leaf, to measure event
+    delivery and the server-side watch load.
+
+    With `<kind>` being `recursive_watch` or `persistent_watch`, each
+    `addWatch` is reported as a `<kind>_add` request, each update as a
+    `<kind>_write` request, and each event as a `<kind>_event` request
+    (with a zero response time, for counting).  Events caused by the
+    client's own updates are also reported as `<kind>_notify`
+    requests, with the latency between the update and the delivery
+    of its event.
+
+    As events do not identify the update which caused them, each
+    client updates a leaf of its own (the leaves being assigned
+    round-robin across the clients of all workers), and takes the
+    events of that leaf as its own.  With more clients than leaves,
+    leaves are shared and `<kind>_notify` latencies are unreliable.
+
+    Requires ZooKeeper 3.6+ and a backend which supports persistent
+    watches."""
+
+    def __init__(self,
+                 client,
+                 *,
+                 recursive=True,
+                 path=None,
+                 depth=None,
+                 fanout=None,
+                 task_set_name=None,
+                 val_size=None,
+                 **kwargs):
+        super(ZKPersistentWatchOp, self).__init__(client, **kwargs)
+
+        if not client.supports_persistent_watches():
+            raise ZKLocustException(
+                'Persistent watches are not supported by this backend')
+
+        from zk_preload import Manifest
+
+        self._k = client.get_zk_client()
+        self._kind = 'recursive_watch' if recursive else 'persistent_watch'
+        self._task_set_name = task_set_name or self._kind
+        self._val_size = val_size
+        self._subtree = Manifest(
+            root=path or client.join_path('/pwatch'),
+            depth=depth or _default_persistent_watch_depth,
+            fanout=fanout or _default_persistent_watch_fanout)
+        # {path: [sent_at]}; paths may be updated again before the
+        # event of the previous update is delivered.
+        self._sent = {}
+
+        # Unique across workers (see `ZK_LOCUST_WORKER_INDEX`/`COUNT`)
+        # as long as there are no more clients than leaves.
+        local_index = _subtree_writers.get(self._subtree.root, 0)
+        _subtree_writers[self._subtree.root] = local_index + 1
+        writer_index = local_index * WORKER_COUNT + WORKER_INDEX
+        self._leaf = self._subtree.path(writer_index % self._subtree.count)
+
+        self._create_subtree()
+        if recursive:
+            self._add_watch(self._subtree.root, True)
+        else:
+            self._add_watch(self._subtree.root, False)
+            for path in self._subtree_paths():
+                self._add_watch(path, False)
+
+    def get_task_set_name(self):
+        return self._task_set_name
+
+    def _subtree_paths(self):
+        subtree = self._subtree
+        for level in range(1, subtree.depth + 1):
+            for i in range(subtree.level_count(level)):
+                yield subtree.node_path(level, i)
+
+    def _create_subtree(self):
+        if self._subtree.root in _watched_subtrees:
+            return
+        self._k.ensure_path(self._subtree.root)
+        for path in self._subtree_paths():
+            try:
+                self._k.create(path, b'')
+            except self.client.node_exists_except():
+                pass
+        _watched_subtrees.add(self._subtree.root)
+
+    def _add_watch(self, path, recursive):
+        with LocustTimer(self._kind + '_add', self._task_set_name) as ctx:
+            self.client.add_persistent_watch(
+                path, self._on_event, recursive=recursive)
+            ctx.success()
+
+    def _on_event(self, event):
+        delivered_at = time.monotonic()
+        events.request_success.fire(
+            request_type=self._kind + '_event',
+            name=self._task_set_name,
+            response_time=0,
+            response_length=0)
+
+        sent = self._sent.get(event.path)
+        if not sent:
+            return
+        sent_at = sent.pop(0)
+        if not sent:
+            del self._sent[event.path]
+        events.request_success.fire(
+            request_type=self._kind + '_notify',
+            name=self._task_set_name,
+            response_time=int((delivered_at - sent_at) * 1000),
+            response_length=0)
+
+    def op(self):
+        path = self._leaf
+        v = _gen_random_bytes(self._val_size)
+        sent = self._sent.setdefault(path, [])
+        sent.append(time.monotonic())
+        try:
+            with LocustTimer(self._kind + '_write',
+                             self._task_set_name) as ctx:
+                self._k.set(path, v)
+                ctx.success(response_length=len(v))
+        except Exception:
+            # No event will follow.
+            sent.pop()
+            if not sent:
+                self._sent.pop(path, None)
+            raise
+
+
+# Printable, as zkpython does not support binary values; sliced for
+# each replayed `create` or `set`.
+_replay_payload = b''
+
+
+def _replay_bytes(size):
+    global _replay_payload
+    if size > len(_replay_payload):
+        _replay_payload = random_printable_bytes(max(size, 4096))
+    return _replay_payload[:size]
+
+
+class ZKTraceReplayOp(AbstractOp):
+    """Reissues, at their due time and under the pseudo-root, the trace
+    ops assigned to this user by the process-wide
+    `zk_locust.replay.TraceReplay` of `trace_path`.  Each op is reported
+    with its trace name as the request type.
+
+    As the dataset generally differs from that of the traced
+    ensemble, nodes missing for a `get`, `set`, `delete` or
+    `get_children` (and missing parents for a `create`) are created,
+    untimed, before the op is retried; a `create` of an existing node
+    counts as successful."""
+
+    def __init__(self,
+                 client,
+                 *,
+                 trace_path=None,
+                 speed=None,
+                 lookahead_ms=None,
+                 task_set_name='replay'):
+        from zk_trace import OP_NAMES
+
+        super(ZKTraceReplayOp, self).__init__(client)
+
+        self._k = client.get_zk_client()
+        self._task_set_name = task_set_name
+        self._op_names = OP_NAMES
+        self._replay = get_trace_replay(
+            trace_path, speed=speed, lookahead_ms=lookahead_ms)
+        self._attachment = self._replay.attach()
+
+    def get_task_set_name(self):
+        return self._task_set_name
+
+    def detach(self):
+        """Hands the trace sessions of this user over to others."""
+        self._replay.detach(self._attachment)
+
+    def _call(self, op_name, path, size):
+        k = self._k
+        if op_name == 'get':
+            v, stat = k.get(path)
+            return len(v)
+        elif op_name == 'set':
+            k.set(path, _replay_bytes(size))
+            return size
+        elif op_name == 'create':
+            try:
+                k.create(path, _replay_bytes(size))
+            except self.client.node_exists_except():
+                pass
+            return size
+        elif op_name == 'delete':
+            k.delete(path)
+            return 0
+        elif op_name == 'exists':
+            k.exists(path)
+            return 0
+        else:
+            return len(k.get_children(path))
+
+    def _create_missing(self, path, size, parents_only):
+        parts = path.split('/')
+        paths = ['/'.join(parts[:i]) for i in range(2, len(parts) + 1)]
+        if parents_only:
+            paths.pop()
+        for p in paths:
+            try:
+                self._k.create(p, _replay_bytes(size) if p == path else b'')
+            except self.client.node_exists_except():
+                pass
+
+    def op(self):
+        try:
+            due, record = self._attachment.get(timeout=1)
+        except gevent.queue.Empty:
+            return
+        delay = due - time.monotonic()
+        if delay > 0:
+            gevent.sleep(delay)
+        else:
+            self._replay.note_lag(-delay)
+
+        if record.op >= len(self._op_names):
+            return
+        op_name = self._op_names[record.op]
+        path = self.client.join_path(record.path).rstrip('/') or '/'
+        with LocustTimer(op_name, self._task_set_name) as ctx:
+            try:
+                try:
+                    length = self._call(op_name, path, record.size)
+                except self.client.no_node_except():
+                    self._create_missing(path, record.size,
+                                         op_name == 'create')
+                    ctx.restart()
+                    length = self._call(op_name, path, record.size)
+            except get_backend_exceptions() as e:
+                ctx.failure(e)
+            else:
+                ctx.success(length)
+
+
+MULTI_CHECK, MULTI_SET, MULTI_CREATE, MULTI_DELETE = [
+    'check', 'set', 'create', 'delete'
+]
+
+
+def parse_multi_ops(spec):
+    """Parses a transaction composition such as `set=2,check=1`, into a
+    list of `(sub_op, count)` tuples, in the order of `spec`."""
+    sub_ops = []
+    for item in filter(None, (s.strip() for s in re.split(r'[,\s]+', spec))):
+        name, sep, count = item.partition('=')
+        if name not in [MULTI_CHECK, MULTI_SET, MULTI_CREATE, MULTI_DELETE]:
+            raise ValueError('Unknown transaction sub-op %r' % name)
+        sub_ops.append((name, int(count) if sep else 1))
+    if not sub_ops:
+        raise ValueError('Empty transaction composition %r' % spec)
+    return sub_ops
+
+
+class ZKTransactionOp(AbstractSingleTimerOp):
+    """Commits `multi` transactions composed of `sub_ops` (see
+    `parse_multi_ops`): `check`s and `set`s of keys picked from the
+    key space (see `_key_picker`), `create`s of ephemeral sequential
+    nodes, and `delete`s of nodes created by earlier transactions.
+
+    Each transaction is reported under `request_type`, with its
+    number of sub-ops as the response length.  Sub-ops are counted by
+    `zk_locust.sub_ops` rather than reported as requests, which would
+    inflate the totals.
+
+    With `pipeline` > 0, up to that many transactions are kept in
+    flight, and latencies are measured from submission to
+    completion."""
+
+    def __init__(self,
+                 client,
+                 *,
+                 request_type='multi',
+                 sub_ops=None,
+                 pipeline=None,
+                 key_space_size=None,
+                 key_size=_default_key_size,
+                 val_size=None,
+                 key_distribution=None,
+                 base_path=None,
+                 **kwargs):
+        super(ZKTransactionOp, self).__init__(
+            client, request_type=request_type, **kwargs)
+
+        if not client.supports_transactions():
+            raise ZKLocustException(
+                'The active backend does not support transactions')
+
+        self._k = client.get_zk_client()
+        self._sub_ops = parse_multi_ops(sub_ops or _default_multi_ops)
+        self._pipeline = _default_multi_pipeline if pipeline is None \
+            else pipeline
+        self._val_size = val_size
+        self._base_path = base_path or client.join_path('/m-')
+        self._keys = _key_picker(
+            client,
+            key_distribution,
+            key_space_size,
+            key_size,
+            val_size,
+            self._task_set_name,
+            request_type,
+            default_distribution=UNIFORM)
+        self._created = deque()
+        self._in_flight = deque()
+
+    def _build(self):
+        t = self._k.transaction()
+        added = []
+        deleted = []
+        for sub_op, count in self._sub_ops:
+            for _ in range(count):
+                if sub_op == MULTI_CHECK:
+                    t.check(self._keys.pick()[1], -1)
+                elif sub_op == MULTI_SET:
+                    t.set_data(self._keys.pick()[1],
+                               _gen_random_bytes(self._val_size))
+                elif sub_op == MULTI_CREATE:
+                    t.create(
+                        self._base_path,
+                        _gen_random_bytes(self._val_size),
+                        ephemeral=True,
+                        sequence=True)
+                elif self._created:
+                    path = self._created.popleft()
+                    t.delete(path)
+                    deleted.append(path)
+                else:
+                    # Nothing to delete (yet).
+                    continue
+                added.append(sub_op)
+        return t, added, deleted
+
+    def _settle(self, added, deleted, results, exc):
+        if results is None or exc is not None:
+            # Rolled back; these still exist.
+            self._created.extendleft(reversed(deleted))
+            return
+
+        # `added` rather than `self._sub_ops`, as deletes are skipped
+        # while there is nothing to delete.
+        for sub_op, result in zip(added, results):
+            if sub_op == MULTI_CREATE:
+                self._created.append(result)
+
+        note_sub_ops(self._task_set_name or '', added)
+
+    def _completed(self, added, deleted, start_time, async_result):
+        response_time = int((time.time() - start_time) * 1000)
+        results = None
+        try:
+            results = async_result.get()
+            exc = self.client.transaction_error(results)
+        except get_backend_exceptions() as e:
+            exc = e
+
+        if exc is None:
             events.request_success.fire(
                 request_type=self._request_type,
-                name=self._task_set_name,
-                response_time=int((end_time - start_time) * 1000),
-                response_length=0,
-            )
+                name=self._task_set_name or '',
+                response_time=response_time,
+                response_length=len(added))
+        else:
+            events.request_failure.fire(
+                request_type=self._request_type,
+                name=self._task_set_name or '',
+                response_time=response_time,
+                exception=exc)
+        self._settle(added, deleted, results, exc)
 
-        self._k.get(self._path, watch=zk_watch_trigger)
-        # Encode start_time as payload.
-        v = int(time.time() * 1000).to_bytes(
-            self._val_size, byteorder=sys.byteorder)
-        self._k.set_async(self._path, v)
+    def op(self):
+        t, added, deleted = self._build()
+        if not added:
+            return
+
+        if self._pipeline:
+            while len(self._in_flight) >= self._pipeline:
+                # Reporting happens in `_completed`.
+                try:
+                    self._in_flight.popleft().get()
+                except get_backend_exceptions():
+                    pass
+            # After draining, so as not to count the wait for earlier
+            # transactions.
+            start_time = time.time()
+            async_result = t.commit_async()
+            async_result.rawlink(lambda async_result: self._completed(
+                added, deleted, start_time, async_result))
+            self._in_flight.append(async_result)
+            return
+
+        results = exc = None
+        try:
+            with self.timing() as ctx:
+                results = t.commit()
+                exc = self.client.transaction_error(results)
+                if exc is None:
+                    ctx.success(response_length=len(added))
+                else:
+                    ctx.failure(exc)
+        finally:
+            self._settle(added, deleted, results, exc)
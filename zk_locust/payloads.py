@@ -0,0 +1,129 @@
+import os
+import math
+import random
+
+_pool_count = int(os.getenv('ZK_LOCUST_PAYLOAD_POOL_COUNT') or '64')
+_pool_max_bytes = int(
+    os.getenv('ZK_LOCUST_PAYLOAD_POOL_MAX_BYTES') or str(64 * 1024 * 1024))
+
+# Maps random bytes onto printable ASCII, as zkpython does not support
+# binary values.
+_printable = bytes(32 + i % 95 for i in range(256))
+
+
+def random_printable_bytes(n):
+    return os.urandom(n).translate(_printable)
+
+
+class SizeDistribution(object):
+    """A distribution of payload sizes, parsed from a spec of the form
+    `<kind>[:<key>=<value>,...]`, or a plain size:
+
+      * `constant:size=<n>`, or `<n>`;
+      * `uniform:min=<a>,max=<b>`;
+      * `normal:mean=<m>,stddev=<s>`;
+      * `lognormal:median=<m>,sigma=<s>`;
+      * `pareto:min=<a>,alpha=<k>`.
+
+    All kinds also accept `max=<n>`, to which samples are clamped."""
+
+    _kinds = {
+        'constant': ['size'],
+        'uniform': ['min', 'max'],
+        'normal': ['mean', 'stddev'],
+        'lognormal': ['median', 'sigma'],
+        'pareto': ['min', 'alpha']
+    }
+
+    def __init__(self, spec):
+        spec = str(spec).strip()
+        if spec.isdigit():
+            spec = 'constant:size=' + spec
+        kind, _, rest = spec.partition(':')
+        if kind not in self._kinds:
+            raise ValueError('Unknown size distribution %r; expected one of '
+                             '%s' % (kind, ', '.join(sorted(self._kinds))))
+        params = {}
+        for item in filter(None, (s.strip() for s in rest.split(','))):
+            key, sep, value = item.partition('=')
+            if not sep:
+                raise ValueError('Malformed size distribution parameter %r' %
+                                 item)
+            params[key.strip()] = float(value)
+        missing = [k for k in self._kinds[kind] if k not in params]
+        if missing:
+            raise ValueError('Size distribution %r requires %s' %
+                             (kind, ', '.join(missing)))
+        self.kind = kind
+        self.params = params
+        self.max = int(params['max']) if 'max' in params else None
+
+    def is_constant(self):
+        return self.kind == 'constant'
+
+    def sample(self, rng):
+        p = self.params
+        if self.kind == 'constant':
+            n = p['size']
+        elif self.kind == 'uniform':
+            n = rng.randint(int(p['min']), int(p['max']))
+        elif self.kind == 'normal':
+            n = rng.gauss(p['mean'], p['stddev'])
+        elif self.kind == 'lognormal':
+            n = rng.lognormvariate(math.log(p['median']), p['sigma'])
+        else:
+            n = p['min'] * rng.paretovariate(p['alpha'])
+        n = max(int(n), 0)
+        return min(n, self.max) if self.max is not None else n
+
+
+class PayloadPool(object):
+    """A set of payloads generated once, with sizes drawn from a
+    `SizeDistribution`; `draw` hands out (immutable, shared) payloads
+    without generating or copying anything.
+
+    The pool holds up to `count` payloads, fewer if they would exceed
+    `max_bytes` in total--and a single one for constant sizes."""
+
+    def __init__(self, sizes, *, count=_pool_count, max_bytes=_pool_max_bytes):
+        if not isinstance(sizes, SizeDistribution):
+            sizes = SizeDistribution(sizes)
+        self.sizes = sizes
+        if sizes.is_constant():
+            count = 1
+
+        rng = random.Random()
+        payloads = []
+        total = 0
+        for _ in range(max(count, 1)):
+            n = sizes.sample(rng)
+            if payloads and total + n > max_bytes:
+                break
+            payloads.append(random_printable_bytes(n))
+            total += n
+        self._payloads = payloads
+        self.total_bytes = total
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def draw(self):
+        payloads = self._payloads
+        if len(payloads) == 1:
+            return payloads[0]
+        return payloads[random.randrange(len(payloads))]
+
+
+# Pools are shared by all ops (of a process) with the same spec.
+_pools = {}
+
+
+def get_payload_pool(spec):
+    """Returns the shared `PayloadPool` for `spec`, a size or a
+    `SizeDistribution` spec string."""
+    key = str(spec).strip()
+    pool = _pools.get(key)
+    if pool is None:
+        pool = PayloadPool(key)
+        _pools[key] = pool
+    return pool
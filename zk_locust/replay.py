@@ -0,0 +1,191 @@
+import os
+import time
+import logging
+
+import gevent
+import gevent.event
+import gevent.queue
+
+from locust import events
+
+from . import WORKER_INDEX, WORKER_COUNT
+
+_logger = logging.getLogger(__name__)
+
+_default_trace_path = os.getenv('ZK_LOCUST_REPLAY_TRACE')
+_default_speed = float(os.getenv('ZK_LOCUST_REPLAY_SPEED') or '1')
+_default_lookahead_ms = int(
+    os.getenv('ZK_LOCUST_REPLAY_LOOKAHEAD_MS') or '1000')
+
+# Records queued per user, beyond which the dispatcher waits.
+_queue_size = 1024
+# How long the dispatcher waits on a full queue before checking
+# whether its user is still taking records, and how long a user can go
+# without taking any before it is considered stopped.
+_put_timeout_s = 1
+_stale_s = 10
+
+
+class _Attachment(object):
+    """The queue of `(due, record)` tuples of a user, with `due` on the
+    `time.monotonic()` clock."""
+
+    def __init__(self):
+        self.queue = gevent.queue.Queue(_queue_size)
+        self.last_get = time.monotonic()
+        self.detached = False
+
+    def get(self, timeout=None):
+        self.last_get = time.monotonic()
+        return self.queue.get(timeout=timeout)
+
+    def is_stale(self):
+        return time.monotonic() - self.last_get > _stale_s
+
+
+class TraceReplay(object):
+    """Reissues the ops of a `zk_trace` trace, at the original timing
+    divided by `speed` (or as fast as possible if `speed` is 0).
+
+    Trace sessions are split across workers (by session id, see
+    `ZK_LOCUST_WORKER_INDEX`/`COUNT`), then mapped, round-robin and on
+    first appearance, onto the users which have `attach`ed--several
+    trace sessions sharing a user if there are fewer users than
+    sessions.  Dispatching starts once Locust has hatched all users,
+    so that early sessions are spread over all of them.
+
+    Each user receives the records of its sessions, in order, with
+    their due time; records are read from the trace at most
+    `lookahead_ms` ahead of time, and while the queue of their user is
+    not full.  The sessions of users which `detach` (or stop taking
+    records) are moved to other users, dropping the records still
+    queued for them."""
+
+    def __init__(self,
+                 path=None,
+                 *,
+                 speed=None,
+                 lookahead_ms=None,
+                 worker_index=WORKER_INDEX,
+                 worker_count=WORKER_COUNT):
+        from zk_trace import TraceReader
+
+        self.path = path or _default_trace_path
+        if not self.path:
+            raise ValueError('No trace (ZK_LOCUST_REPLAY_TRACE) provided')
+        self._reader = TraceReader(self.path)
+        self.speed = _default_speed if speed is None else speed
+        self._lookahead_s = (lookahead_ms or _default_lookahead_ms) / 1000
+        self._worker_index = worker_index
+        self._worker_count = worker_count
+
+        self._attachments = []
+        self._attached = gevent.event.Event()
+        self._hatched = gevent.event.Event()
+        self._sessions = {}
+        self._assigned = 0
+        self._dispatcher = None
+        self.done = False
+        self.dropped = 0
+        self.moved = 0
+        self.max_lag_s = 0
+
+        events.hatch_complete += self._on_hatch_complete
+        events.quitting += self._on_quitting
+
+    def attach(self):
+        """Returns the `_Attachment` of a new user."""
+        attachment = _Attachment()
+        self._attachments.append(attachment)
+        self._attached.set()
+        if self._dispatcher is None:
+            self._dispatcher = gevent.spawn(self._dispatch)
+        return attachment
+
+    def detach(self, attachment):
+        if attachment.detached:
+            return
+        attachment.detached = True
+        self._attachments.remove(attachment)
+        if not self._attachments:
+            self._attached.clear()
+        for session in [
+                session for session, owner in self._sessions.items()
+                if owner is attachment
+        ]:
+            del self._sessions[session]
+            self.moved += 1
+        while not attachment.queue.empty():
+            attachment.queue.get_nowait()
+            self.dropped += 1
+
+    def note_lag(self, lag_s):
+        self.max_lag_s = max(self.max_lag_s, lag_s)
+
+    def _owner(self, session):
+        owner = self._sessions.get(session)
+        if owner is None:
+            self._attached.wait()
+            owner = self._attachments[self._assigned %
+                                      len(self._attachments)]
+            self._assigned += 1
+            self._sessions[session] = owner
+        return owner
+
+    def _put(self, session, item):
+        while True:
+            owner = self._owner(session)
+            try:
+                owner.queue.put(item, timeout=_put_timeout_s)
+                return
+            except gevent.queue.Full:
+                if owner.is_stale():
+                    _logger.warning(
+                        'Replay user stopped taking records; moving its '
+                        'sessions')
+                    self.detach(owner)
+
+    def _on_hatch_complete(self, **kwargs):
+        self._hatched.set()
+
+    def _dispatch(self):
+        self._hatched.wait()
+        start = time.monotonic()
+        count = 0
+        for record in self._reader:
+            if record.session % self._worker_count != self._worker_index:
+                continue
+            if self.speed:
+                due = start + record.time_ns / 1e9 / self.speed
+                ahead = due - time.monotonic() - self._lookahead_s
+                if ahead > 0:
+                    gevent.sleep(ahead)
+            else:
+                due = start
+            self._put(record.session, (due, record))
+            count += 1
+        self.done = True
+        _logger.info(
+            'Trace %s dispatched: %d records, %d sessions, in %.1fs',
+            self.path, count, self._assigned - self.moved,
+            time.monotonic() - start)
+        if self.dropped:
+            _logger.warning('%d records dropped by stopped users',
+                            self.dropped)
+
+    def _on_quitting(self, **kwargs):
+        if self._dispatcher is not None:
+            _logger.info('Maximum replay lag: %.3fs', self.max_lag_s)
+
+
+# Replays are shared by all users (of a process) with the same trace.
+_replays = {}
+
+
+def get_trace_replay(path=None, **kwargs):
+    path = path or _default_trace_path
+    replay = _replays.get(path)
+    if replay is None:
+        replay = TraceReplay(path, **kwargs)
+        _replays[path] = replay
+    return replay
@@ -0,0 +1,213 @@
+import os
+import time
+import logging
+
+import gevent
+
+from locust import events
+
+from . import LocustTimer, WORKER_INDEX, WORKER_COUNT
+from .backend_base import ZKLocustException, SESSION_CONNECTED, \
+    SESSION_SUSPENDED, SESSION_LOST
+
+_logger = logging.getLogger(__name__)
+
+_default_rate = float(os.getenv('ZK_LOCUST_SESSION_STORM_RATE') or '100')
+_default_sessions = int(os.getenv('ZK_LOCUST_SESSION_STORM_SESSIONS') or '0')
+_default_timeout_ms = int(
+    os.getenv('ZK_LOCUST_SESSION_STORM_TIMEOUT_MS') or '0')
+_default_hold_ms = int(os.getenv('ZK_LOCUST_SESSION_STORM_HOLD_MS') or '0')
+
+# Slots missed by more than this are dropped rather than caught up
+# with, to avoid unbounded bursts.
+_max_lag_s = 1
+
+
+def worker_share(total, index=WORKER_INDEX, count=WORKER_COUNT):
+    """Returns the share of `total` (an integer) assigned to worker
+    `index` of `count`."""
+    return total // count + (1 if index < total % count else 0)
+
+
+class Pacer(object):
+    """Hands out evenly-spaced slots at `rate` per second, on an
+    absolute schedule, to any number of greenlets."""
+
+    def __init__(self, rate):
+        self.interval_s = 1 / rate
+        self._next = None
+
+    def wait(self):
+        now = time.monotonic()
+        if self._next is None or self._next < now - _max_lag_s:
+            self._next = now
+        slot = self._next
+        self._next += self.interval_s
+        if slot > now:
+            gevent.sleep(slot - now)
+
+
+class SessionStorm(object):
+    """Opens sessions at `rate` per second (across all workers), via
+    clients derived from `client` (see `new_session_client`), in
+    greenlets of their own, so that the rate does not depend on the
+    connection latency or the number of Locust users.
+
+    If `sessions` is 0, each session is closed as soon as it is
+    established.  Otherwise, up to `sessions` sessions (across all
+    workers) are held open; once all are, they are closed in bulk
+    after `hold_ms` (or when quitting, if `hold_ms` is 0), and the
+    cycle starts again.
+
+    Reports `session_connect` and `session_close` requests, the bulk
+    closes as `session_close_all` requests (with the number of closed
+    sessions as the response length), and, for held sessions, the
+    delay between the loss of a connection and the reconnection as a
+    `session_reconnect` request--or a failure, if the session
+    expired."""
+
+    def __init__(self,
+                 client,
+                 *,
+                 rate=None,
+                 sessions=None,
+                 timeout_ms=None,
+                 hold_ms=None,
+                 name='session_storm'):
+        rate = rate or _default_rate
+        if sessions is None:
+            sessions = _default_sessions
+        timeout_ms = timeout_ms or _default_timeout_ms
+        hold_ms = hold_ms or _default_hold_ms
+
+        self._client = client
+        self._pacer = Pacer(rate / WORKER_COUNT)
+        self._target = worker_share(sessions)
+        self._churn = sessions == 0
+        self._timeout_s = timeout_ms / 1000 if timeout_ms else None
+        self._hold_s = hold_ms / 1000
+        self._name = name
+
+        self._sessions = []
+        self._opening = 0
+        self._full_since = None
+        self._closing = False
+
+        events.quitting += self._on_quitting
+
+    def _is_full(self):
+        return not self._churn and \
+            len(self._sessions) + self._opening >= self._target
+
+    def step(self):
+        """Opens the next session, or waits."""
+        if self._closing:
+            gevent.sleep(0.1)
+            return
+        if self._is_full():
+            if self._full_since is not None and self._hold_s and \
+                    time.monotonic() - self._full_since >= self._hold_s:
+                self.close_all()
+            else:
+                gevent.sleep(0.1)
+            return
+
+        self._opening += 1
+        try:
+            self._pacer.wait()
+        except BaseException:
+            self._opening -= 1
+            raise
+        gevent.spawn(self._open)
+
+    def _open(self):
+        started = False
+        try:
+            client = self._client.new_session_client(self._timeout_s)
+            with LocustTimer('session_connect', self._name) as ctx:
+                try:
+                    client.start()
+                except client.connect_timeout_except() as e:
+                    ctx.failure(e)
+                    client.stop()
+                else:
+                    ctx.success()
+                    started = True
+        finally:
+            self._opening -= 1
+        if not started:
+            return
+
+        if self._churn:
+            self._close(client)
+            return
+
+        client.add_session_listener(self._session_listener())
+        self._sessions.append(client)
+        if self._is_full() and self._full_since is None:
+            self._full_since = time.monotonic()
+            _logger.info('Holding %d sessions', len(self._sessions))
+
+    def _session_listener(self):
+        suspended_at = [None]
+
+        def on_state(state):
+            if state == SESSION_SUSPENDED:
+                suspended_at[0] = time.monotonic()
+                return
+            if suspended_at[0] is None:
+                return
+            response_time = int((time.monotonic() - suspended_at[0]) * 1000)
+            suspended_at[0] = None
+            if state == SESSION_CONNECTED:
+                events.request_success.fire(
+                    request_type='session_reconnect',
+                    name=self._name,
+                    response_time=response_time,
+                    response_length=0)
+            elif state == SESSION_LOST:
+                events.request_failure.fire(
+                    request_type='session_reconnect',
+                    name=self._name,
+                    response_time=response_time,
+                    exception=ZKLocustException('Session expired'))
+
+        return on_state
+
+    def _close(self, client):
+        with LocustTimer('session_close', self._name) as ctx:
+            client.stop()
+            ctx.success()
+
+    def close_all(self):
+        """Closes all held sessions, concurrently."""
+        if self._closing:
+            return
+        self._closing = True
+        try:
+            sessions = self._sessions
+            self._sessions = []
+            with LocustTimer('session_close_all', self._name) as ctx:
+                gevent.joinall(
+                    [gevent.spawn(self._close, c) for c in sessions])
+                ctx.success(response_length=len(sessions))
+        finally:
+            self._full_since = None
+            self._closing = False
+
+    def _on_quitting(self, **kwargs):
+        self.close_all()
+
+
+# Storms are shared by all users (of a process) with the same name.
+_storms = {}
+
+
+def get_session_storm(client, *, name='session_storm', **kwargs):
+    """Returns the process-wide `SessionStorm` `name`, creating it
+    with `client` and `kwargs` if needed."""
+    storm = _storms.get(name)
+    if storm is None:
+        storm = SessionStorm(client, name=name, **kwargs)
+        _storms[name] = storm
+    return storm
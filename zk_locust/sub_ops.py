@@ -0,0 +1,71 @@
+import time
+import logging
+
+from collections import Counter
+
+from locust import events
+
+_logger = logging.getLogger(__name__)
+
+_report_key = 'zk_multi_sub_ops'
+
+# {(name, sub_op): count} noted by this process since the last report
+# (resp. received from slaves, on the master).
+_pending = Counter()
+_received = Counter()
+_first_at = None
+_registered = False
+
+
+def note_sub_ops(name, sub_ops):
+    """Counts the `sub_ops` of a committed `multi` transaction of task
+    set `name`.  Sub-ops are not reported as requests, which would
+    inflate the totals; their counts and rates are logged on exit,
+    across all workers."""
+    global _first_at
+    if not _registered:
+        _register()
+    if _first_at is None:
+        _first_at = time.monotonic()
+    for sub_op in sub_ops:
+        _pending[(name, sub_op)] += 1
+
+
+def _take_pending():
+    pending = dict(_pending)
+    _pending.clear()
+    return pending
+
+
+def _on_report_to_master(client_id, data):
+    data[_report_key] = [[name, sub_op, count]
+                         for (name, sub_op), count in _take_pending().items()]
+
+
+def _on_slave_report(client_id, data):
+    global _first_at
+    items = data.get(_report_key)
+    if not items:
+        return
+    if _first_at is None:
+        _first_at = time.monotonic()
+    for name, sub_op, count in items:
+        _received[(name, sub_op)] += count
+
+
+def _on_quitting(**kwargs):
+    counts = _received + _pending
+    if not counts:
+        return
+    elapsed_s = max(time.monotonic() - _first_at, 1e-3)
+    for (name, sub_op), count in sorted(counts.items()):
+        _logger.info('multi sub-op %s/%s: %d (%.1f/s)', name, sub_op, count,
+                     count / elapsed_s)
+
+
+def _register():
+    global _registered
+    _registered = True
+    events.report_to_master += _on_report_to_master
+    events.slave_report += _on_slave_report
+    events.quitting += _on_quitting
@@ -1,7 +1,8 @@
 from collections import deque
 
 from zk_locust import ZKLocustTaskSet
-from zk_locust.ops import ZKSetOp, ZKIncrementingSetOp, ZKGetOp, ZKConnectOp, ZKCreateEphemeralOp, ZKDeleteFromQueueOp, ZKCountChildrenOp, ZKExistsOp, ZKExistsWithWatchOp, ZKExistsWithManyWatchesOp, ZKWatchOp, ZKGetChildrenOp, ZKGetChildren2Op
+from zk_locust.mix import get_mix
+from zk_locust.ops import ZKSetOp, ZKIncrementingSetOp, ZKGetOp, ZKConnectOp, ZKCreateEphemeralOp, ZKDeleteFromQueueOp, ZKCountChildrenOp, ZKExistsOp, ZKExistsWithWatchOp, ZKExistsWithManyWatchesOp, ZKWatchOp, ZKGetChildrenOp, ZKGetChildren2Op, ZKTransactionOp, ZKWatchFanOutOp, ZKPersistentWatchOp, ZKSessionStormOp, ZKEphemeralPurgeOp, ZKTraceReplayOp
 
 
 def compose_task_set_name(name, suffix):
@@ -19,6 +20,60 @@ class ZKConnectTaskSet(ZKLocustTaskSet):
         self.tasks = [connect_op.task]
 
 
+class ZKSessionStormTaskSet(ZKLocustTaskSet):
+    def __init__(self,
+                 parent,
+                 *,
+                 name='session_storm',
+                 rate=None,
+                 sessions=None,
+                 timeout_ms=None,
+                 hold_ms=None,
+                 **kwargs):
+        super(ZKSessionStormTaskSet, self).__init__(parent, **kwargs)
+
+        op = ZKSessionStormOp(
+            self.client,
+            task_set_name=name,
+            rate=rate,
+            sessions=sessions,
+            timeout_ms=timeout_ms,
+            hold_ms=hold_ms)
+
+        self.tasks = [op.task]
+
+
+class ZKTraceReplayTaskSet(ZKLocustTaskSet):
+    """Replays the ops of the trace at `trace_path` (or
+    `ZK_LOCUST_REPLAY_TRACE`) assigned to this user.  The pacing comes
+    from the trace; `ZK_LOCUST_MIN_WAIT`/`MAX_WAIT` should be left
+    unset."""
+
+    def __init__(self,
+                 parent,
+                 *,
+                 name='replay',
+                 trace_path=None,
+                 speed=None,
+                 lookahead_ms=None,
+                 **kwargs):
+        super(ZKTraceReplayTaskSet, self).__init__(parent, **kwargs)
+
+        op = ZKTraceReplayOp(
+            self.client,
+            task_set_name=name,
+            trace_path=trace_path,
+            speed=speed,
+            lookahead_ms=lookahead_ms)
+        self._op = op
+
+        self.tasks = [op.task]
+
+    def on_stop(self):
+        self._op.detach()
+        super(ZKTraceReplayTaskSet, self).on_stop()
+
+
 class ZKSetTaskSet(ZKLocustTaskSet):
     def __init__(self,
                  parent,
@@ -26,13 +81,15 @@ class ZKSetTaskSet(ZKLocustTaskSet):
                  name='set',
                  suffix=None,
                  val_size=None,
+                 key_distribution=None,
                  **kwargs):
         super(ZKSetTaskSet, self).__init__(parent, **kwargs)
 
         op = ZKSetOp(
             self.client,
             task_set_name=compose_task_set_name(name, suffix),
-            val_size=val_size)
+            val_size=val_size,
+            key_distribution=key_distribution)
 
         self.tasks = [op.task]
 
@@ -44,13 +101,15 @@ class ZKGetTaskSet(ZKLocustTaskSet):
                  name='get',
                  suffix=None,
                  val_size=None,
+                 key_distribution=None,
                  **kwargs):
         super(ZKGetTaskSet, self).__init__(parent, **kwargs)
 
         op = ZKGetOp(
             self.client,
             task_set_name=compose_task_set_name(name, suffix),
-            val_size=val_size)
+            val_size=val_size,
+            key_distribution=key_distribution)
 
         self.tasks = [op.task]
 
@@ -62,21 +121,50 @@ class ZKSetAndGetTaskSet(ZKLocustTaskSet):
                  name='set_and_get',
                  suffix=None,
                  val_size=None,
+                 key_distribution=None,
                  **kwargs):
         super(ZKSetAndGetTaskSet, self).__init__(parent, **kwargs)
 
         task_set_name = compose_task_set_name(name, suffix)
 
         set_op = ZKIncrementingSetOp(
-            self.client, task_set_name=task_set_name, val_size=val_size)
+            self.client,
+            task_set_name=task_set_name,
+            val_size=val_size,
+            key_distribution=key_distribution)
         get_op = ZKGetOp(
-            self.client, task_set_name=task_set_name, val_size=val_size)
+            self.client,
+            task_set_name=task_set_name,
+            val_size=val_size,
+            key_distribution=key_distribution)
 
         # KLUDGE: Locust's dictionary approach does not work with
         # constructors.
         self.tasks = [set_op.task] + [get_op.task for i in range(10)]
 
 
+class ZKMixedTaskSet(ZKLocustTaskSet):
+    """Runs the ops of a `zk_locust.mix.Mix` (from `spec`, or
+    `ZK_LOCUST_MIX`), picking each task in constant time according to
+    the weights of the mix."""
+
+    def __init__(self, parent, *, name=None, suffix=None, spec=None,
+                 **kwargs):
+        super(ZKMixedTaskSet, self).__init__(parent, **kwargs)
+
+        mix = get_mix(spec)
+        task_set_name = compose_task_set_name(name or mix.name or 'mix',
+                                              suffix)
+
+        ops = mix.create_ops(self.client, task_set_name)
+        self._sampler = mix.create_sampler()
+
+        self.tasks = [op.task for op in ops]
+
+    def get_next_task(self):
+        return self.tasks[self._sampler.next()]
+
+
 class ZKCreateAndDeleteTaskSet(ZKLocustTaskSet):
     def __init__(self,
                  parent,
@@ -107,17 +195,96 @@ class ZKCreateAndDeleteTaskSet(ZKLocustTaskSet):
         self.tasks = create_tasks + delete_tasks + [count_op.task]
 
 
+class ZKEphemeralPurgeTaskSet(ZKLocustTaskSet):
+    def __init__(self,
+                 parent,
+                 *,
+                 name='ephemeral_purge',
+                 suffix=None,
+                 count=None,
+                 hold_ms=None,
+                 mode=None,
+                 timeout_ms=None,
+                 val_size=None,
+                 **kwargs):
+        super(ZKEphemeralPurgeTaskSet, self).__init__(parent, **kwargs)
+
+        op = ZKEphemeralPurgeOp(
+            self.client,
+            task_set_name=compose_task_set_name(name, suffix),
+            count=count,
+            hold_ms=hold_ms,
+            mode=mode,
+            timeout_ms=timeout_ms,
+            val_size=val_size)
+
+        self.tasks = [op.task]
+
+
 class ZKWatchTaskSet(ZKLocustTaskSet):
-    def __init__(self, parent, *, name='watch', **kwargs):
+    def __init__(self,
+                 parent,
+                 *,
+                 name='watch',
+                 clock=None,
+                 verify=None,
+                 **kwargs):
         super(ZKWatchTaskSet, self).__init__(parent, **kwargs)
 
         path = self.client.create_default_node()
 
-        op = ZKWatchOp(self.client, path, task_set_name=name)
+        op = ZKWatchOp(
+            self.client, path, task_set_name=name, clock=clock, verify=verify)
+
+        self.tasks = [op.task]
+
+
+class ZKWatchFanOutTaskSet(ZKLocustTaskSet):
+    def __init__(self,
+                 parent,
+                 *,
+                 name='watch_fanout',
+                 suffix=None,
+                 interval_ms=None,
+                 val_size=None,
+                 **kwargs):
+        super(ZKWatchFanOutTaskSet, self).__init__(parent, **kwargs)
+
+        op = ZKWatchFanOutOp(
+            self.client,
+            task_set_name=compose_task_set_name(name, suffix),
+            interval_ms=interval_ms,
+            val_size=val_size)
 
         self.tasks = [op.task]
 
 
+class ZKPersistentWatchTaskSet(ZKLocustTaskSet):
+    def __init__(self,
+                 parent,
+                 *,
+                 name='persistent_watch',
+                 suffix=None,
+                 recursive=False,
+                 val_size=None,
+                 **kwargs):
+        super(ZKPersistentWatchTaskSet, self).__init__(parent, **kwargs)
+
+        op = ZKPersistentWatchOp(
+            self.client,
+            recursive=recursive,
+            task_set_name=compose_task_set_name(name, suffix),
+            val_size=val_size)
+
+        self.tasks = [op.task]
+
+
+class ZKRecursiveWatchTaskSet(ZKPersistentWatchTaskSet):
+    def __init__(self, parent, *, name='recursive_watch', **kwargs):
+        super(ZKRecursiveWatchTaskSet, self).__init__(
+            parent, name=name, recursive=True, **kwargs)
+
+
 class ZKExistsTaskSet(ZKLocustTaskSet):
     def __init__(self, parent, *, name='exists', **kwargs):
         super(ZKExistsTaskSet, self).__init__(parent, **kwargs)
@@ -181,3 +348,27 @@ class ZKGetChildren2TaskSet(ZKLocustTaskSet):
         op = ZKGetChildren2Op(self.client, path, task_set_name=name)
 
         self.tasks = [op.task]
+
+
+class ZKTransactionTaskSet(ZKLocustTaskSet):
+    def __init__(self,
+                 parent,
+                 *,
+                 name='multi',
+                 suffix=None,
+                 val_size=None,
+                 key_distribution=None,
+                 sub_ops=None,
+                 pipeline=None,
+                 **kwargs):
+        super(ZKTransactionTaskSet, self).__init__(parent, **kwargs)
+
+        op = ZKTransactionOp(
+            self.client,
+            task_set_name=compose_task_set_name(name, suffix),
+            val_size=val_size,
+            key_distribution=key_distribution,
+            sub_ops=sub_ops,
+            pipeline=pipeline)
+
+        self.tasks = [op.task]
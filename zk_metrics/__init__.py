@@ -9,6 +9,7 @@ from flask import Blueprint, render_template, abort, Response
 from jinja2 import TemplateNotFound
 
 from locust import __version__ as version
+from locust import events
 from locust.web import app
 import locust.runners
 
@@ -25,6 +26,11 @@ _zk_admin_port = int(os.getenv('ZK_ADMIN_PORT', '8080'))
 
 _zk_metrics_collect = os.getenv('ZK_LOCUST_ZK_METRICS_COLLECT', 'web')
 
+# Fired with `host_port` and `tree`, the parsed output of the
+# `monitor` command, each time metrics are collected from an ensemble
+# member.  `tree` is None if the member could not be reached.
+metrics_available = events.EventHook()
+
 _page = Blueprint(
     'zk-metrics',
     __name__,
@@ -39,6 +45,13 @@ def compose_metrics_url(zk_host_port, command):
     return url
 
 
+def publish_metrics(zk_host_port, content):
+    tree = json.loads(content) if content else None
+
+    maybe_write_metrics_csv(zk_host_port, tree)
+    metrics_available.fire(host_port=zk_host_port, tree=tree)
+
+
 def metrics_collect_loop(zk_host_port, url, delay_s):
     while not locust.runners.locust_runner:
         gevent.sleep(0.1)
@@ -53,9 +66,9 @@ def metrics_collect_loop(zk_host_port, url, delay_s):
         try:
             r = http_session.get(url, allow_redirects=False, stream=False)
             r.raise_for_status()
-            maybe_write_metrics_csv(zk_host_port, r.content)
+            publish_metrics(zk_host_port, r.content)
         except requests.ConnectionError:
-            maybe_write_metrics_csv(zk_host_port, None)
+            publish_metrics(zk_host_port, None)
         except Exception:
             _logger.exception('Metrics collect loop')
         gevent.sleep(delay_s)
@@ -90,7 +103,7 @@ def proxy(command, index):
     r = requests.get(url, allow_redirects=False, stream=False)
 
     if (r.status_code == 200):
-        maybe_write_metrics_csv(zk_host_port, r.content)
+        publish_metrics(zk_host_port, r.content)
 
     return Response(r.content, r.status_code, [])
 
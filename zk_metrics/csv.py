@@ -1,5 +1,4 @@
 import os
-import json
 
 from locust_extra.output import format_timestamp, ensure_output
 
@@ -14,15 +13,13 @@ def write_metrics_csv_meta_locked(output, tree):
     output.keys = keys
 
 
-def write_metrics_csv(host_port, data, csv_path):
+def write_metrics_csv(host_port, tree, csv_path):
     row = [format_timestamp(), host_port]
 
     output = ensure_output(csv_path, for_csv=True)
     if not output.f:
         return
 
-    tree = json.loads(data) if data else None
-
     if not hasattr(output, 'keys'):
         if not tree or tree.get('error'):
             return
@@ -42,6 +39,6 @@ def write_metrics_csv(host_port, data, csv_path):
         output.f.flush()
 
 
-def maybe_write_metrics_csv(host_port, data):
+def maybe_write_metrics_csv(host_port, tree):
     if _metrics_csv_path:
-        write_metrics_csv(host_port, data, _metrics_csv_path)
+        write_metrics_csv(host_port, tree, _metrics_csv_path)
@@ -0,0 +1,77 @@
+import time
+import logging
+
+import gevent.thread
+
+from locust import events
+
+from . import metrics_available
+
+_logger = logging.getLogger(__name__)
+
+
+class EphemeralsPurgeTracker(object):
+    """Follows the server-side `ephemerals_count` of each member, as
+    published via `zk_metrics.metrics_available`, and reports each
+    run of decreasing snapshots (of at least `min_purged` nodes) as an
+    `ephemerals_purge` request named after the member, with the time
+    from the last snapshot before the decrease to the first one after
+    it as the response time, and the number of purged nodes as the
+    response length.
+
+    The resolution is that of the metrics collection (see
+    `ZK_LOCUST_ZK_METRICS_COLLECT`), and concurrent creations are
+    netted out of the purged count."""
+
+    def __init__(self, *, min_purged=1):
+        self.min_purged = min_purged
+        self._lock = gevent.thread.LockType()
+        # {host_port: (count, at, purge_start)}, with `purge_start` a
+        # `(count, at)` tuple while decreasing.
+        self._members = {}
+
+    def register(self):
+        hook = metrics_available
+        hook += self.on_metrics
+
+    def on_metrics(self, host_port, tree, **kwargs):
+        if not tree or tree.get('error'):
+            return
+        v = tree.get('ephemerals_count')
+        if v is None or isinstance(v, bool):
+            return
+        try:
+            count = int(v)
+        except (TypeError, ValueError):
+            return
+        now = time.time()
+
+        with self._lock:
+            last = self._members.get(host_port)
+            purge_start = None
+            if last is not None:
+                last_count, last_at, purge_start = last
+                if count < last_count:
+                    purge_start = purge_start or (last_count, last_at)
+                elif purge_start is not None:
+                    self._report(host_port, purge_start, last_count, last_at)
+                    purge_start = None
+            self._members[host_port] = (count, now, purge_start)
+
+    def _report(self, host_port, purge_start, end_count, end_at):
+        start_count, start_at = purge_start
+        purged = start_count - end_count
+        if purged < self.min_purged:
+            return
+        _logger.debug('%s purged %d ephemerals', host_port, purged)
+        events.request_success.fire(
+            request_type='ephemerals_purge',
+            name=host_port,
+            response_time=int((end_at - start_at) * 1000),
+            response_length=purged)
+
+
+def register_ephemerals_purge_tracker(min_purged=1):
+    tracker = EphemeralsPurgeTracker(min_purged=min_purged)
+    tracker.register()
+    return tracker
@@ -0,0 +1,196 @@
+import logging
+
+import gevent.thread
+
+from . import metrics_available
+
+_logger = logging.getLogger(__name__)
+
+SIGNAL_OUTSTANDING_REQUESTS, SIGNAL_LATENCY, SIGNAL_PROPOSAL_P99, \
+    SIGNAL_COMMIT_P99, SIGNAL_CONNECTION_DROP = [
+        'outstanding_requests', 'latency', 'proposal_p99', 'commit_p99',
+        'connection_drop'
+    ]
+
+# Monitor keys whose maximum (across members and snapshots) make up a
+# signal.  The `p99_*` keys are only exposed by ZooKeeper 3.6+.
+_max_signal_keys = {
+    SIGNAL_OUTSTANDING_REQUESTS: ['outstanding_requests'],
+    SIGNAL_PROPOSAL_P99: ['p99_proposal_latency'],
+    SIGNAL_COMMIT_P99: [
+        'p99_commit_propagation_latency', 'p99_local_write_committed_time_ms'
+    ]
+}
+
+
+def _number(tree, key):
+    v = tree.get(key)
+    if v is None or isinstance(v, bool):
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+class ServerWindow(object):
+    """Server-side saturation signals observed over a window, and the
+    limits they are checked against."""
+
+    def __init__(self, signals, limits):
+        self.signals = signals
+        self.limits = limits
+
+    def headroom(self):
+        """Returns the relative distance to the closest limit (negative
+        if exceeded), or None if no limited signal has been
+        observed."""
+        headroom = None
+        for name, limit in self.limits.items():
+            value = self.signals.get(name)
+            if value is None or not limit:
+                continue
+            h = 1 - value / limit
+            headroom = h if headroom is None else min(headroom, h)
+        return headroom
+
+    def saturated_by(self):
+        return [
+            name for name, limit in self.limits.items()
+            if limit and self.signals.get(name) is not None
+            and self.signals[name] > limit
+        ]
+
+    def __repr__(self):
+        return 'ServerWindow(signals=%r, limits=%r)' % (self.signals,
+                                                        self.limits)
+
+
+class SaturationTracker(object):
+    """Aggregates `monitor` snapshots published via
+    `zk_metrics.metrics_available` into per-window saturation signals:
+
+      * `outstanding_requests`: The maximum number of queued requests
+        on any member;
+
+      * `latency`: The average server-side request latency over the
+        window (when `cnt_latency`/`sum_latency` are available;
+        otherwise the maximum of the members' `avg_latency`);
+
+      * `proposal_p99`, `commit_p99`: The maximum p99 proposal (resp.
+        commit) latency reported by any member;
+
+      * `connection_drop`: The largest drop, relative to the start of
+        the window, of the total number of connections across
+        members.
+
+    Limits set to None or 0 are ignored."""
+
+    def __init__(self,
+                 *,
+                 max_outstanding_requests=None,
+                 max_latency_ms=None,
+                 max_proposal_p99_ms=None,
+                 max_commit_p99_ms=None,
+                 max_connection_drop=None):
+        self.limits = {
+            SIGNAL_OUTSTANDING_REQUESTS: max_outstanding_requests,
+            SIGNAL_LATENCY: max_latency_ms,
+            SIGNAL_PROPOSAL_P99: max_proposal_p99_ms,
+            SIGNAL_COMMIT_P99: max_commit_p99_ms,
+            SIGNAL_CONNECTION_DROP: max_connection_drop
+        }
+
+        self._lock = gevent.thread.LockType()
+        self._connections = {}
+        self._latency_marks = {}
+        self._reset_locked()
+
+    def _reset_locked(self):
+        self._maxima = {}
+        self._avg_latency = None
+
+        # Carry the latest observations over, as the starting points of
+        # the new window.
+        self._latency_marks = {
+            host_port: (last, last)
+            for host_port, (first, last) in self._latency_marks.items()
+        }
+        self._connections_start = None
+        self._connections_min = None
+        if self._connections:
+            self._connections_start = sum(self._connections.values())
+            self._connections_min = self._connections_start
+
+    def register(self):
+        hook = metrics_available
+        hook += self.on_metrics
+
+    def on_metrics(self, host_port, tree, **kwargs):
+        if not tree or tree.get('error') or 'server_state' not in tree:
+            # Unreachable/not serving.  Its last known connection
+            # count is kept, as its clients are expected to move to
+            # other members.
+            return
+
+        with self._lock:
+            for name, keys in _max_signal_keys.items():
+                for key in keys:
+                    v = _number(tree, key)
+                    if v is not None:
+                        self._maxima[name] = max(
+                            self._maxima.get(name, v), v)
+
+            cnt = _number(tree, 'cnt_latency')
+            total = _number(tree, 'sum_latency')
+            if cnt is not None and total is not None:
+                first, _ = self._latency_marks.get(host_port,
+                                                   ((cnt, total), None))
+                self._latency_marks[host_port] = (first, (cnt, total))
+            else:
+                v = _number(tree, 'avg_latency')
+                if v is not None:
+                    self._avg_latency = max(self._avg_latency or v, v)
+
+            v = _number(tree, 'num_alive_connections')
+            if v is not None:
+                self._connections[host_port] = v
+                total = sum(self._connections.values())
+                if self._connections_start is None:
+                    self._connections_start = total
+                self._connections_min = min(
+                    self._connections_min
+                    if self._connections_min is not None else total, total)
+
+    def _latency_locked(self):
+        d_cnt = 0
+        d_sum = 0
+        for (cnt0, sum0), (cnt1, sum1) in self._latency_marks.values():
+            if cnt1 < cnt0:
+                # Server restarted, or stats reset.
+                cnt0, sum0 = 0, 0
+            d_cnt += cnt1 - cnt0
+            d_sum += sum1 - sum0
+
+        if d_cnt > 0:
+            return d_sum / d_cnt
+
+        return self._avg_latency
+
+    def take_window(self):
+        """Returns the ServerWindow observed since the previous call,
+        and starts a new one."""
+        with self._lock:
+            signals = dict(self._maxima)
+
+            latency = self._latency_locked()
+            if latency is not None:
+                signals[SIGNAL_LATENCY] = latency
+
+            if self._connections_start:
+                signals[SIGNAL_CONNECTION_DROP] = max(
+                    1 - self._connections_min / self._connections_start, 0)
+
+            self._reset_locked()
+
+        return ServerWindow(signals, self.limits)
@@ -0,0 +1,93 @@
+import os
+import json
+import logging
+
+import gevent.thread
+
+from locust import events
+
+from . import metrics_available
+
+_logger = logging.getLogger(__name__)
+
+_summary_path = os.getenv('ZK_LOCUST_ZK_METRICS_WATCH_SUMMARY')
+
+
+class WatchCountTracker(object):
+    """Follows the server-side `watch_count` of each member, as
+    published via `zk_metrics.metrics_available`, to size the watch
+    manager: the baseline (first observation), maximum and last value
+    per member, and the maximum of their total.
+
+    Requires metrics collection on the master (see
+    `ZK_LOCUST_ZK_METRICS_COLLECT`)."""
+
+    def __init__(self):
+        self._lock = gevent.thread.LockType()
+        # {host_port: [baseline, max, last]}
+        self._members = {}
+        self._max_total = None
+
+    def register(self):
+        hook = metrics_available
+        hook += self.on_metrics
+
+    def on_metrics(self, host_port, tree, **kwargs):
+        if not tree or tree.get('error'):
+            return
+        v = tree.get('watch_count')
+        if v is None or isinstance(v, bool):
+            return
+        try:
+            v = int(v)
+        except (TypeError, ValueError):
+            return
+
+        with self._lock:
+            member = self._members.get(host_port)
+            if member is None:
+                self._members[host_port] = [v, v, v]
+            else:
+                member[1] = max(member[1], v)
+                member[2] = v
+            total = sum(m[2] for m in self._members.values())
+            self._max_total = max(self._max_total or total, total)
+
+    def summary(self):
+        with self._lock:
+            members = {
+                host_port: {
+                    'baseline': baseline,
+                    'max': max_,
+                    'last': last,
+                    'growth': max_ - baseline
+                }
+                for host_port, (baseline, max_, last) in self._members.items()
+            }
+            return {
+                'members': members,
+                'baseline': sum(m['baseline'] for m in members.values()),
+                'max': self._max_total,
+                'last': sum(m['last'] for m in members.values())
+            }
+
+
+def register_watch_count_tracker(summary_path=_summary_path):
+    """Tracks `watch_count`, and logs its summary when quitting--also
+    writing it, as JSON, to `summary_path` if set."""
+    tracker = WatchCountTracker()
+    tracker.register()
+
+    def on_quitting(**kwargs):
+        summary = tracker.summary()
+        if not summary['members']:
+            return
+        _logger.info('Server watch_count: baseline %d, max %d, last %d',
+                     summary['baseline'], summary['max'], summary['last'])
+        if summary_path:
+            with open(summary_path, 'w') as f:
+                json.dump(summary, f, indent=2)
+                f.write('\n')
+
+    events.quitting += on_quitting
+    return tracker
@@ -0,0 +1,94 @@
+import json
+import os
+
+MANIFEST_VERSION = 1
+
+
+class Manifest(object):
+    """Describes a preloaded tree: `count` leaves under `root`, laid
+    out `depth` levels deep with at most `fanout` children per node.
+
+    Leaf `i` lives at the path spelled by the base-`fanout` digits of
+    `i`, so paths are computed rather than listed, and ops can sample
+    them by index (see `zk_locust.keys`)."""
+
+    def __init__(self,
+                 *,
+                 root,
+                 depth,
+                 fanout,
+                 count=None,
+                 val_size=(8, 8),
+                 complete=False):
+        if depth < 1 or fanout < 1:
+            raise ValueError('depth and fanout must be positive')
+        capacity = fanout**depth
+        if count is None:
+            count = capacity
+        elif count > capacity:
+            raise ValueError('%d leaves do not fit in a tree of depth %d '
+                             'and fanout %d' % (count, depth, fanout))
+        self.root = root.rstrip('/') or '/'
+        self.depth = depth
+        self.fanout = fanout
+        self.count = count
+        self.val_size = tuple(val_size)
+        self.complete = complete
+        self._width = len(str(fanout - 1))
+
+    def level_count(self, level):
+        """Returns the number of nodes at `level` (1..depth)."""
+        span = self.fanout**(self.depth - level)
+        return (self.count + span - 1) // span
+
+    def node_path(self, level, i):
+        """Returns the path of the `i`-th node at `level`."""
+        names = []
+        for _ in range(level):
+            i, digit = divmod(i, self.fanout)
+            names.append(str(digit).zfill(self._width))
+        prefix = self.root if self.root != '/' else ''
+        return prefix + '/' + '/'.join(reversed(names))
+
+    def path(self, i):
+        """Returns the path of leaf `i`."""
+        return self.node_path(self.depth, i)
+
+    def params(self):
+        return {
+            'version': MANIFEST_VERSION,
+            'root': self.root,
+            'depth': self.depth,
+            'fanout': self.fanout,
+            'count': self.count,
+            'val_size': list(self.val_size)
+        }
+
+    def to_json(self):
+        d = self.params()
+        d['complete'] = self.complete
+        return d
+
+    @classmethod
+    def from_json(cls, d):
+        if d.get('version') != MANIFEST_VERSION:
+            raise ValueError('Unsupported manifest version %r' %
+                             d.get('version'))
+        return cls(
+            root=d['root'],
+            depth=d['depth'],
+            fanout=d['fanout'],
+            count=d['count'],
+            val_size=d.get('val_size', (8, 8)),
+            complete=d.get('complete', False))
+
+    def save(self, path):
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.to_json(), f, indent=2)
+            f.write('\n')
+        os.rename(path + '.tmp', path)
+
+
+def load_manifest(path):
+    with open(path) as f:
+        return Manifest.from_json(json.load(f))
@@ -0,0 +1,96 @@
+import os
+import sys
+import logging
+
+import click
+
+from . import Manifest
+from .loader import Preloader, PreloadError
+
+# As in `zk_locust`, which is not imported as it pulls in Locust.
+_default_hosts = os.getenv('ZK_LOCUST_HOSTS') or \
+    os.getenv('KAZOO_LOCUST_HOSTS')
+_default_root = (os.getenv('ZK_LOCUST_PSEUDO_ROOT')
+                 or os.getenv('KAZOO_LOCUST_PSEUDO_ROOT') or '/kl') + '/preload'
+
+
+def _parse_val_size(ctx, param, value):
+    try:
+        lo, _, hi = value.partition('-')
+        lo = int(lo)
+        hi = int(hi) if hi else lo
+    except ValueError:
+        raise click.BadParameter('expected <size> or <min>-<max>')
+    if lo < 0 or hi < lo:
+        raise click.BadParameter('expected 0 <= min <= max')
+    return (lo, hi)
+
+
+@click.command()
+@click.option(
+    '--hosts',
+    default=_default_hosts,
+    required=_default_hosts is None,
+    help='Connect string (defaults to ZK_LOCUST_HOSTS)')
+@click.option('--root', default=_default_root, show_default=True)
+@click.option('--depth', type=click.INT, default=3, show_default=True)
+@click.option('--fanout', type=click.INT, default=100, show_default=True)
+@click.option(
+    '--count',
+    type=click.INT,
+    help='Number of leaves (defaults to fanout^depth)')
+@click.option(
+    '--val-size',
+    default='8',
+    show_default=True,
+    callback=_parse_val_size,
+    help='Leaf value size, or uniformly-distributed <min>-<max> range')
+@click.option(
+    '--state-dir',
+    required=True,
+    help='Directory for the checkpoint and manifest')
+@click.option(
+    '--processes', type=click.INT, help='Defaults to the number of CPUs')
+@click.option(
+    '--chunk-size', type=click.INT, default=10000, show_default=True)
+@click.option(
+    '--batch-size',
+    type=click.INT,
+    default=100,
+    show_default=True,
+    help='Creates per transaction')
+@click.option(
+    '--pipeline',
+    type=click.INT,
+    default=8,
+    show_default=True,
+    help='Transactions in flight per process')
+def main(hosts, root, depth, fanout, count, val_size, state_dir, processes,
+         chunk_size, batch_size, pipeline):
+    """Preloads a large tree of znodes, and writes a manifest which ops
+    can sample keys from (see ZK_LOCUST_KEY_MANIFEST)."""
+    logging.basicConfig(
+        level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    try:
+        manifest = Manifest(
+            root=root,
+            depth=depth,
+            fanout=fanout,
+            count=count,
+            val_size=val_size)
+        preloader = Preloader(
+            manifest,
+            hosts=hosts,
+            state_dir=state_dir,
+            processes=processes,
+            chunk_size=chunk_size,
+            batch_size=batch_size,
+            pipeline=pipeline)
+        click.echo(preloader.run())
+    except (ValueError, PreloadError) as e:
+        raise click.ClickException(str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
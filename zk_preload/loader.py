@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import random
+import logging
+import multiprocessing
+
+from collections import deque
+
+import kazoo.client
+import kazoo.exceptions
+
+from . import Manifest
+
+_logger = logging.getLogger(__name__)
+
+# Keeps transactions well below ZooKeeper's default `jute.maxbuffer`
+# (1 MiB).
+_max_batch_bytes = 512 * 1024
+
+_checkpoint_name = 'checkpoint.jsonl'
+_manifest_name = 'manifest.json'
+
+_collateral_errors = (kazoo.exceptions.RolledBackError,
+                      kazoo.exceptions.RuntimeInconsistency)
+
+# Maps random bytes onto printable ASCII, as zkpython does not support
+# binary values.  Duplicated from `zk_locust.payloads`, which would pull
+# in Locust.
+_printable = bytes(32 + i % 95 for i in range(256))
+
+# Per-process client, see `_init_worker`.
+_worker = None
+
+
+class PreloadError(Exception):
+    pass
+
+
+class _Worker(object):
+    def __init__(self, hosts, manifest, batch_size, pipeline, timeout_s):
+        self.manifest = manifest
+        self.batch_size = batch_size
+        self.pipeline = pipeline
+        self.zk = kazoo.client.KazooClient(hosts=hosts, timeout=timeout_s)
+        self.zk.start(timeout=timeout_s)
+        self.random = random.Random()
+
+    def _value(self, level):
+        if level < self.manifest.depth:
+            return b''
+        lo, hi = self.manifest.val_size
+        n = self.random.randint(lo, hi)
+        return os.urandom(n).translate(_printable)
+
+    def _create_each(self, paths, values):
+        # Fallback for batches which were (partially) created by an
+        # earlier, interrupted, run.
+        for path, value in zip(paths, values):
+            try:
+                self.zk.create(path, value)
+            except kazoo.exceptions.NodeExistsError:
+                pass
+
+    def _commit(self, paths, values):
+        t = self.zk.transaction()
+        for path, value in zip(paths, values):
+            t.create(path, value)
+        return t.commit_async()
+
+    def _settle(self, batch):
+        paths, values, async_result = batch
+        results = async_result.get()
+        if any(isinstance(r, Exception) for r in results):
+            # The other ops of a failed transaction are reported as
+            # rolled back or "inconsistent."
+            errors = [
+                r for r in results if isinstance(r, Exception)
+                and not isinstance(r, _collateral_errors)
+            ]
+            if not all(
+                    isinstance(e, kazoo.exceptions.NodeExistsError)
+                    for e in errors):
+                raise errors[0]
+            self._create_each(paths, values)
+
+    def create_range(self, level, start, end):
+        """Creates nodes `[start, end)` of `level`, keeping up to
+        `pipeline` transactions of `batch_size` creates in flight."""
+        in_flight = deque()
+        for batch_start in range(start, end, self.batch_size):
+            batch_end = min(batch_start + self.batch_size, end)
+            paths = [
+                self.manifest.node_path(level, i)
+                for i in range(batch_start, batch_end)
+            ]
+            values = [self._value(level) for _ in paths]
+            if len(in_flight) >= self.pipeline:
+                self._settle(in_flight.popleft())
+            in_flight.append((paths, values, self._commit(paths, values)))
+        while in_flight:
+            self._settle(in_flight.popleft())
+
+
+def _init_worker(hosts, manifest_json, batch_size, pipeline, timeout_s):
+    global _worker
+    _worker = _Worker(hosts, Manifest.from_json(manifest_json), batch_size,
+                      pipeline, timeout_s)
+
+
+def _run_chunk(chunk):
+    level, start, end = chunk
+    try:
+        _worker.create_range(level, start, end)
+        return chunk, None
+    except Exception as e:
+        return chunk, repr(e)
+
+
+class Preloader(object):
+    """Populates the tree described by `manifest`, level by level, using
+    a pool of `processes` clients, each of which pipelines
+    `transaction()` batches.
+
+    Completed chunks are appended to a checkpoint file in `state_dir`,
+    so that an interrupted or failed run can be resumed by running
+    again with the same parameters.  Once done, the manifest is
+    written to `state_dir` as `manifest.json`."""
+
+    def __init__(self,
+                 manifest,
+                 *,
+                 hosts,
+                 state_dir,
+                 processes=None,
+                 chunk_size=10000,
+                 batch_size=100,
+                 pipeline=8,
+                 timeout_s=30):
+        self.manifest = manifest
+        self.hosts = hosts
+        self.state_dir = state_dir
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        max_val_size = max(manifest.val_size[1], 1)
+        self.batch_size = max(
+            min(batch_size, _max_batch_bytes // (max_val_size + 256)), 1)
+        self.pipeline = pipeline
+        self.timeout_s = timeout_s
+
+        self.checkpoint_path = os.path.join(state_dir, _checkpoint_name)
+        self.manifest_path = os.path.join(state_dir, _manifest_name)
+
+    def _load_checkpoint(self):
+        done = set()
+        if not os.path.exists(self.checkpoint_path):
+            return done
+        with open(self.checkpoint_path) as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        if lines and lines[0].get('params') != self.manifest.params():
+            raise PreloadError(
+                'Checkpoint %s was written for different parameters: %r' %
+                (self.checkpoint_path, lines[0].get('params')))
+        for entry in lines[1:]:
+            done.add((entry['level'], entry['start'], entry['end']))
+        return done
+
+    def _chunks(self):
+        for level in range(1, self.manifest.depth + 1):
+            n = self.manifest.level_count(level)
+            yield level, [(level, start, min(start + self.chunk_size, n))
+                          for start in range(0, n, self.chunk_size)]
+
+    def _create_root(self):
+        zk = kazoo.client.KazooClient(hosts=self.hosts, timeout=self.timeout_s)
+        zk.start(timeout=self.timeout_s)
+        try:
+            zk.ensure_path(self.manifest.root)
+        finally:
+            zk.stop()
+            zk.close()
+
+    def run(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        done = self._load_checkpoint()
+        if done:
+            _logger.info('Resuming; %d chunks already done', len(done))
+
+        self._create_root()
+
+        with open(self.checkpoint_path, 'a') as checkpoint, \
+                multiprocessing.Pool(
+                    self.processes,
+                    initializer=_init_worker,
+                    initargs=(self.hosts, self.manifest.to_json(),
+                              self.batch_size, self.pipeline,
+                              self.timeout_s)) as pool:
+            if checkpoint.tell() == 0:
+                checkpoint.write(
+                    json.dumps({'params': self.manifest.params()}) + '\n')
+                checkpoint.flush()
+
+            # Levels are done in order, as nodes need their parents.
+            for level, chunks in self._chunks():
+                todo = [c for c in chunks if c not in done]
+                n = sum(end - start for _, start, end in todo)
+                _logger.info('Level %d: creating %d nodes in %d chunks',
+                             level, n, len(todo))
+                started_at = time.monotonic()
+                created = 0
+                failures = []
+                for chunk, error in pool.imap_unordered(_run_chunk, todo):
+                    if error:
+                        failures.append((chunk, error))
+                        continue
+                    _, start, end = chunk
+                    created += end - start
+                    checkpoint.write(
+                        json.dumps({
+                            'level': level,
+                            'start': start,
+                            'end': end
+                        }) + '\n')
+                    checkpoint.flush()
+                elapsed = time.monotonic() - started_at
+                _logger.info('Level %d: created %d nodes in %.1fs (%.0f/s)',
+                             level, created, elapsed,
+                             created / elapsed if elapsed > 0 else 0)
+                if failures:
+                    chunk, error = failures[0]
+                    raise PreloadError(
+                        '%d chunks of level %d failed (e.g. %r: %s); run '
+                        'again to resume' % (len(failures), level, chunk,
+                                             error))
+
+        self.manifest.complete = True
+        self.manifest.save(self.manifest_path)
+        _logger.info('Preload complete; manifest written to %s',
+                     self.manifest_path)
+        return self.manifest_path
@@ -0,0 +1,149 @@
+import os
+import mmap
+import struct
+
+from collections import namedtuple
+
+TRACE_MAGIC = b'ZKTRACE\0'
+TRACE_VERSION = 1
+
+OP_CREATE, OP_DELETE, OP_SET, OP_GET, OP_EXISTS, OP_GET_CHILDREN = range(6)
+
+OP_NAMES = ['create', 'delete', 'set', 'get', 'exists', 'get_children']
+
+# Magic, version, flags (reserved).
+_header = struct.Struct('>8sII')
+# Time since the start of the trace (ns), session, op, size, path
+# length; followed by the UTF-8-encoded path.
+_record = struct.Struct('>QQBIH')
+
+_default_chunk_size = 64 * 1024 * 1024
+
+TraceRecord = namedtuple('TraceRecord', 'time_ns session op path size')
+
+
+class TraceFormatError(Exception):
+    pass
+
+
+def op_code(name):
+    try:
+        return OP_NAMES.index(name)
+    except ValueError:
+        raise ValueError('Unknown trace op %r; expected one of %s' %
+                         (name, ', '.join(OP_NAMES)))
+
+
+class TraceWriter(object):
+    """Writes a trace: a header followed by variable-length records,
+    in nondecreasing time order."""
+
+    def __init__(self, path):
+        self._f = open(path, 'wb')
+        self._f.write(_header.pack(TRACE_MAGIC, TRACE_VERSION, 0))
+        self._last_ns = 0
+        self.count = 0
+
+    def write(self, time_ns, session, op, path, size):
+        if time_ns < self._last_ns:
+            raise TraceFormatError(
+                'Record %d goes back in time (%d < %d ns)' %
+                (self.count, time_ns, self._last_ns))
+        encoded = path.encode('utf-8')
+        for what, value, bits in [('time', time_ns, 64),
+                                  ('session id', session, 64),
+                                  ('op', op, 8), ('size', size, 32),
+                                  ('path length', len(encoded), 16)]:
+            if not 0 <= value < 1 << bits:
+                raise ValueError('%s %d out of range [0, 2^%d)' %
+                                 (what, value, bits))
+        self._f.write(
+            _record.pack(time_ns, session, op, size, len(encoded)) + encoded)
+        self._last_ns = time_ns
+        self.count += 1
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc, value, traceback):
+        self.close()
+
+
+class TraceReader(object):
+    """Iterates over the records of a trace, mapping it into memory in
+    windows of about `chunk_size` bytes--so that only a bounded part
+    of a (possibly multi-GB) trace is mapped at any time."""
+
+    def __init__(self, path, *, chunk_size=_default_chunk_size):
+        self.path = path
+        self.size = os.path.getsize(path)
+        granularity = mmap.ALLOCATIONGRANULARITY
+        self.chunk_size = max(chunk_size // granularity, 1) * granularity
+
+        with open(path, 'rb') as f:
+            header = f.read(_header.size)
+        if len(header) < _header.size:
+            raise TraceFormatError('%s: truncated header' % path)
+        magic, version, flags = _header.unpack(header)
+        if magic != TRACE_MAGIC:
+            raise TraceFormatError('%s is not a trace' % path)
+        if version != TRACE_VERSION:
+            raise TraceFormatError('%s: unsupported trace version %d' %
+                                   (path, version))
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            window = _Window(f, self.size, self.chunk_size)
+            try:
+                offset = _header.size
+                while offset < self.size:
+                    buf, i = window.view(offset, _record.size)
+                    time_ns, session, op, size, path_len = \
+                        _record.unpack_from(buf, i)
+                    n = _record.size + path_len
+                    buf, i = window.view(offset, n)
+                    path = buf[i + _record.size:i + n].decode('utf-8')
+                    yield TraceRecord(time_ns, session, op, path, size)
+                    offset += n
+            finally:
+                window.close()
+
+
+class _Window(object):
+    """A read-only mapping of part of a file, moved forward as
+    needed."""
+
+    def __init__(self, f, size, chunk_size):
+        self._f = f
+        self._size = size
+        self._chunk_size = chunk_size
+        self._mm = None
+        self._start = self._end = 0
+
+    def view(self, offset, n):
+        """Returns a `(buffer, i)` tuple, where bytes `[offset, offset +
+        n)` of the file are at `buffer[i:i + n]`."""
+        if offset + n > self._end:
+            if offset + n > self._size:
+                raise TraceFormatError('Truncated record at offset %d' %
+                                       offset)
+            self.close()
+            self._start = offset - offset % mmap.ALLOCATIONGRANULARITY
+            self._end = min(
+                max(self._start + self._chunk_size, offset + n), self._size)
+            self._mm = mmap.mmap(
+                self._f.fileno(),
+                self._end - self._start,
+                access=mmap.ACCESS_READ,
+                offset=self._start)
+            if hasattr(self._mm, 'madvise'):
+                self._mm.madvise(mmap.MADV_SEQUENTIAL)
+        return self._mm, offset - self._start
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
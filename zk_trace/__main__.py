@@ -0,0 +1,132 @@
+import os
+import sys
+import csv
+import json
+import collections
+
+import click
+
+from . import OP_NAMES, TraceReader, TraceWriter, TraceFormatError, op_code
+
+# ZooKeeper request names, as found in server-side logs.
+_op_aliases = {
+    'getData': 'get',
+    'setData': 'set',
+    'getChildren': 'get_children',
+    'getChildren2': 'get_children'
+}
+
+_time_units_ns = {'s': 1000000000, 'ms': 1000000, 'us': 1000, 'ns': 1}
+
+_fields = ['timestamp', 'session', 'op', 'path', 'size']
+
+
+def _csv_rows(f):
+    for row in csv.reader(f):
+        if not row or row[0].startswith('#') or row[0] == 'timestamp':
+            continue
+        yield dict(zip(_fields, row))
+
+
+def _jsonl_rows(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+class _Sessions(object):
+    """Maps session ids onto integers: numeric ids (e.g.,
+    `0x100001a2b3c0000`) as-is, others to a dense numbering."""
+
+    def __init__(self):
+        self._ids = {}
+
+    def __call__(self, value):
+        if isinstance(value, int):
+            return value
+        try:
+            return int(value, 0)
+        except ValueError:
+            return self._ids.setdefault(value, len(self._ids))
+
+
+@click.group()
+def main():
+    """Converts and inspects traces replayed by `locust_replay.py`."""
+
+
+@main.command()
+@click.option(
+    '--format',
+    'fmt',
+    type=click.Choice(['csv', 'jsonl']),
+    default='csv',
+    show_default=True)
+@click.option(
+    '--time-unit',
+    type=click.Choice(sorted(_time_units_ns)),
+    default='s',
+    show_default=True,
+    help='Unit of the input timestamps')
+@click.argument('input', type=click.File('r'))
+@click.argument('output', type=click.Path(dir_okay=False))
+def convert(fmt, time_unit, input, output):
+    """Converts a text trace to the replay format.  Rows hold a
+    timestamp, session id, op, path and size (as CSV columns or JSON
+    keys), sorted by timestamp."""
+    rows = _csv_rows(input) if fmt == 'csv' else _jsonl_rows(input)
+    unit_ns = _time_units_ns[time_unit]
+    sessions = _Sessions()
+    start = None
+    writer = TraceWriter(output)
+    try:
+        with writer:
+            for row in rows:
+                ts = float(row['timestamp'])
+                if start is None:
+                    start = ts
+                op = row['op']
+                writer.write(
+                    int((ts - start) * unit_ns), sessions(row['session']),
+                    op_code(_op_aliases.get(op, op)), row['path'],
+                    int(row.get('size') or 0))
+    except BaseException as e:
+        # No partial traces.
+        os.remove(output)
+        if isinstance(e, TraceFormatError):
+            raise click.ClickException(
+                '%s; is the input sorted by timestamp?' % e)
+        if isinstance(e, (KeyError, ValueError)):
+            raise click.ClickException('Record %d: %s' %
+                                       (writer.count + 1, e))
+        raise
+    click.echo('%d records written to %s' % (writer.count, output))
+
+
+@main.command()
+@click.argument('trace', type=click.Path(exists=True, dir_okay=False))
+def info(trace):
+    """Summarizes a trace."""
+    try:
+        reader = TraceReader(trace)
+    except TraceFormatError as e:
+        raise click.ClickException(str(e))
+    count = 0
+    last_ns = 0
+    sessions = set()
+    ops = collections.Counter()
+    for record in reader:
+        count += 1
+        last_ns = record.time_ns
+        sessions.add(record.session)
+        ops[record.op] += 1
+    click.echo('records: %d' % count)
+    click.echo('duration: %.3fs' % (last_ns / 1e9))
+    click.echo('sessions: %d' % len(sessions))
+    for op, n in sorted(ops.items()):
+        name = OP_NAMES[op] if op < len(OP_NAMES) else str(op)
+        click.echo('%s: %d' % (name, n))
+
+
+if __name__ == '__main__':
+    sys.exit(main())